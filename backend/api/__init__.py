@@ -1,3 +1,3 @@
-from . import health, ocr, documents
+from . import health, ocr, documents, ledger, blobs, geo, search, cases
 
-__all__ = ['health', 'ocr', 'documents']
\ No newline at end of file
+__all__ = ['health', 'ocr', 'documents', 'ledger', 'blobs', 'geo', 'search', 'cases']
\ No newline at end of file
@@ -0,0 +1,108 @@
+from fastapi import APIRouter, HTTPException, Request
+from typing import Optional, Tuple
+from urllib.parse import quote
+import re
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+from services.blob_store import blob_store
+
+router = APIRouter()
+
+CHUNK_SIZE = 256 * 1024
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+_BLOB_ID = re.compile(r"[0-9a-f]{64}")
+
+class BlobFileResponse(Response):
+    """
+    blobファイルのレスポンス（Range指定時は206で一部を返す）
+    サーバーがASGIのzerocopysend拡張に対応していればファイルをそのまま送り、そうでなければチャンクで読む
+    """
+
+    def __init__(self, path: str, start: int, length: int, status_code: int, headers: dict, media_type: Optional[str]):
+        super().__init__(status_code=status_code, headers=headers, media_type=media_type)
+        self.path = path
+        self.start = start
+        self.length = length
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope.get("method") == "HEAD" or self.length == 0:
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        with open(self.path, "rb") as file:
+            if "http.response.zerocopysend" in scope.get("extensions", {}):
+                await send({"type": "http.response.zerocopysend", "file": file, "offset": self.start, "count": self.length})
+                return
+            await run_in_threadpool(file.seek, self.start)
+            remaining = self.length
+            while remaining:
+                chunk = await run_in_threadpool(file.read, min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+
+def _parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Rangeヘッダーを (開始位置, 終了位置) に変換（1範囲のみ対応、対応しない形式はNone）"""
+    match = _RANGE.match(header.strip())
+    if not match or match.groups() == ("", ""):
+        return None
+    first, last = match.groups()
+    if first == "":
+        start, end = max(0, size - int(last)), size - 1  # suffix range: the last N bytes
+    else:
+        start, end = int(first), min(int(last), size - 1) if last else size - 1
+    if start > end or start >= size:
+        raise HTTPException(status_code=416, detail="Range not satisfiable", headers={"Content-Range": f"bytes */{size}"})
+    return start, end
+
+async def blob_response(request: Request, blob_id: str, filename: Optional[str] = None) -> BlobFileResponse:
+    """blobの内容を返すレスポンス（Rangeヘッダーに対応）"""
+    # blob metadata is read from sqlite, off the event loop
+    info = await run_in_threadpool(blob_store.info, blob_id) if _BLOB_ID.fullmatch(blob_id) else None
+    if info is None:
+        raise HTTPException(status_code=404, detail="Blob not found")
+
+    size = info["size"]
+    headers = {
+        "Accept-Ranges": "bytes",
+        "ETag": f'"{blob_id}"',
+        # Content never changes for a given ID
+        "Cache-Control": "private, max-age=31536000, immutable",
+    }
+    if filename:
+        headers["Content-Disposition"] = f"inline; filename*=UTF-8''{quote(filename)}"
+
+    byte_range = None
+    range_header = request.headers.get("range")
+    if range_header and request.headers.get("if-range", f'"{blob_id}"') == f'"{blob_id}"':
+        byte_range = _parse_range(range_header, size)
+
+    if byte_range is None:
+        headers["Content-Length"] = str(size)
+        return BlobFileResponse(blob_store.path(blob_id), 0, size, 200, headers, info["mime_type"])
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return BlobFileResponse(blob_store.path(blob_id), start, end - start + 1, 206, headers, info["mime_type"])
+
+@router.api_route("/{blob_id}", methods=["GET", "HEAD"])
+async def get_blob(blob_id: str, request: Request):
+    """アップロード原本の取得（Range指定で一部のみ取得可能）"""
+    return await blob_response(request, blob_id)
+
+@router.get("/{blob_id}/info")
+async def get_blob_info(blob_id: str):
+    """blobのサイズ・MIMEタイプ・参照数"""
+    info = await run_in_threadpool(blob_store.info, blob_id) if _BLOB_ID.fullmatch(blob_id) else None
+    if info is None:
+        raise HTTPException(status_code=404, detail="Blob not found")
+    return info
+
+@router.post("/gc")
+async def collect_blobs():
+    """参照のなくなったアップロード原本を削除"""
+    return await run_in_threadpool(blob_store.gc)
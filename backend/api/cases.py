@@ -0,0 +1,89 @@
+from fastapi import APIRouter, HTTPException, Query
+from typing import List, Optional
+from datetime import datetime
+from urllib.parse import quote
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from loguru import logger
+
+from models.case import Case, CaseCreateRequest
+from models.document import DocumentCategory, ProcessedDocument
+from api.documents import (
+    _build_csv_rows,
+    _render_csv,
+    case_archive_response,
+    documents_storage,
+    remove_case_documents
+)
+
+router = APIRouter()
+
+def _require_case(case_id: str) -> Case:
+    case = documents_storage.get_case(case_id)
+    if case is None:
+        raise HTTPException(status_code=404, detail="Case not found")
+    return case
+
+@router.post("")
+async def create_case(request: CaseCreateRequest) -> dict:
+    """案件を作成（ID省略時は作成日時から採番）"""
+    case_id = request.id or f"case_{datetime.now().strftime('%Y%m%d%H%M%S%f')}"
+    try:
+        case = documents_storage.create_case(Case(id=case_id, name=request.name, date_of_death=request.date_of_death))
+    except ValueError:
+        raise HTTPException(status_code=409, detail="Case already exists")
+    logger.info(f"案件を作成: {case.id} ({case.name})")
+    return documents_storage.case_summary(case.id)
+
+@router.get("")
+async def list_cases() -> List[dict]:
+    """案件の一覧（書類の件数・区分別件数・重複件数付き）"""
+    return documents_storage.cases()
+
+@router.get("/{case_id}")
+async def get_case(case_id: str) -> dict:
+    """案件の情報と書類の件数"""
+    _require_case(case_id)
+    return documents_storage.case_summary(case_id)
+
+@router.get("/{case_id}/documents")
+async def list_case_documents(
+    case_id: str,
+    category: Optional[DocumentCategory] = Query(None, description="書類カテゴリでフィルタ")
+) -> List[ProcessedDocument]:
+    """案件の書類の一覧"""
+    _require_case(case_id)
+    docs = documents_storage.case_documents(case_id)
+    if category:
+        docs = [doc for doc in docs if doc.category == category]
+    return docs
+
+@router.get("/{case_id}/export/csv")
+async def export_case_csv(case_id: str):
+    """案件の書類をCSV形式でエクスポート（重複書類を除く）"""
+    _require_case(case_id)
+    docs = [doc for doc in documents_storage.case_documents(case_id) if not doc.duplicate_of]
+    csv_data = _build_csv_rows(docs)
+    if not csv_data:
+        raise HTTPException(status_code=404, detail="No data to export")
+
+    filename = f"{case_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+    return StreamingResponse(
+        _render_csv(csv_data),
+        media_type="text/csv",
+        headers={"Content-Disposition": f"attachment; filename*=UTF-8''{quote(filename)}"}
+    )
+
+@router.get("/{case_id}/export/zip")
+async def export_case_zip(case_id: str):
+    """案件の書類の原本をリネーム後の名前でZIPにまとめてダウンロード"""
+    _require_case(case_id)
+    return case_archive_response(case_id, documents_storage.case_documents(case_id))
+
+@router.delete("/{case_id}")
+async def delete_case(case_id: str):
+    """案件とその書類・取引元帳・検索索引・ページの索引を削除"""
+    _require_case(case_id)
+    removed = await run_in_threadpool(remove_case_documents, case_id)
+    logger.info(f"案件を削除: {case_id} (書類{removed}件)")
+    return {"success": True, "message": "Case deleted", "deleted_documents": removed}
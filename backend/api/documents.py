@@ -1,35 +1,69 @@
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, HTTPException, Query, Request
 from typing import List, Optional
 import csv
 import io
 import pandas as pd
 from datetime import datetime
+from urllib.parse import quote
 from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from loguru import logger
 
 from models.document import (
     DocumentCategory,
+    LandBuildingData,
     ProcessedDocument,
     CSVExportRequest
 )
+from models.passbook import compact_transactions, transaction_rows
+from services.ledger import ledger_store
+from services.blob_store import blob_store
+from services.export_archive import iter_case_archive
+from services.real_estate import ParcelRecord, merge_real_estate
+from services.search_index import search_index
+from services.document_store import DocumentStore
+from services.page_cache import page_result_store
+from services.page_dedup import remove_case_document_pages, remove_case_page_index
+from api.blobs import blob_response
 
 router = APIRouter()
 
 # In-memory storage for now (should be replaced with database)
-documents_storage = {}
+documents_storage = DocumentStore()
+
+def save_document(document: ProcessedDocument) -> None:
+    """書類を保存し、通帳は取引を列形式にして口座ごとの取引元帳に取り込み、全文検索の索引を更新する（原本があれば参照を記録）"""
+    if document.category == DocumentCategory.PASSBOOK:
+        compact_transactions(document.extracted_data)
+    documents_storage.put(document)
+    ledger_store.add_document(document)
+    search_index.add_document(document)
+    if document.blob_id:
+        blob_store.link(document.id, document.blob_id)
+
+def find_document(document_id: str) -> Optional[ProcessedDocument]:
+    """保存済みの書類（なければNone）"""
+    return documents_storage.get(document_id)
 
 @router.get("/list")
 async def list_documents(
-    category: Optional[DocumentCategory] = Query(None, description="書類カテゴリでフィルタ")
+    category: Optional[DocumentCategory] = Query(None, description="書類カテゴリでフィルタ"),
+    case_id: Optional[str] = Query(None, description="案件IDでフィルタ")
 ) -> List[ProcessedDocument]:
     """処理済み書類の一覧を取得"""
-    docs = list(documents_storage.values())
+    docs = documents_storage.case_documents(case_id) if case_id else documents_storage.values()
     
     if category:
         docs = [doc for doc in docs if doc.category == category]
     
     return docs
 
+@router.get("/real-estate/parcels")
+async def list_parcels(case_id: Optional[str] = Query(None, description="案件ID")) -> List[dict]:
+    """土地・建物の書類を所在ごとにまとめた一覧（登記簿と名寄帳等の突き合わせ結果、項目ごとの出典付き）"""
+    docs = documents_storage.case_documents(case_id) if case_id else documents_storage.values()
+    return [parcel.to_dict() for parcel in merge_real_estate(docs)]
+
 @router.get("/{document_id}")
 async def get_document(document_id: str) -> ProcessedDocument:
     """特定の書類を取得"""
@@ -38,6 +72,14 @@ async def get_document(document_id: str) -> ProcessedDocument:
     
     return documents_storage[document_id]
 
+@router.api_route("/{document_id}/original", methods=["GET", "HEAD"])
+async def get_original(document_id: str, request: Request):
+    """書類のアップロード原本を取得（Range指定で一部のみ取得可能）"""
+    doc = documents_storage.get(document_id)
+    if doc is None or not doc.blob_id:
+        raise HTTPException(status_code=404, detail="Original not found")
+    return await blob_response(request, doc.blob_id, filename=doc.original_filename)
+
 @router.put("/{document_id}")
 async def update_document(
     document_id: str,
@@ -57,6 +99,12 @@ async def update_document(
         if key in doc.extracted_data:
             doc.extracted_data[key] = value
     
+    # Re-index edited passbook transactions
+    if doc.category == DocumentCategory.PASSBOOK:
+        compact_transactions(doc.extracted_data)
+    ledger_store.add_document(doc)
+    search_index.add_document(doc)
+    
     return doc
 
 @router.delete("/{document_id}")
@@ -65,7 +113,14 @@ async def delete_document(document_id: str):
     if document_id not in documents_storage:
         raise HTTPException(status_code=404, detail="Document not found")
     
-    del documents_storage[document_id]
+    doc = documents_storage.pop(document_id)
+    ledger_store.remove_document(document_id)
+    search_index.remove_document(document_id)
+    if doc.blob_id:
+        await run_in_threadpool(blob_store.unlink, document_id)
+    if doc.case_id:
+        # A re-upload of the same file must be processed again, not marked as a duplicate
+        remove_case_document_pages(doc.case_id, document_id)
     return {"success": True, "message": "Document deleted"}
 
 @router.post("/export/csv")
@@ -80,95 +135,21 @@ async def export_csv(request: CSVExportRequest):
         for doc_id in request.document_ids:
             if doc_id in documents_storage:
                 doc = documents_storage[doc_id]
+                if doc.duplicate_of:
+                    continue  # 重複書類は重複元の行と二重計上になるため出力しない
                 if not request.include_categories or doc.category in request.include_categories:
                     docs.append(doc)
         
         if not docs:
             raise HTTPException(status_code=404, detail="No documents found")
         
-        # Create CSV data based on document type
-        csv_data = []
-        
-        for doc in docs:
-            if doc.category == DocumentCategory.PASSBOOK:
-                # 通帳データの出力
-                for transaction in doc.extracted_data:
-                    csv_data.append({
-                        "区分": "通帳",
-                        "取引日": transaction.get("取引日", ""),
-                        "出金額": transaction.get("出金額", 0),
-                        "入金額": transaction.get("入金額", 0),
-                        "残高": transaction.get("残高", 0),
-                        "取引内容": transaction.get("取引内容", ""),
-                        "元ファイル": doc.original_filename
-                    })
-            
-            elif doc.category == DocumentCategory.DEPOSIT:
-                # 預金データの出力
-                csv_data.append({
-                    "区分": "預貯金",
-                    "金融機関": doc.extracted_data.get("financial_institution", ""),
-                    "支店": doc.extracted_data.get("branch", ""),
-                    "種類": doc.extracted_data.get("account_type", ""),
-                    "口座番号": doc.extracted_data.get("account_number", ""),
-                    "残高": doc.extracted_data.get("balance", 0),
-                    "既経過利子": doc.extracted_data.get("accrued_interest", 0),
-                    "元ファイル": doc.original_filename
-                })
-            
-            elif doc.category == DocumentCategory.LISTED_STOCK:
-                # 株式データの出力
-                csv_data.append({
-                    "区分": "上場株式",
-                    "銘柄名": doc.extracted_data.get("stock_name", ""),
-                    "証券会社": doc.extracted_data.get("securities_company", ""),
-                    "支店名": doc.extracted_data.get("branch_name", ""),
-                    "評価額": doc.extracted_data.get("valuation", 0),
-                    "株式数": doc.extracted_data.get("quantity", 0),
-                    "元ファイル": doc.original_filename
-                })
-            
-            elif doc.category == DocumentCategory.LAND_BUILDING:
-                # 土地・建物データの出力
-                csv_data.append({
-                    "区分": "土地・建物",
-                    "都道府県": doc.extracted_data.get("prefecture", ""),
-                    "市区町村": doc.extracted_data.get("city", ""),
-                    "大字・丁目": doc.extracted_data.get("address", ""),
-                    "地番": doc.extracted_data.get("lot_number", ""),
-                    "家屋番号": doc.extracted_data.get("house_number", ""),
-                    "登記地目": doc.extracted_data.get("registered_land_category", ""),
-                    "課税地目": doc.extracted_data.get("taxed_land_category", ""),
-                    "持分": doc.extracted_data.get("ownership_ratio", ""),
-                    "地積": doc.extracted_data.get("area", 0),
-                    "敷地権割合": doc.extracted_data.get("site_right_ratio", ""),
-                    "固定資産税評価額": doc.extracted_data.get("fixed_asset_tax_value", 0),
-                    "元ファイル": doc.original_filename
-                })
-            
-            else:
-                # その他の書類
-                csv_data.append({
-                    "区分": doc.category.value,
-                    "データ": str(doc.extracted_data),
-                    "元ファイル": doc.original_filename
-                })
+        csv_data = _build_csv_rows(docs)
         
         # Create CSV
         if not csv_data:
             raise HTTPException(status_code=404, detail="No data to export")
         
-        # Convert to DataFrame for easier CSV creation
-        df = pd.DataFrame(csv_data)
-        
-        # Create CSV in memory
-        stream = io.StringIO()
-        df.to_csv(stream, index=False, encoding='utf-8-sig')  # UTF-8 with BOM for Excel
-        
-        # Return as streaming response
-        output = io.BytesIO()
-        output.write(stream.getvalue().encode('utf-8-sig'))
-        output.seek(0)
+        output = _render_csv(csv_data)
         
         return StreamingResponse(
             output,
@@ -182,8 +163,139 @@ async def export_csv(request: CSVExportRequest):
         logger.error(f"CSVエクスポートエラー: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/export/zip")
+async def export_zip(case_id: str = Query(..., description="案件ID")):
+    """
+    案件の書類の原本をリネーム後の名前でZIPにまとめてダウンロード
+    ZIPは送信しながら生成するため、大きな案件でもメモリ使用量は一定
+    """
+    return case_archive_response(case_id, documents_storage.case_documents(case_id))
+
+def case_archive_response(case_id: str, docs: List[ProcessedDocument]) -> StreamingResponse:
+    """案件の書類の原本をまとめたZIPのレスポンス"""
+    docs = [doc for doc in docs if not doc.duplicate_of]  # 重複書類は重複元と同じ原本のため含めない
+    if not docs:
+        raise HTTPException(status_code=404, detail="No documents found")
+    
+    filename = f"{case_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
+    return StreamingResponse(
+        iter_case_archive(docs),
+        media_type="application/zip",
+        headers={"Content-Disposition": f"attachment; filename*=UTF-8''{quote(filename)}"}
+    )
+
+def remove_case_documents(case_id: str) -> int:
+    """案件とその書類を削除し、元帳・全文検索の索引・原本の参照・ページの索引から案件の分を除く（削除した書類数を返す）"""
+    docs = documents_storage.remove_case(case_id)
+    ledger_store.remove_case(case_id)
+    for doc in docs:
+        search_index.remove_document(doc.id)
+        if doc.blob_id:
+            blob_store.unlink(doc.id)
+    remove_case_page_index(case_id)
+    page_result_store.remove_case(case_id)
+    return len(docs)
+
+def _build_csv_rows(docs: List[ProcessedDocument]) -> List[dict]:
+    """書類データをCSV出力用の行リストに変換"""
+    csv_data = []
+    parcels = None
+    
+    for doc in docs:
+        if doc.category == DocumentCategory.PASSBOOK:
+            # 通帳データの出力
+            for transaction in transaction_rows(doc.extracted_data.get("transactions")):
+                csv_data.append({
+                    "区分": "通帳",
+                    "取引日": transaction.get("取引日", ""),
+                    "出金額": transaction.get("出金額", 0),
+                    "入金額": transaction.get("入金額", 0),
+                    "残高": transaction.get("残高", 0),
+                    "取引内容": transaction.get("取引内容", ""),
+                    "元ファイル": doc.original_filename
+                })
+        
+        elif doc.category == DocumentCategory.DEPOSIT:
+            # 預金データの出力
+            csv_data.append({
+                "区分": "預貯金",
+                "金融機関": doc.extracted_data.get("financial_institution", ""),
+                "支店": doc.extracted_data.get("branch", ""),
+                "種類": doc.extracted_data.get("account_type", ""),
+                "口座番号": doc.extracted_data.get("account_number", ""),
+                "残高": doc.extracted_data.get("balance", 0),
+                "既経過利子": doc.extracted_data.get("accrued_interest", 0),
+                "元ファイル": doc.original_filename
+            })
+        
+        elif doc.category == DocumentCategory.LISTED_STOCK:
+            # 株式データの出力
+            csv_data.append({
+                "区分": "上場株式",
+                "銘柄名": doc.extracted_data.get("stock_name", ""),
+                "証券会社": doc.extracted_data.get("securities_company", ""),
+                "支店名": doc.extracted_data.get("branch_name", ""),
+                "評価額": doc.extracted_data.get("valuation", 0),
+                "株式数": doc.extracted_data.get("quantity", 0),
+                "元ファイル": doc.original_filename
+            })
+        
+        elif doc.category == DocumentCategory.LAND_BUILDING:
+            # 土地・建物データの出力（登記簿と名寄帳等を所在ごとに1行にまとめ、最初の土地・建物書類の位置に出す）
+            if parcels is None:
+                parcels = merge_real_estate(docs)
+                csv_data.extend(_parcel_row(parcel) for parcel in parcels)
+        
+        else:
+            # その他の書類
+            csv_data.append({
+                "区分": doc.category.value,
+                "データ": str(doc.extracted_data),
+                "元ファイル": doc.original_filename
+            })
+    
+    return csv_data
+
+def _parcel_row(parcel: ParcelRecord) -> dict:
+    """所在ごとにまとめた土地・建物のCSV行（出典の書類と、書類間で値の異なる項目を含む）"""
+    data = parcel.data
+    return {
+        "区分": "土地・建物",
+        "都道府県": data.get("prefecture", ""),
+        "市区町村": data.get("city", ""),
+        "大字・丁目": data.get("address", ""),
+        "地番": data.get("lot_number", ""),
+        "家屋番号": data.get("house_number", ""),
+        "登記地目": data.get("registered_land_category", ""),
+        "課税地目": data.get("taxed_land_category", ""),
+        "持分": data.get("ownership_ratio", ""),
+        "地積": data.get("area", 0),
+        "敷地権割合": data.get("site_right_ratio", ""),
+        "固定資産税評価額": data.get("fixed_asset_tax_value", 0),
+        "所有者": "・".join(data.get("owner_names", [])),
+        "照合": "+".join(parcel.source_types),
+        "不一致項目": "・".join(LandBuildingData.__fields__[name].field_info.description for name in parcel.conflicts),
+        "元ファイル": " / ".join(doc.original_filename for doc, _ in parcel.documents)
+    }
+
+def _render_csv(csv_data: List[dict]) -> io.BytesIO:
+    """行リストをExcel向けCSV（BOM付きUTF-8）に変換"""
+    # Convert to DataFrame for easier CSV creation
+    df = pd.DataFrame(csv_data)
+    
+    # Create CSV in memory
+    stream = io.StringIO()
+    df.to_csv(stream, index=False, encoding='utf-8-sig')  # UTF-8 with BOM for Excel
+    
+    # Return as streaming response
+    output = io.BytesIO()
+    output.write(stream.getvalue().encode('utf-8-sig'))
+    output.seek(0)
+    return output
+
 @router.post("/store")
 async def store_document(document: ProcessedDocument):
     """処理済み書類を保存（一時的）"""
-    documents_storage[document.id] = document
+    # The blob references live in sqlite, so saving runs off the event loop
+    await run_in_threadpool(save_document, document)
     return {"success": True, "document_id": document.id}
\ No newline at end of file
@@ -0,0 +1,18 @@
+from fastapi import APIRouter, Query
+from typing import Optional
+
+from services.gazetteer import gazetteer
+
+router = APIRouter()
+
+@router.get("/prefectures")
+async def list_prefectures(
+    city: Optional[str] = Query(None, description="市区町村（郡名・政令市の区を含んでよい）"),
+    address: Optional[str] = Query(None, description="大字・丁目")
+):
+    """
+    所在の記載から推定した都道府県の候補と、選択用の都道府県一覧
+    候補が1つなら確定、複数（同名の市区町村）なら候補から、0件なら一覧から選ぶ
+    """
+    candidates = gazetteer.candidates(city, address) if city or address else []
+    return {"candidates": candidates, "prefectures": gazetteer.prefectures()}
@@ -1,6 +1,8 @@
 from fastapi import APIRouter
 from datetime import datetime
 
+from core.metrics import metrics
+
 router = APIRouter()
 
 @router.get("/health")
@@ -10,4 +12,9 @@ async def health_check():
         "timestamp": datetime.now().isoformat(),
         "service": "相続税申告書類処理システム",
         "version": "1.0.0"
-    }
\ No newline at end of file
+    }
+
+@router.get("/metrics")
+async def get_metrics():
+    """処理メトリクス（モデル昇格率・書類あたり費用など）"""
+    return metrics.snapshot()
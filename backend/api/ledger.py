@@ -0,0 +1,102 @@
+from fastapi import APIRouter, HTTPException, Query
+from typing import List, Optional
+from datetime import date
+
+from services.ledger import ledger_store, merge_by_date
+from services.passbook_analysis import analyze_ledgers
+from services.reconciliation import reconcile
+from api.documents import documents_storage
+
+router = APIRouter()
+
+KINDS = ("any", "withdrawal", "deposit")
+
+def _select_ledgers(case_id: Optional[str], account: Optional[str]):
+    ledgers = ledger_store.ledgers(case_id, account)
+    if account and not ledgers:
+        raise HTTPException(status_code=404, detail="Account not found")
+    return ledgers
+
+def _page(rows: list, limit: int) -> dict:
+    return {"total": len(rows), "count": min(len(rows), limit), "transactions": rows[:limit]}
+
+@router.get("/accounts")
+async def list_accounts(case_id: Optional[str] = Query(None, description="案件ID")):
+    """案件の口座一覧（取引件数・期間）"""
+    return [
+        {
+            "account": ledger.account,
+            "count": len(ledger),
+            "first_date": ledger.first_date,
+            "last_date": ledger.last_date
+        }
+        for ledger in ledger_store.ledgers(case_id)
+    ]
+
+@router.get("/transactions")
+async def transactions_between(
+    case_id: Optional[str] = Query(None, description="案件ID"),
+    account: Optional[str] = Query(None, description="口座（省略時は案件の全口座）"),
+    start: Optional[date] = Query(None, description="開始日"),
+    end: Optional[date] = Query(None, description="終了日"),
+    limit: int = Query(1000, ge=1, le=100000)
+):
+    """期間内の取引を日付順に取得"""
+    ledgers = _select_ledgers(case_id, account)
+    return _page(merge_by_date(ledgers, lambda ledger: ledger.between(start, end)), limit)
+
+@router.get("/large-transactions")
+async def large_transactions(
+    min_amount: int = Query(..., ge=0, description="金額の閾値"),
+    kind: str = Query("any", description="any / withdrawal（出金）/ deposit（入金）"),
+    case_id: Optional[str] = Query(None, description="案件ID"),
+    account: Optional[str] = Query(None, description="口座（省略時は案件の全口座）"),
+    start: Optional[date] = Query(None, description="開始日"),
+    end: Optional[date] = Query(None, description="終了日"),
+    limit: int = Query(1000, ge=1, le=100000)
+):
+    """閾値以上の出金・入金を日付順に取得"""
+    if kind not in KINDS:
+        raise HTTPException(status_code=400, detail=f"kind must be one of {', '.join(KINDS)}")
+    ledgers = _select_ledgers(case_id, account)
+    return _page(merge_by_date(ledgers, lambda ledger: ledger.at_least(min_amount, kind, start, end)), limit)
+
+@router.get("/counterparty")
+async def counterparty_transactions(
+    q: str = Query(..., min_length=1, description="相手先（取引内容の部分一致）"),
+    case_id: Optional[str] = Query(None, description="案件ID"),
+    account: Optional[str] = Query(None, description="口座（省略時は案件の全口座）"),
+    start: Optional[date] = Query(None, description="開始日"),
+    end: Optional[date] = Query(None, description="終了日"),
+    limit: int = Query(1000, ge=1, le=100000)
+):
+    """相手先で取引を検索"""
+    ledgers = _select_ledgers(case_id, account)
+    return _page(merge_by_date(ledgers, lambda ledger: ledger.counterparty(q, start, end)), limit)
+
+@router.get("/analysis")
+async def analyze_transactions(
+    case_id: Optional[str] = Query(None, description="案件ID"),
+    account: Optional[str] = Query(None, description="口座（省略時は案件の全口座）"),
+    date_of_death: Optional[date] = Query(None, description="相続開始日（指定時はその前の一定年数に限定）"),
+    watch: List[str] = Query([], description="注目する相手先（親族名など、複数指定可）"),
+    limit: int = Query(100, ge=1, le=10000)
+):
+    """高額出金・贈与の可能性がある取引パターンをスコア順に取得"""
+    ledgers = _select_ledgers(case_id, account)
+    return analyze_ledgers(ledgers, date_of_death, watch, limit)
+
+@router.get("/reconciliation")
+async def reconcile_balances(
+    case_id: Optional[str] = Query(None, description="案件ID"),
+    date_of_death: Optional[date] = Query(None, description="相続開始日（証明日のない残高証明書の基準日。省略時は案件の相続開始日）")
+):
+    """
+    残高証明書の残高と、同じ口座（金融機関・支店・口座番号）の通帳の基準日時点の残高の突き合わせ
+    状態: matched（一致）/ mismatched（不一致）/ no_passbook（通帳なし）/ ambiguous（候補が複数）/ no_balance（基準日以前の残高なし）/ no_date（基準日不明）/ no_certificate_balance（証明書の残高なし）
+    """
+    if date_of_death is None and case_id:
+        case = documents_storage.get_case(case_id)
+        date_of_death = case.date_of_death if case else None
+    documents = documents_storage.case_documents(case_id)
+    return reconcile(documents, ledger_store.ledgers(case_id), date_of_death)
@@ -1,33 +1,54 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File, Form
-from typing import List, Optional
+from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Header
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from typing import Annotated, List, Optional, Tuple
+import asyncio
 import base64
+import copy
+import hashlib
+import json
+from contextlib import AsyncExitStack
 from loguru import logger
 from datetime import datetime
 
+from core.config import settings
+from core.idempotency import batch_requests
+from core.uploads import check_upload_size, read_upload, upload_budget, upload_sha256, upload_size
 from services.gemini_ocr import GeminiOCRService
 from models.document import DocumentCategory, ProcessedDocument, DocumentProcessResponse
 from services.document_classifier import DocumentClassifier
+from services.pdf_text import extract_text_layer
+from services.render_pool import render_pool
+from services.blob_store import blob_store
+from services.thumbnails import detect_mime_type
+from services.page_dedup import PageHashIndex, case_page_index, page_keys, register_pages, split_duplicate_pages
+from api.documents import find_document, save_document
 
 router = APIRouter()
 ocr_service = GeminiOCRService()
 classifier = DocumentClassifier()
+ocr_semaphore = asyncio.Semaphore(settings.MAX_CONCURRENT_OCR)
 
 @router.post("/process-passbook")
 async def process_passbook(
     file: UploadFile = File(...),
-    include_handwriting: bool = Form(False)
+    include_handwriting: bool = Form(False),
+    tile: bool = Form(False)
 ):
-    """通帳のOCR処理"""
+    """通帳のOCR処理（tile=Trueで縦長の画像を帯に分割して並列処理）"""
+    size = check_upload_size(file)
     try:
-        # Read and encode file
-        contents = await file.read()
-        base64_encoded = base64.b64encode(contents).decode('utf-8')
-        
-        # Process with Gemini OCR
-        transactions = await ocr_service.process_passbook(
-            base64_encoded,
-            include_handwriting
-        )
+        async with upload_budget.reserve(size):
+            # Read and encode file
+            contents = await read_upload(file)
+            base64_encoded = base64.b64encode(contents).decode('utf-8')
+            
+            # Process with Gemini OCR
+            transactions = await ocr_service.process_passbook(
+                base64_encoded,
+                include_handwriting,
+                tile=tile
+            )
         
         return {
             "success": True,
@@ -40,34 +61,119 @@ async def process_passbook(
         logger.error(f"通帳処理エラー: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/process-passbook/stream")
+async def process_passbook_stream(
+    file: UploadFile = File(...),
+    include_handwriting: bool = Form(False)
+):
+    """
+    通帳のOCR処理（取引を読み取った順にNDJSONで逐次返す）
+    各行は {"type": "transaction" | "reset" | "done" | "error", ...}。resetを受け取ったら、それまでの取引を破棄する
+    """
+    size = check_upload_size(file)
+    
+    async def events():
+        # The upload stays open until the response finishes, so it is read here under the budget
+        try:
+            async with upload_budget.reserve(size):
+                contents = await read_upload(file)
+                async for event in ocr_service.stream_passbook(contents, include_handwriting):
+                    yield json.dumps(event, ensure_ascii=False) + "\n"
+        except Exception as e:
+            logger.error(f"通帳処理エラー: {str(e)}")
+            yield json.dumps({"type": "error", "detail": str(e)}, ensure_ascii=False) + "\n"
+    
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+@router.post("/process-passbook-pages")
+async def process_passbook_pages(
+    files: List[UploadFile] = File(...),
+    include_handwriting: bool = Form(False),
+    case_id: Optional[str] = Form(None)
+):
+    """複数ページの通帳のOCR処理（PDF・ページ画像をページ順に受け付け、複数ページを1リクエストにまとめて処理）"""
+    size = check_upload_size(*files)
+    try:
+        async with upload_budget.reserve(size):
+            pages = []
+            keys = []
+            for file in files:
+                contents = await read_upload(file)
+                file_pages, file_keys = await asyncio.gather(
+                    render_pool.page_jpegs(contents, file.filename, dpi=settings.PASSBOOK_RENDER_DPI),
+                    asyncio.to_thread(page_keys, contents, file.filename)
+                )
+                pages.extend(file_pages)
+                # Pages without a key are always read
+                keys.extend(file_keys if len(file_keys) == len(file_pages) else [None] * len(file_pages))
+            
+            # Skip pages with the same content as pages already read in this upload (or earlier uploads of the same case)
+            index = case_page_index(case_id) if case_id else PageHashIndex()
+            ref = {"document": "/".join(file.filename for file in files), "uploaded_at": datetime.now().isoformat()}
+            unique_positions, duplicates = split_duplicate_pages(keys, index, ref)
+            if duplicates:
+                logger.info(f"重複ページをスキップ: {[item['page'] for item in duplicates]}")
+            
+            transactions = await ocr_service.process_passbook_pages(
+                [pages[position] for position in unique_positions],
+                include_handwriting
+            )
+            # Map page numbers back to the uploaded page order
+            for row in transactions:
+                row["ページ"] = unique_positions[row["ページ"] - 1] + 1
+            # Pages are registered only once they have been read, so a failed request can be retried
+            register_pages(index, keys, unique_positions, ref)
+            index.save()
+        
+        return {
+            "success": True,
+            "filenames": [file.filename for file in files],
+            "page_count": len(pages),
+            "transactions": transactions,
+            "count": len(transactions),
+            "duplicate_pages": duplicates
+        }
+        
+    except Exception as e:
+        logger.error(f"通帳処理エラー: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.post("/process-document")
 async def process_document(
     file: UploadFile = File(...),
     document_type: Optional[DocumentCategory] = Form(None),
-    auto_classify: bool = Form(True)
+    auto_classify: bool = Form(True),
+    case_id: Optional[str] = Form(None)
 ):
     """一般書類のOCR処理"""
+    size = check_upload_size(file)
     try:
-        # Read and encode file
-        contents = await file.read()
-        base64_encoded = base64.b64encode(contents).decode('utf-8')
-        
-        # Auto-classify if needed
-        if auto_classify and not document_type:
-            document_type = await classifier.classify_document(base64_encoded)
-            logger.info(f"書類分類結果: {file.filename} -> {document_type}")
-        
-        if not document_type:
-            document_type = DocumentCategory.UNKNOWN
-        
-        # Process based on document type
-        if document_type == DocumentCategory.PASSBOOK:
-            extracted_data = await ocr_service.process_passbook(base64_encoded)
-        else:
-            extracted_data = await ocr_service.process_general_document(
-                base64_encoded,
-                document_type
-            )
+        async with upload_budget.reserve(size):
+            # Read and encode file
+            contents = await read_upload(file)
+            base64_encoded = base64.b64encode(contents).decode('utf-8')
+            blob_id = await asyncio.to_thread(blob_store.put, contents, detect_mime_type(contents, file.filename))
+            
+            # Auto-classify if needed (born-digital PDFs can be classified from their text layer)
+            if auto_classify and not document_type:
+                text_layer = None
+                if file.filename.lower().endswith('.pdf'):
+                    text_layer = "\n".join(await asyncio.to_thread(extract_text_layer, contents))
+                document_type = await classifier.classify_document(contents, file.filename, text=text_layer)
+                logger.info(f"書類分類結果: {file.filename} -> {document_type}")
+            
+            if not document_type:
+                document_type = DocumentCategory.UNKNOWN
+            
+            # Process based on document type
+            if document_type == DocumentCategory.PASSBOOK:
+                transactions = await ocr_service.process_passbook(base64_encoded)
+                extracted_data = {"transactions": transactions}
+            else:
+                extracted_data = await ocr_service.process_general_document(
+                    base64_encoded,
+                    document_type
+                )
         
         # Create processed document record
         processed_doc = ProcessedDocument(
@@ -75,12 +181,15 @@ async def process_document(
             original_filename=file.filename,
             category=document_type,
             extracted_data=extracted_data,
-            ocr_confidence=0.95  # Geminiは通常高精度
+            ocr_confidence=0.95,  # Geminiは通常高精度
+            blob_id=blob_id,
+            case_id=case_id
         )
+        await asyncio.to_thread(save_document, processed_doc)
         
         return {
             "success": True,
-            "document": processed_doc.dict()
+            "document": jsonable_encoder(processed_doc)
         }
         
     except Exception as e:
@@ -90,9 +199,65 @@ async def process_document(
 @router.post("/process-batch")
 async def process_batch(
     files: List[UploadFile] = File(...),
-    auto_classify: bool = Form(True)
+    auto_classify: bool = Form(True),
+    case_id: Optional[str] = Form(None),
+    idempotency_key: Annotated[Optional[str], Header()] = None
 ):
-    """複数書類の一括処理"""
+    """
+    複数書類の一括処理
+    同じIdempotency-Key（なければ同じファイル・同じ指定）のリクエストは処理を1回にまとめ、完了後しばらくは結果を再送する
+    """
+    # Oversized files reject the whole batch before any of it is read
+    size = check_upload_size(*files)
+    for file in files:
+        logger.info(f"Received file: {file.filename}, type: {file.content_type}, size: {upload_size(file)} bytes")
+    
+    digests = [await upload_sha256(file) for file in files]
+    fingerprint = hashlib.sha256(json.dumps(
+        [[file.filename for file in files], digests, auto_classify, case_id], ensure_ascii=False
+    ).encode()).hexdigest()
+    key = f"key:{idempotency_key}" if idempotency_key else f"content:{fingerprint}"
+    
+    # The batch can outlive this request (others with the same key wait on it), and Starlette
+    # closes the UploadFiles when the request ends. So it is handed the file contents, together
+    # with their reservation of the upload budget, which it releases when it finishes.
+    budget = AsyncExitStack()
+    await budget.enter_async_context(upload_budget.reserve(size))
+    try:
+        uploads = [(file.filename, await read_upload(file)) for file in files]
+    except BaseException:
+        await budget.aclose()
+        raise
+    started = False
+    
+    def compute():
+        nonlocal started
+        started = True
+        return _process_batch_holding(budget, uploads, digests, auto_classify, case_id)
+    
+    try:
+        result, replayed = await batch_requests.run(
+            key, fingerprint, compute,
+            # Batches with failed files are not kept, so a retry processes them again
+            keep=lambda result: result["failed_count"] == 0,
+            # Results whose documents were deleted since (or the whole case) are not replayed
+            valid=lambda result: all(find_document(doc["id"]) is not None for doc in result["documents"])
+        )
+    finally:
+        if not started:
+            await budget.aclose()
+    if replayed:
+        logger.info(f"同じリクエストの処理結果を再送します ({key[:24]})")
+        return {**result, "replayed": True}
+    return result
+
+async def _process_batch_holding(budget: AsyncExitStack, uploads: List[Tuple[str, bytes]], digests: List[str], auto_classify: bool, case_id: Optional[str]) -> dict:
+    """一括処理（リクエストから引き継いだアップロード上限の予約を、処理が終わったら返す）"""
+    async with budget:
+        return await _process_batch(uploads, digests, auto_classify, case_id)
+
+async def _process_batch(uploads: List[Tuple[str, bytes]], digests: List[str], auto_classify: bool, case_id: Optional[str]) -> dict:
+    """一括処理の本体（uploadsは (ファイル名, 内容)、digestsは各ファイルのsha256）"""
     results = DocumentProcessResponse(
         success=True,
         processed_count=0,
@@ -101,63 +266,150 @@ async def process_batch(
         errors=[]
     )
     
-    for file in files:
-        try:
-            logger.info(f"Processing file: {file.filename}, type: {file.content_type}")
-            
-            # Read file content
-            contents = await file.read()
-            logger.info(f"File size: {len(contents)} bytes")
-            
-            # Check file type and process accordingly
-            filename_lower = file.filename.lower()
-            
-            if filename_lower.endswith('.pdf'):
-                # Process PDF with new method
-                logger.info(f"Processing as PDF: {file.filename}")
-                ocr_result = await ocr_service.extract_text_from_pdf(contents)
-                
-            elif filename_lower.endswith(('.jpg', '.jpeg', '.png', '.heic', '.heif')):
-                # Process image with new method
-                logger.info(f"Processing as image: {file.filename}")
-                ocr_result = await ocr_service.extract_text_from_image(contents)
-                
-            else:
-                logger.warning(f"Unsupported file type: {file.filename}")
-                raise ValueError(f"Unsupported file type: {file.filename}")
-            
-            # Check if extraction was successful
-            if not ocr_result.get("success", False):
-                raise Exception(f"OCR failed: {ocr_result.get('error', 'Unknown error')}")
-            
-            # Extract document type from result
-            extracted_text = ocr_result.get("extracted_text", "")
-            document_type = DocumentCategory.UNKNOWN
-            
-            # Auto-classify if needed
-            if auto_classify and extracted_text:
-                # Create base64 for classification (if needed)
-                base64_encoded = base64.b64encode(contents).decode('utf-8')
-                document_type = await classifier.classify_document(base64_encoded)
-                logger.info(f"Document classified as: {document_type}")
-            
-            # Create processed document record
-            processed_doc = ProcessedDocument(
-                id=f"{document_type}_{file.filename}_{datetime.now().timestamp()}",
-                original_filename=file.filename,
-                category=document_type,
-                extracted_data=ocr_result,
-                ocr_confidence=0.95
-            )
-            
-            results.documents.append(processed_doc)
+    # Find files with the same content (as a whole or page by page) before spending any model calls on them.
+    # Duplicates of a file in this upload point at its batch position; duplicates of
+    # a file from an earlier upload of the same case point at that document's ID.
+    case_index = case_page_index(case_id) if case_id else None
+    batch_index = PageHashIndex()
+    fingerprints = []
+    blob_ids = []
+    duplicate_of = {}
+    for position, (filename, contents) in enumerate(uploads):
+        sha256 = digests[position]
+        keys = await asyncio.to_thread(page_keys, contents, filename)
+        # Every original is kept (once per content); blobs of failed files are collected by gc
+        blob_ids.append(await asyncio.to_thread(blob_store.put, contents, detect_mime_type(contents, filename)))
+        fingerprints.append((sha256, keys))
+        original = _stored_original(case_index, sha256, keys) if case_index else None
+        if original is None:
+            match = batch_index.find_document(sha256, keys)
+            original = match["document"] if match is not None else None
+        if original is not None:
+            duplicate_of[position] = original
+        else:
+            batch_index.add_document(sha256, keys, {"document": position})
+    
+    # Files are processed concurrently so that their classifications can share batched requests
+    originals = [position for position in range(len(uploads)) if position not in duplicate_of]
+    outcomes = dict(zip(originals, await asyncio.gather(
+        *[_process_batch_file(*uploads[position], auto_classify, case_id) for position in originals],
+        return_exceptions=True
+    )))
+    
+    for position, (filename, _) in enumerate(uploads):
+        if position in duplicate_of:
+            outcome = _duplicate_document(filename, duplicate_of[position], outcomes, case_id)
+        else:
+            outcome = outcomes[position]
+            if case_index is not None and not isinstance(outcome, Exception):
+                case_index.add_document(*fingerprints[position], {
+                    "document": outcome.id,
+                    "filename": filename,
+                    "category": outcome.category.value
+                })
+        
+        if isinstance(outcome, Exception):
+            logger.error(f"ファイル処理エラー ({filename}): {str(outcome)}")
+            results.errors.append(f"{filename}: {str(outcome)}")
+            results.failed_count += 1
+        else:
+            outcome.blob_id = blob_ids[position]
+            await asyncio.to_thread(save_document, outcome)
+            results.documents.append(outcome)
             results.processed_count += 1
-            logger.info(f"Successfully processed: {file.filename}")
-            
+            if outcome.duplicate_of:
+                results.duplicate_count += 1
+    
+    if case_index is not None:
+        case_index.save()
+    
+    logger.info(
+        f"Batch processing complete: {results.processed_count} succeeded "
+        f"({results.duplicate_count} duplicates), {results.failed_count} failed"
+    )
+    return jsonable_encoder(results)
+
+def _stored_original(case_index: PageHashIndex, sha256: str, keys: List[str]) -> Optional[ProcessedDocument]:
+    """以前のアップロードの重複元の書類（削除済み・再起動で失われた書類の登録は索引から除き、Noneを返す）"""
+    while True:
+        match = case_index.find_document(sha256, keys)
+        if match is None:
+            return None
+        original = find_document(match["document"])
+        if original is not None:
+            return original
+        logger.info(f"重複元の書類が見つからないため索引から除きます: {match['document']}")
+        if not case_index.remove_document(match["document"]):
+            return None
+
+def _duplicate_document(filename: str, original, outcomes: dict, case_id: Optional[str]):
+    """重複ファイルの書類レコード（OCRせず重複元の結果を参照。originalはバッチ内の位置か保存済みの書類）"""
+    source = outcomes[original] if isinstance(original, int) else original
+    if isinstance(source, Exception):
+        return source
+    
+    logger.info(f"重複ファイルのため再処理を省略: {filename} -> {source.id}")
+    return ProcessedDocument(
+        id=f"{source.category}_{filename}_{datetime.now().timestamp()}",
+        original_filename=filename,
+        category=source.category,
+        extracted_data=copy.deepcopy(source.extracted_data),
+        case_id=case_id,
+        duplicate_of=source.id
+    )
+
+async def _process_batch_file(filename: str, contents: bytes, auto_classify: bool, case_id: Optional[str] = None) -> ProcessedDocument:
+    """一括処理の1ファイル分（分類→OCR。通帳は取引の抽出だけを行う）"""
+    logger.info(f"Processing file: {filename}")
+    
+    # Check file type and process accordingly
+    filename_lower = filename.lower()
+    is_pdf = filename_lower.endswith('.pdf')
+    if not is_pdf and not filename_lower.endswith(('.jpg', '.jpeg', '.png', '.heic', '.heif')):
+        logger.warning(f"Unsupported file type: {filename}")
+        raise ValueError(f"Unsupported file type: {filename}")
+    
+    # Classify before the OCR so a passbook is read once, row by row
+    # (born-digital PDFs from their text layer, otherwise from the first-page thumbnail)
+    document_type = DocumentCategory.UNKNOWN
+    if auto_classify:
+        text_layer = "\n".join(await asyncio.to_thread(extract_text_layer, contents)) if is_pdf else None
+        document_type = await classifier.classify_document(contents, filename, text=text_layer)
+        logger.info(f"Document classified as: {document_type}")
+    
+    ocr_result = None
+    # Passbooks need row-level transactions for the ledger, not just the page text
+    if document_type == DocumentCategory.PASSBOOK:
+        try:
+            pages = await render_pool.page_jpegs(contents, filename, settings.PASSBOOK_RENDER_DPI)
+            async with ocr_semaphore:
+                transactions = await ocr_service.process_passbook_pages(pages)
+            ocr_result = {"success": True, "transactions": transactions}
         except Exception as e:
-            logger.error(f"ファイル処理エラー ({file.filename}): {str(e)}")
-            results.errors.append(f"{file.filename}: {str(e)}")
-            results.failed_count += 1
+            logger.warning(f"通帳の取引抽出に失敗しました。ページのテキストを抽出します ({filename}): {str(e)}")
+    
+    if ocr_result is None:
+        async with ocr_semaphore:
+            if is_pdf:
+                logger.info(f"Processing as PDF: {filename}")
+                ocr_result = await ocr_service.extract_text_from_pdf(contents, case_id)
+            else:
+                logger.info(f"Processing as image: {filename}")
+                ocr_result = await ocr_service.extract_text_from_image(contents)
+        
+        # Check if extraction was successful
+        if not ocr_result.get("success", False):
+            raise Exception(f"OCR failed: {ocr_result.get('error', 'Unknown error')}")
+    
+    # Create processed document record
+    processed_doc = ProcessedDocument(
+        id=f"{document_type}_{filename}_{datetime.now().timestamp()}",
+        original_filename=filename,
+        category=document_type,
+        extracted_data=ocr_result,
+        ocr_confidence=0.95,
+        case_id=case_id
+    )
     
-    logger.info(f"Batch processing complete: {results.processed_count} succeeded, {results.failed_count} failed")
-    return results.dict()
\ No newline at end of file
+    logger.info(f"Successfully processed: {filename}")
+    return processed_doc
@@ -0,0 +1,28 @@
+from fastapi import APIRouter, Query
+from typing import Optional
+import time
+
+from services.search_index import search_index
+from api.documents import documents_storage
+
+router = APIRouter()
+
+@router.get("")
+async def search(
+    q: str = Query(..., min_length=1, description="検索語（空白区切りで複数指定するとすべてを含むもの）"),
+    case_id: Optional[str] = Query(None, description="案件ID"),
+    limit: int = Query(50, ge=1, le=500)
+):
+    """抽出テキスト・抽出項目・通帳の取引内容の全文検索（関連度順、一致部分の前後の文付き）"""
+    started = time.perf_counter()
+    hits = search_index.search(q, case_id, limit)
+    for hit in hits:
+        doc = documents_storage.get(hit["document_id"])
+        hit["filename"] = doc.original_filename if doc else None
+        hit["category"] = doc.category if doc else None
+    return {
+        "query": q,
+        "count": len(hits),
+        "hits": hits,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 2)
+    }
@@ -0,0 +1,179 @@
+"""
+通帳処理パイプラインのCPUステージ別ベンチマーク
+
+実行方法（backendディレクトリから）:
+    python -m pytest benchmarks/bench_pipeline.py --benchmark-autosave
+前回結果との比較:
+    python -m pytest benchmarks/bench_pipeline.py --benchmark-autosave --benchmark-compare --benchmark-compare-fail=mean:20%
+"""
+
+import asyncio
+
+from models.document import CSVExportRequest, DocumentCategory, ProcessedDocument
+from api import documents
+from services.document_store import DocumentStore
+
+
+class _StubResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class _StubModel:
+    """Geminiの代わりに固定のJSONを返すモデル"""
+
+    def __init__(self, text: str):
+        self._response = _StubResponse(text)
+
+    def generate_content(self, *args, **kwargs):
+        return self._response
+
+
+def test_parse_passbook_response(benchmark, ocr_service, passbook_json):
+    benchmark.group = "passbook-parse"
+    result = benchmark(ocr_service._parse_passbook_response, passbook_json)
+    assert result
+
+
+def test_filter_zero_transactions(benchmark, ocr_service, passbook_rows):
+    benchmark.group = "passbook-filter"
+    result = benchmark(ocr_service._filter_zero_transactions, passbook_rows)
+    assert len(result) < len(passbook_rows)
+
+
+def test_verify_balances(benchmark, ocr_service, passbook_rows):
+    benchmark.group = "passbook-verify"
+    assert benchmark(ocr_service._verify_balances, passbook_rows)
+
+
+def test_process_passbook_end_to_end(benchmark, ocr_service, passbook_json, monkeypatch):
+    benchmark.group = "passbook-end-to-end"
+    stub = _StubModel(passbook_json)
+    monkeypatch.setattr(ocr_service.router, "get_model", lambda model_name: stub)
+
+    def run():
+        return asyncio.run(ocr_service.process_passbook(""))
+
+    assert benchmark(run)
+
+
+def test_processed_document_construction(benchmark, passbook_rows):
+    benchmark.group = "document-construct"
+
+    def build():
+        return ProcessedDocument(
+            id="T_bench",
+            original_filename="通帳.pdf",
+            category=DocumentCategory.PASSBOOK,
+            extracted_data={"transactions": passbook_rows},
+            ocr_confidence=0.95
+        )
+
+    assert benchmark(build).id == "T_bench"
+
+
+def test_processed_document_dict(benchmark, passbook_rows):
+    benchmark.group = "document-dict"
+    doc = ProcessedDocument(
+        id="T_bench",
+        original_filename="通帳.pdf",
+        category=DocumentCategory.PASSBOOK,
+        extracted_data={"transactions": passbook_rows}
+    )
+    result = benchmark(doc.dict)
+    assert len(result["extracted_data"]["transactions"]) == len(passbook_rows)
+
+
+def test_case_response_dict(benchmark, case_documents):
+    benchmark.group = "case-dict"
+    result = benchmark(lambda: [doc.dict() for doc in case_documents])
+    assert len(result) == len(case_documents)
+
+
+def test_export_csv_rows(benchmark, case_documents):
+    benchmark.group = "export-rows"
+    rows = benchmark(documents._build_csv_rows, case_documents)
+    assert rows
+
+
+def test_export_csv(benchmark, case_documents, monkeypatch):
+    benchmark.group = "export-csv"
+    store = DocumentStore()
+    for doc in case_documents:
+        store.put(doc)
+    monkeypatch.setattr(documents, "documents_storage", store)
+    request = CSVExportRequest(document_ids=[doc.id for doc in case_documents])
+
+    async def export():
+        response = await documents.export_csv(request)
+        return b"".join([chunk async for chunk in response.body_iterator])
+
+    body = benchmark(lambda: asyncio.run(export()))
+    assert body.startswith(b"\xef\xbb\xbf")
+
+
+def test_export_csv_single_large_passbook(benchmark, passbook_rows, monkeypatch):
+    benchmark.group = "export-csv-ledger"
+    doc = ProcessedDocument(
+        id="T_bench",
+        original_filename="通帳.pdf",
+        category=DocumentCategory.PASSBOOK,
+        extracted_data={"transactions": passbook_rows}
+    )
+    store = DocumentStore()
+    store.put(doc)
+    monkeypatch.setattr(documents, "documents_storage", store)
+    request = CSVExportRequest(document_ids=[doc.id])
+
+    async def export():
+        response = await documents.export_csv(request)
+        return b"".join([chunk async for chunk in response.body_iterator])
+
+    body = benchmark(lambda: asyncio.run(export()))
+    assert passbook_rows[0]["取引内容"].encode() in body
+
+
+def _ledger(passbook_rows):
+    from services.ledger import AccountLedger
+
+    ledger = AccountLedger("bench")
+    ledger.add("T_bench", passbook_rows)
+    return ledger
+
+
+def test_ledger_date_range(benchmark, passbook_rows):
+    benchmark.group = "ledger-date-range"
+    ledger = _ledger(passbook_rows)
+    middle = ledger.between()[len(ledger) // 2].date
+    assert benchmark(ledger.between, middle, middle.replace(year=middle.year + 1))
+
+
+def test_ledger_amount_threshold(benchmark, passbook_rows):
+    benchmark.group = "ledger-amount-threshold"
+    ledger = _ledger(passbook_rows)
+    assert benchmark(ledger.at_least, 29_000, "withdrawal")
+
+
+def test_ledger_counterparty(benchmark, passbook_rows):
+    benchmark.group = "ledger-counterparty"
+    ledger = _ledger(passbook_rows)
+    ledger.counterparty("ヤマダ")  # build the description index outside the timed loop
+    assert benchmark(ledger.counterparty, "ﾔﾏﾀﾞ")
+
+
+def test_passbook_analysis(benchmark, passbook_rows):
+    from services.passbook_analysis import analyze_ledgers
+
+    benchmark.group = "passbook-analysis"
+    ledger = _ledger(passbook_rows)
+    ledger.columns()  # columns are cached on the ledger between queries
+    result = benchmark(analyze_ledgers, [ledger], None, ["ヤマダ"])
+    assert result["findings"]
+
+
+def test_passbook_columns_round_trip(benchmark, passbook_rows):
+    from models.passbook import PassbookColumns
+
+    benchmark.group = "passbook-columns"
+    rows = benchmark(lambda: PassbookColumns.from_rows(passbook_rows).to_rows())
+    assert rows == passbook_rows
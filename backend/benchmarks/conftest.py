@@ -0,0 +1,92 @@
+"""
+CPU処理ステージのベンチマーク用フィクスチャ
+
+Geminiは呼び出さず、合成した通帳データで各ステージの処理時間を計測する。
+"""
+
+import json
+import os
+import random
+import sys
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Any, Dict, List
+
+import pytest
+
+# Add backend to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+# Ledger sizes (rows) and case sizes (documents) to benchmark.
+# BENCH_MAX_ROWS caps the ledger sizes for quick local runs.
+LEDGER_SIZES = [1_000, 10_000, 100_000, 500_000]
+CASE_SIZES = [10, 100, 1_000]
+ROWS_PER_DOCUMENT = 200
+
+MAX_ROWS = int(os.getenv("BENCH_MAX_ROWS", "0")) or max(LEDGER_SIZES)
+
+DESCRIPTIONS = [
+    "カード", "振込 ヤマダ タロウ", "ATM", "電気料", "ガス料", "水道料",
+    "NHK", "年金", "利息", "振替 ジドウシャホケン", "口座振替", "給与",
+]
+
+
+def make_transactions(count: int, seed: int = 0) -> List[Dict[str, Any]]:
+    """残高が連続する合成取引データを生成（約1割は繰越行）"""
+    rng = random.Random(seed)
+    balance = 1_000_000
+    day = date(2015, 1, 1)
+    rows = []
+    for _ in range(count):
+        day += timedelta(days=rng.randint(0, 3))
+        if rng.random() < 0.1:
+            withdrawal, deposit = 0, 0
+        elif rng.random() < 0.6:
+            withdrawal, deposit = rng.randint(1, 300) * 100, 0
+        else:
+            withdrawal, deposit = 0, rng.randint(1, 300) * 100
+        balance += deposit - withdrawal
+        rows.append({
+            "取引日": day.isoformat(),
+            "出金額": withdrawal,
+            "入金額": deposit,
+            "残高": balance,
+            "取引内容": rng.choice(DESCRIPTIONS),
+        })
+    return rows
+
+
+def ledger_sizes() -> List[int]:
+    return [size for size in LEDGER_SIZES if size <= MAX_ROWS]
+
+
+@pytest.fixture(scope="session")
+def ocr_service():
+    from services.gemini_ocr import GeminiOCRService
+    return GeminiOCRService()
+
+
+@pytest.fixture(scope="session", params=ledger_sizes(), ids=lambda n: f"{n}rows")
+def passbook_rows(request) -> List[Dict[str, Any]]:
+    return make_transactions(request.param)
+
+
+@pytest.fixture(scope="session")
+def passbook_json(passbook_rows) -> str:
+    return json.dumps(passbook_rows, ensure_ascii=False)
+
+
+@pytest.fixture(scope="session", params=CASE_SIZES, ids=lambda n: f"{n}docs")
+def case_documents(request):
+    from models.document import DocumentCategory, ProcessedDocument
+
+    docs = []
+    for i in range(request.param):
+        docs.append(ProcessedDocument(
+            id=f"T_{i}",
+            original_filename=f"通帳_{i:04d}.pdf",
+            category=DocumentCategory.PASSBOOK,
+            extracted_data={"transactions": make_transactions(ROWS_PER_DOCUMENT, seed=i)},
+            ocr_confidence=0.95
+        ))
+    return docs
@@ -1,3 +1,4 @@
 from .config import settings
+from .metrics import metrics
 
-__all__ = ['settings']
\ No newline at end of file
+__all__ = ['settings', 'metrics']
\ No newline at end of file
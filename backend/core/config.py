@@ -1,5 +1,5 @@
 from pydantic import BaseSettings
-from typing import List
+from typing import List, Dict
 import os
 
 class Settings(BaseSettings):
@@ -24,17 +24,78 @@ class Settings(BaseSettings):
     ]
     
     # File upload settings
-    MAX_UPLOAD_SIZE: int = 50 * 1024 * 1024  # 50MB
+    MAX_UPLOAD_SIZE: int = 50 * 1024 * 1024  # 50MB per file
+    MAX_REQUEST_SIZE: int = 500 * 1024 * 1024  # whole multipart body (batch uploads)
+    # Upload bytes held in memory at once across all requests; requests over budget wait
+    UPLOAD_MEMORY_BUDGET: int = 200 * 1024 * 1024
     ALLOWED_EXTENSIONS: List[str] = [".pdf", ".jpg", ".jpeg", ".png", ".heic", ".heif"]
     
     # Processing settings
     MAX_CONCURRENT_OCR: int = 5
+    # Worker processes for page rendering and image decoding (0 = one per available CPU)
+    RENDER_WORKERS: int = 0
     OCR_TIMEOUT: int = 60  # seconds
     
+    # Born-digital PDF fast path (skip vision OCR when the text layer is usable)
+    TEXT_LAYER_MIN_CHARS_PER_PAGE: int = 30
+    TEXT_LAYER_MIN_READABLE_RATIO: float = 0.9
+    
+    # Per-page OCR results kept for revised PDFs (least recently used pages are dropped beyond this)
+    PAGE_RESULT_MAX_ENTRIES: int = 20000
+    
+    # Passbook page packing (several pages per generation request)
+    PASSBOOK_PACK_MAX_PAGES: int = 6
+    PASSBOOK_PACK_MAX_BYTES: int = 15 * 1024 * 1024  # stay under the inline request limit
+    PASSBOOK_MAX_OUTPUT_TOKENS: int = 8192
+    PASSBOOK_ROWS_PER_PAGE: int = 25
+    PASSBOOK_RENDER_DPI: int = 200
+    # Tall passbook scans can be cut into overlapping horizontal strips OCR'd in parallel
+    PASSBOOK_STRIP_HEIGHT_RATIO: float = 1.4  # strip height as a multiple of the image width
+    PASSBOOK_STRIP_OVERLAP_RATIO: float = 0.15  # overlap as a fraction of the strip height; must exceed one row
+    
+    # Model routing settings (cheapest tier first, escalate on failed checks)
+    MODEL_TIERS: List[str] = ["gemini-2.0-flash-lite", "gemini-2.5-flash"]
+    ESCALATION_CONFIDENCE_THRESHOLD: float = 0.8
+    # Local keyword classifier: skip the remote call at or above this confidence
+    LOCAL_CLASSIFIER_CONFIDENCE_THRESHOLD: float = 0.85
+    
+    # Classification thumbnails (first page(s) rendered and downscaled)
+    CLASSIFY_THUMBNAIL_MAX_SIDE: int = 1024
+    CLASSIFY_THUMBNAIL_PAGES: int = 1
+    THUMBNAIL_CACHE_SIZE: int = 256
+    # Batch classification: up to N documents per request, waiting at most LINGER_MS to fill a batch
+    CLASSIFY_BATCH_SIZE: int = 8
+    CLASSIFY_BATCH_LINGER_MS: int = 200
+    # USD per 1M tokens: [input, output]
+    MODEL_PRICING: Dict[str, List[float]] = {
+        "gemini-2.0-flash-lite": [0.075, 0.30],
+        "gemini-2.0-flash": [0.10, 0.40],
+        "gemini-2.0-flash-exp": [0.10, 0.40],
+        "gemini-2.5-flash": [0.30, 2.50],
+        "gemini-2.5-pro": [1.25, 10.00],
+    }
+    
+    # Passbook analysis (pre-death withdrawals and gift patterns)
+    ANALYSIS_LOOKBACK_YEARS: int = 7  # gifts within 7 years before death are added back
+    ANALYSIS_LARGE_AMOUNT: int = 500_000
+    ANALYSIS_WINDOW_DAYS: int = 30
+    ANALYSIS_WINDOW_AMOUNT: int = 1_000_000
+    ANALYSIS_RECURRING_MIN_COUNT: int = 3
+    ANALYSIS_RECURRING_MIN_AMOUNT: int = 100_000
+    ANALYSIS_ROUND_UNIT: int = 100_000
+    
+    # Original uploads (content-addressed blobs): unreferenced blobs younger than this survive gc
+    BLOB_GC_GRACE_SECONDS: int = 3600
+    
+    # Duplicate batch requests (same Idempotency-Key or same files): results are replayed for this long
+    IDEMPOTENCY_TTL_SECONDS: int = 600
+    IDEMPOTENCY_MAX_ENTRIES: int = 256
+    
     # Paths
     UPLOAD_PATH: str = "uploads"
     OUTPUT_PATH: str = "outputs"
     TEMP_PATH: str = "temp"
+    INDEX_PATH: str = "indexes"
     
     class Config:
         env_file = ".env"
@@ -0,0 +1,91 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+from fastapi import HTTPException
+
+from core.config import settings
+from core.metrics import metrics
+
+
+class IdempotencyCache:
+    """
+    キーごとの処理結果（Idempotency-Keyヘッダーまたはリクエスト内容のハッシュ）
+    同じキーの処理が実行中なら新たに始めずにその結果を待ち（single-flight）、完了した結果はTTLの間そのまま返す。
+    失敗した処理は記録しないため、再送すればもう一度処理する
+    """
+
+    def __init__(self, ttl_seconds: float, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._in_flight: Dict[str, Tuple[str, asyncio.Future]] = {}
+        self._completed: "OrderedDict[str, Tuple[float, str, Any]]" = OrderedDict()
+
+    async def run(
+        self,
+        key: str,
+        fingerprint: str,
+        compute: Callable[[], Awaitable[Any]],
+        keep: Callable[[Any], bool] = lambda result: True,
+        valid: Callable[[Any], bool] = lambda result: True
+    ) -> Tuple[Any, bool]:
+        """
+        キーの処理結果を返す（戻り値: (結果, 以前の処理・実行中の処理の結果を使ったか)）
+        fingerprintはリクエスト内容のハッシュで、同じキーで内容の違うリクエストは422にする。keepがFalseを返す結果は記録しない。
+        記録した結果はvalidがFalseを返すようになった時点（結果の書類が削除されたなど）で破棄し、もう一度処理する
+        """
+        self._expire()
+        completed = self._completed.get(key)
+        if completed is not None and not valid(completed[2]):
+            del self._completed[key]
+            metrics.increment("idempotency.invalidated")
+            completed = None
+        if completed is not None:
+            self._check(completed[1], fingerprint)
+            metrics.increment("idempotency.replayed")
+            return completed[2], True
+
+        running = self._in_flight.get(key)
+        if running is not None:
+            self._check(running[0], fingerprint)
+            metrics.increment("idempotency.coalesced")
+            return await asyncio.shield(running[1]), True
+
+        task = asyncio.ensure_future(compute())
+        self._in_flight[key] = (fingerprint, task)
+        task.add_done_callback(lambda done: self._finish(key, fingerprint, done, keep))
+        # Shielded: a client that disconnects does not cancel the work the others are waiting on
+        return await asyncio.shield(task), False
+
+    def _check(self, stored: str, fingerprint: str) -> None:
+        if stored != fingerprint:
+            metrics.increment("idempotency.conflicts")
+            raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+
+    def _finish(self, key: str, fingerprint: str, task: asyncio.Future, keep: Callable[[Any], bool]) -> None:
+        self._in_flight.pop(key, None)
+        if task.cancelled() or task.exception() is not None:
+            return
+        result = task.result()
+        if not keep(result):
+            return
+        self._completed[key] = (time.monotonic() + self.ttl_seconds, fingerprint, result)
+        self._completed.move_to_end(key)
+        while len(self._completed) > self.max_entries:
+            self._completed.popitem(last=False)
+
+    def _expire(self) -> None:
+        now = time.monotonic()
+        # Entries are kept in completion order, so the expired ones are at the front
+        while self._completed:
+            key, (expires_at, _, _) = next(iter(self._completed.items()))
+            if expires_at > now:
+                break
+            del self._completed[key]
+
+    def clear(self) -> None:
+        self._completed.clear()
+
+
+batch_requests = IdempotencyCache(settings.IDEMPOTENCY_TTL_SECONDS, settings.IDEMPOTENCY_MAX_ENTRIES)
@@ -0,0 +1,199 @@
+import asyncio
+import hashlib
+import re
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, List, Optional
+
+from fastapi import HTTPException, UploadFile
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from core.config import settings
+from core.metrics import metrics
+
+
+def upload_size(file: UploadFile) -> int:
+    """アップロードファイルのバイト数（内容は読み込まない）"""
+    if file.size is not None:
+        return file.size
+    # Spooled (or in-memory test) files: the size is the end offset
+    position = file.file.tell()
+    size = file.file.seek(0, 2)
+    file.file.seek(position)
+    return size
+
+
+def check_upload_size(*files: UploadFile) -> int:
+    """ファイルごとの上限を確認し、合計バイト数を返す（上限超過は内容を読む前に413）"""
+    total = 0
+    for file in files:
+        size = upload_size(file)
+        if size > settings.MAX_UPLOAD_SIZE:
+            metrics.increment("uploads.rejected")
+            raise HTTPException(
+                status_code=413,
+                detail=f"{file.filename}: file exceeds {settings.MAX_UPLOAD_SIZE // (1024 * 1024)} MB"
+            )
+        total += size
+    return total
+
+
+async def read_upload(file: UploadFile) -> bytes:
+    """アップロードファイルの内容を読み込む（同じファイルを何度でも読めるよう先頭から）"""
+    await file.seek(0)
+    return await file.read()
+
+
+async def upload_sha256(file: UploadFile, chunk_size: int = 1024 * 1024) -> str:
+    """アップロードファイルのsha256（内容全体をメモリに読み込まずに計算）"""
+    digest = hashlib.sha256()
+    await file.seek(0)
+    while True:
+        chunk = await file.read(chunk_size)
+        if not chunk:
+            break
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+class UploadBudget:
+    """
+    処理中のアップロードがメモリに持つ合計バイト数の上限
+    上限を超える予約は先に予約したリクエストが終わるまで待つ（到着順）。
+    上限より大きい1ファイルは、他に処理中のものがなければ単独で通す
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.in_flight = 0
+        self._waiters: Deque[List] = deque()  # [size, future]
+
+    @asynccontextmanager
+    async def reserve(self, size: int) -> AsyncIterator[None]:
+        size = min(size, self.max_bytes)
+        started = time.perf_counter()
+        if self._waiters or self.in_flight + size > self.max_bytes:
+            waiter = [size, asyncio.get_running_loop().create_future()]
+            self._waiters.append(waiter)
+            try:
+                await waiter[1]
+            except asyncio.CancelledError:
+                if waiter[1].done() and not waiter[1].cancelled():
+                    self._release(size)  # granted just before the cancellation
+                else:
+                    self._waiters.remove(waiter)
+                    self._wake()
+                raise
+        else:
+            self.in_flight += size
+        metrics.observe("uploads.budget_wait_seconds", time.perf_counter() - started)
+        metrics.observe("uploads.in_flight_bytes", self.in_flight)
+        try:
+            yield
+        finally:
+            self._release(size)
+
+    def _release(self, size: int) -> None:
+        self.in_flight -= size
+        self._wake()
+
+    def _wake(self) -> None:
+        while self._waiters:
+            size, future = self._waiters[0]
+            if self.in_flight and self.in_flight + size > self.max_bytes:
+                break
+            self._waiters.popleft()
+            self.in_flight += size
+            future.set_result(None)
+
+
+upload_budget = UploadBudget(settings.UPLOAD_MEMORY_BUDGET)
+
+
+_BOUNDARY = re.compile(r'boundary="?([^";]+)"?', re.IGNORECASE)
+# Part headers (Content-Disposition, Content-Type) counted along with the file
+_PART_HEADER_SLACK = 64 * 1024
+
+
+class MultipartPartCounter:
+    """
+    受信中のmultipart本文の、最後の区切り以降（処理中のパート）のバイト数
+    区切りがチャンクの境目にまたがっても数えられるよう、直前のチャンクの末尾を持つ
+    """
+
+    def __init__(self, boundary: bytes):
+        self.delimiter = b"--" + boundary
+        self.part_size = 0
+        self._tail = b""
+
+    def feed(self, chunk: bytes) -> int:
+        data = self._tail + chunk
+        end = data.rfind(self.delimiter)
+        if end >= 0:
+            self.part_size = len(data) - end - len(self.delimiter)
+        else:
+            self.part_size += len(chunk)
+        self._tail = data[-(len(self.delimiter) - 1):]
+        return self.part_size
+
+
+class UploadSizeLimitMiddleware:
+    """
+    リクエスト本文の大きさの上限
+    Content-Lengthが上限を超える場合は本文を受信せずに413を返し、
+    長さが不明な場合は受信したバイト数が上限を超えた時点で413にする。
+    max_part_sizeを指定するとmultipartの1パート（1ファイル）も受信しながら数え、
+    上限を超えた時点で残りを一時ファイルに退避せずに413にする
+    """
+
+    def __init__(self, app: ASGIApp, max_size: int, max_part_size: Optional[int] = None):
+        self.app = app
+        self.max_size = max_size
+        self.max_part_size = max_part_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        detail = f"request body exceeds {self.max_size // (1024 * 1024)} MB"
+        length = Headers(scope=scope).get("content-length", "")
+        if length.isdigit() and int(length) > self.max_size:
+            metrics.increment("uploads.rejected")
+            await JSONResponse({"detail": detail}, status_code=413)(scope, receive, send)
+            return
+
+        received = 0
+        parts = self._part_counter(scope)
+
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                body = message.get("body", b"")
+                received += len(body)
+                if received > self.max_size:
+                    metrics.increment("uploads.rejected")
+                    # Raised inside form parsing, so FastAPI turns it into the response
+                    raise HTTPException(status_code=413, detail=detail)
+                if parts is not None and parts.feed(body) > self.max_part_size + _PART_HEADER_SLACK:
+                    metrics.increment("uploads.rejected")
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"file exceeds {self.max_part_size // (1024 * 1024)} MB"
+                    )
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+    def _part_counter(self, scope: Scope) -> Optional[MultipartPartCounter]:
+        if self.max_part_size is None:
+            return None
+        content_type = Headers(scope=scope).get("content-type", "")
+        match = _BOUNDARY.search(content_type)
+        if not content_type.lower().startswith("multipart/") or not match:
+            return None
+        return MultipartPartCounter(match.group(1).encode("latin-1"))
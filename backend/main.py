@@ -10,8 +10,11 @@ try:
 except ImportError:
     pass  # In production, environment variables are set by the platform
 
-from api import documents, ocr, health
+from api import documents, ocr, health, ledger, blobs, geo, search, cases
 from core.config import settings
+from core.uploads import UploadSizeLimitMiddleware
+from services.blob_store import blob_store
+from services.render_pool import render_pool
 
 # Configure logging
 logger.add("logs/app.log", rotation="500 MB", retention="10 days", level="INFO")
@@ -23,6 +26,11 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# Reject oversized uploads before their body is received (added first so CORS wraps the 413)
+app.add_middleware(
+    UploadSizeLimitMiddleware, max_size=settings.MAX_REQUEST_SIZE, max_part_size=settings.MAX_UPLOAD_SIZE
+)
+
 # Configure CORS - be more permissive for now
 app.add_middleware(
     CORSMiddleware,
@@ -37,6 +45,11 @@ app.add_middleware(
 app.include_router(health.router, prefix="/api", tags=["health"])
 app.include_router(documents.router, prefix="/api/documents", tags=["documents"])
 app.include_router(ocr.router, prefix="/api/ocr", tags=["ocr"])
+app.include_router(ledger.router, prefix="/api/ledger", tags=["ledger"])
+app.include_router(blobs.router, prefix="/api/blobs", tags=["blobs"])
+app.include_router(geo.router, prefix="/api/geo", tags=["geo"])
+app.include_router(search.router, prefix="/api/search", tags=["search"])
+app.include_router(cases.router, prefix="/api/cases", tags=["cases"])
 
 @app.on_event("startup")
 async def startup_event():
@@ -45,10 +58,14 @@ async def startup_event():
     os.makedirs("uploads", exist_ok=True)
     os.makedirs("outputs", exist_ok=True)
     os.makedirs("logs", exist_ok=True)
+    os.makedirs(settings.INDEX_PATH, exist_ok=True)
+    # Documents are kept in memory, so references recorded before a restart point at nothing
+    blob_store.rebuild_refs({doc.id: doc.blob_id for doc in documents.documents_storage.values() if doc.blob_id})
 
 @app.on_event("shutdown")
 async def shutdown_event():
     logger.info("相続税申告書類処理システム終了")
+    render_pool.shutdown()
 
 if __name__ == "__main__":
     import uvicorn
@@ -1,4 +1,7 @@
 from .document import *
+from .passbook import PassbookColumns
+from .case import Case, CaseCreateRequest
 
 __all__ = ['DocumentCategory', 'ProcessedDocument', 'DocumentProcessResponse', 'CSVExportRequest', 
-         'LandBuildingData', 'StockData', 'DepositData', 'PassbookTransaction']
\ No newline at end of file
+         'LandBuildingData', 'StockData', 'DepositData', 'LifeInsuranceData', 'PassbookTransaction', 'PassbookColumns',
+         'Case', 'CaseCreateRequest']
\ No newline at end of file
@@ -0,0 +1,16 @@
+from typing import Optional
+from datetime import date, datetime
+from pydantic import BaseModel, Field
+
+class Case(BaseModel):
+    """案件（相続1件分。書類・元帳・索引は案件ごとに分けて持つ）"""
+    id: str = Field(..., description="案件ID")
+    name: str = Field(..., description="案件名（被相続人名など）")
+    date_of_death: Optional[date] = Field(None, description="相続開始日")
+    created_at: datetime = Field(default_factory=datetime.now, description="作成日時")
+
+class CaseCreateRequest(BaseModel):
+    """案件作成リクエスト"""
+    id: Optional[str] = Field(None, description="案件ID（省略時は自動採番）")
+    name: str = Field(..., description="案件名")
+    date_of_death: Optional[date] = Field(None, description="相続開始日")
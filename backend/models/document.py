@@ -1,8 +1,10 @@
 from enum import Enum
 from typing import Optional, List, Dict, Any
-from datetime import datetime
+from datetime import date, datetime
 from pydantic import BaseModel, Field
 
+from .passbook import JSON_ENCODERS, PassbookColumns
+
 class DocumentCategory(str, Enum):
     """書類区分"""
     LAND_BUILDING = "L"  # 土地・建物
@@ -21,6 +23,7 @@ class DocumentCategory(str, Enum):
 
 class LandBuildingData(BaseModel):
     """土地・建物データ"""
+    document_type: Optional[str] = Field(None, description="書類の種類（登記簿・名寄帳・固定資産税通知書等）")
     prefecture: Optional[str] = Field(None, description="都道府県")
     city: Optional[str] = Field(None, description="市区町村")
     address: Optional[str] = Field(None, description="大字・丁目")
@@ -32,6 +35,7 @@ class LandBuildingData(BaseModel):
     area: Optional[float] = Field(None, description="地積")
     site_right_ratio: Optional[str] = Field(None, description="敷地権割合")
     fixed_asset_tax_value: Optional[int] = Field(None, description="固定資産税評価額")
+    owner_names: List[str] = Field(default_factory=list, description="所有者名または名義人名")
 
 class StockData(BaseModel):
     """株式・投資信託データ"""
@@ -49,14 +53,30 @@ class DepositData(BaseModel):
     account_number: Optional[str] = Field(None, description="口座番号")
     balance: int = Field(..., description="残高")
     accrued_interest: Optional[int] = Field(None, description="既経過利子")
+    certificate_date: Optional[date] = Field(None, description="証明日（残高の基準日）")
+
+class LifeInsuranceData(BaseModel):
+    """生命保険データ"""
+    insurance_company: str = Field(..., description="保険会社名")
+    policy_number: Optional[str] = Field(None, description="証券番号")
+    policyholder: Optional[str] = Field(None, description="契約者")
+    insured: Optional[str] = Field(None, description="被保険者")
+    beneficiary: Optional[str] = Field(None, description="保険金受取人")
+    receipt_date: Optional[str] = Field(None, description="受取年月日")
+    insurance_amount: Optional[int] = Field(None, description="保険金額")
+    surrender_value: Optional[int] = Field(None, description="解約返戻金額")
 
 class PassbookTransaction(BaseModel):
-    """通帳取引データ"""
-    transaction_date: datetime = Field(..., description="取引日")
-    withdrawal: Optional[int] = Field(None, description="出金額")
-    deposit: Optional[int] = Field(None, description="入金額")
-    balance: Optional[int] = Field(None, description="残高")
-    description: str = Field(..., description="取引内容")
+    """通帳取引データ（OCR結果の1行、キーは日本語の項目名）"""
+    transaction_date: Optional[date] = Field(None, alias="取引日", description="取引日")
+    withdrawal: int = Field(0, alias="出金額", description="出金額（該当なければ0）")
+    deposit: int = Field(0, alias="入金額", description="入金額（該当なければ0）")
+    balance: Optional[int] = Field(None, alias="残高", description="残高（不明な場合はnull）")
+    description: str = Field("", alias="取引内容", description="取引内容（摘要など）")
+    page: Optional[int] = Field(None, alias="ページ", description="その取引が記載された画像の見出しの番号")
+
+    class Config:
+        allow_population_by_field_name = True
 
 class ProcessedDocument(BaseModel):
     """処理済み書類データ"""
@@ -69,6 +89,13 @@ class ProcessedDocument(BaseModel):
     processed_at: datetime = Field(default_factory=datetime.now, description="処理日時")
     manual_edits: Dict[str, Any] = Field(default_factory=dict, description="手動修正内容")
     error_message: Optional[str] = Field(None, description="エラーメッセージ")
+    case_id: Optional[str] = Field(None, description="案件ID")
+    duplicate_of: Optional[str] = Field(None, description="重複元の書類ID（重複書類の場合）")
+    blob_id: Optional[str] = Field(None, description="アップロード原本のblob ID（内容のsha256）")
+
+    class Config:
+        # extracted_data["transactions"] of stored passbooks is PassbookColumns
+        json_encoders = JSON_ENCODERS
 
 class DocumentUploadRequest(BaseModel):
     """書類アップロードリクエスト"""
@@ -83,6 +110,11 @@ class DocumentProcessResponse(BaseModel):
     failed_count: int = Field(0, description="失敗件数")
     documents: List[ProcessedDocument] = Field(default_factory=list, description="処理済み書類リスト")
     errors: List[str] = Field(default_factory=list, description="エラーメッセージリスト")
+    duplicate_count: int = Field(0, description="重複として再処理を省略した件数")
+    replayed: bool = Field(False, description="同じリクエストの処理結果を再送したか")
+
+    class Config:
+        json_encoders = JSON_ENCODERS
 
 class CSVExportRequest(BaseModel):
     """CSV出力リクエスト"""
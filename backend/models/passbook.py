@@ -0,0 +1,170 @@
+import sys
+from datetime import date
+from typing import Any, Dict, Iterator, List, Optional
+import numpy as np
+
+# Sentinels for missing values in the typed columns
+NO_DATE = 0  # date.toordinal() starts at 1
+NO_AMOUNT = np.iinfo(np.int64).min
+NO_PAGE = 0
+
+# Row keys in the JSON shape, in output order
+DATE_KEY = "取引日"
+WITHDRAWAL_KEY = "出金額"
+DEPOSIT_KEY = "入金額"
+BALANCE_KEY = "残高"
+DESCRIPTION_KEY = "取引内容"
+PAGE_KEY = "ページ"
+COLUMN_KEYS = (DATE_KEY, WITHDRAWAL_KEY, DEPOSIT_KEY, BALANCE_KEY, DESCRIPTION_KEY, PAGE_KEY)
+
+
+def _to_int(value: Any) -> Optional[int]:
+    """列に格納できる整数値（できない場合はNone）"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value if NO_AMOUNT < value <= np.iinfo(np.int64).max else None
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return None
+
+
+class PassbookColumns:
+    """
+    通帳取引の列形式の格納
+    取引日はint32（日数）、金額はint64、取引内容は書類ごとの文字列表の番号で持ち、行ごとのdictを持たない。
+    文字列はsys.internで書類をまたいで共有し、参照する書類がすべて削除されれば解放される。
+    列に収まらない値（yyyy-mm-dd以外の日付、数値でない金額、未知の項目）は行番号をキーに別に保持し、
+    to_rows() で元のJSON形式を損失なく復元する
+    """
+
+    __slots__ = ("dates", "withdrawals", "deposits", "balances", "descriptions", "description_texts", "pages", "extras")
+
+    def __init__(
+        self,
+        dates: np.ndarray,
+        withdrawals: np.ndarray,
+        deposits: np.ndarray,
+        balances: np.ndarray,
+        descriptions: np.ndarray,
+        description_texts: List[str],
+        pages: Optional[np.ndarray] = None,
+        extras: Optional[Dict[int, Dict[str, Any]]] = None
+    ):
+        self.dates = dates
+        self.withdrawals = withdrawals
+        self.deposits = deposits
+        self.balances = balances
+        self.descriptions = descriptions  # int32 codes into description_texts
+        self.description_texts = description_texts
+        self.pages = pages
+        self.extras = extras or {}
+
+    @classmethod
+    def from_rows(cls, rows: List[Dict[str, Any]]) -> "PassbookColumns":
+        count = len(rows)
+        dates = np.full(count, NO_DATE, dtype=np.int32)
+        withdrawals = np.zeros(count, dtype=np.int64)
+        deposits = np.zeros(count, dtype=np.int64)
+        balances = np.full(count, NO_AMOUNT, dtype=np.int64)
+        pages = np.full(count, NO_PAGE, dtype=np.int32) if any(PAGE_KEY in row for row in rows) else None
+        codes: Dict[str, int] = {}
+        descriptions = np.zeros(count, dtype=np.int32)
+        extras: Dict[int, Dict[str, Any]] = {}
+
+        for position, row in enumerate(rows):
+            overflow = {key: value for key, value in row.items() if key not in COLUMN_KEYS}
+
+            value = row.get(DATE_KEY)
+            if value is not None:
+                try:
+                    parsed = date.fromisoformat(value)
+                except (TypeError, ValueError):
+                    parsed = None
+                # 3.11 also parses "20240105"; only the yyyy-mm-dd form round-trips
+                if parsed is not None and value == parsed.isoformat():
+                    dates[position] = parsed.toordinal()
+                else:
+                    overflow[DATE_KEY] = value
+
+            for key, column, default in ((WITHDRAWAL_KEY, withdrawals, 0), (DEPOSIT_KEY, deposits, 0), (BALANCE_KEY, balances, None)):
+                value = row.get(key, default)
+                number = _to_int(value)
+                if number is None:
+                    if value is not None or key != BALANCE_KEY:
+                        overflow[key] = value
+                else:
+                    column[position] = number
+
+            value = row.get(DESCRIPTION_KEY)
+            if not isinstance(value, str):
+                if DESCRIPTION_KEY in row:
+                    overflow[DESCRIPTION_KEY] = value
+                value = ""
+            descriptions[position] = codes.setdefault(value, len(codes))
+
+            if pages is not None and PAGE_KEY in row:
+                page = _to_int(row[PAGE_KEY])
+                if page is None or page == NO_PAGE:
+                    overflow[PAGE_KEY] = row[PAGE_KEY]
+                else:
+                    pages[position] = page
+
+            if overflow:
+                extras[position] = overflow
+
+        texts = [sys.intern(text) for text in codes]
+        return cls(dates, withdrawals, deposits, balances, descriptions, texts, pages, extras)
+
+    def __len__(self) -> int:
+        return len(self.dates)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return iter(self.to_rows())
+
+    def to_rows(self) -> List[Dict[str, Any]]:
+        """元のJSON形式（行ごとのdict）に変換"""
+        dates = [date.fromordinal(day).isoformat() if day != NO_DATE else None for day in self.dates.tolist()]
+        balances = [None if balance == NO_AMOUNT else balance for balance in self.balances.tolist()]
+        pages = self.pages.tolist() if self.pages is not None else None
+        rows = []
+        for position, (day, withdrawal, deposit, balance, code) in enumerate(zip(
+            dates, self.withdrawals.tolist(), self.deposits.tolist(), balances, self.descriptions.tolist()
+        )):
+            row = {
+                DATE_KEY: day,
+                WITHDRAWAL_KEY: withdrawal,
+                DEPOSIT_KEY: deposit,
+                BALANCE_KEY: balance,
+                DESCRIPTION_KEY: self.description_texts[code],
+            }
+            if pages is not None and pages[position] != NO_PAGE:
+                row[PAGE_KEY] = pages[position]
+            if position in self.extras:
+                row.update(self.extras[position])
+            rows.append(row)
+        return rows
+
+    @property
+    def nbytes(self) -> int:
+        """列データのバイト数（取引内容の文字列表を除く）"""
+        columns = (self.dates, self.withdrawals, self.deposits, self.balances, self.descriptions, self.pages)
+        return sum(column.nbytes for column in columns if column is not None)
+
+
+def compact_transactions(extracted_data: Dict[str, Any]) -> Dict[str, Any]:
+    """抽出データの取引リストを列形式に置き換える（すでに列形式の場合はそのまま）"""
+    transactions = extracted_data.get("transactions")
+    if isinstance(transactions, list):
+        extracted_data["transactions"] = PassbookColumns.from_rows(transactions)
+    return extracted_data
+
+
+def transaction_rows(transactions: Any) -> List[Dict[str, Any]]:
+    """取引データ（リスト・列形式のどちらでも）を行ごとのdictのリストで返す"""
+    if isinstance(transactions, PassbookColumns):
+        return transactions.to_rows()
+    return list(transactions or [])
+
+
+JSON_ENCODERS = {PassbookColumns: PassbookColumns.to_rows}
@@ -0,0 +1,144 @@
+import hashlib
+import os
+import sqlite3
+import tempfile
+import time
+from contextlib import contextmanager
+from threading import Lock
+from typing import Any, Dict, Iterator, Optional
+from loguru import logger
+
+from core.config import settings
+from core.metrics import metrics
+
+
+class BlobStore:
+    """
+    アップロード原本の内容アドレス方式の保存先
+    sha256をblob IDとして UPLOAD_PATH/blobs/<ab>/<cd>/<sha256> に同じ内容を1回だけ書き込む。
+    どの書類がどのblobを参照しているかをSQLiteに記録し、参照のなくなったblobをgc()で削除する
+    """
+
+    def __init__(self, root: Optional[str] = None):
+        self._root = root
+        self._lock = Lock()
+
+    @property
+    def root(self) -> str:
+        # Resolved lazily so UPLOAD_PATH overrides apply after import
+        return self._root or os.path.join(settings.UPLOAD_PATH, "blobs")
+
+    def path(self, blob_id: str) -> str:
+        return os.path.join(self.root, blob_id[:2], blob_id[2:4], blob_id)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        os.makedirs(self.root, exist_ok=True)
+        with self._lock:
+            connection = sqlite3.connect(os.path.join(self.root, "blobs.sqlite3"))
+            try:
+                connection.execute(
+                    "CREATE TABLE IF NOT EXISTS blobs ("
+                    "id TEXT PRIMARY KEY, size INTEGER NOT NULL, mime_type TEXT, created_at REAL NOT NULL)"
+                )
+                connection.execute(
+                    "CREATE TABLE IF NOT EXISTS refs ("
+                    "ref TEXT PRIMARY KEY, blob_id TEXT NOT NULL)"
+                )
+                connection.execute("CREATE INDEX IF NOT EXISTS refs_blob ON refs (blob_id)")
+                with connection:
+                    yield connection
+            finally:
+                connection.close()
+
+    def put(self, content: bytes, mime_type: Optional[str] = None) -> str:
+        """内容を保存してblob IDを返す（同じ内容がすでにあれば書き込まない）"""
+        blob_id = hashlib.sha256(content).hexdigest()
+        with self._connect() as connection:
+            # Recorded (or refreshed) before the file is written, so a concurrent gc()
+            # never sees this blob as old and unreferenced
+            connection.execute(
+                "INSERT INTO blobs (id, size, mime_type, created_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET created_at = excluded.created_at",
+                (blob_id, len(content), mime_type, time.time())
+            )
+
+        path = self.path(blob_id)
+        if os.path.exists(path):
+            metrics.increment("blobs.deduplicated")
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+            metrics.increment("blobs.written")
+            metrics.increment("blobs.bytes_written", len(content))
+        return blob_id
+
+    def info(self, blob_id: str) -> Optional[Dict[str, Any]]:
+        """blobのサイズ・MIMEタイプ・参照数（存在しない場合はNone）"""
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT size, mime_type, (SELECT COUNT(*) FROM refs WHERE blob_id = blobs.id) FROM blobs WHERE id = ?",
+                (blob_id,)
+            ).fetchone()
+        if row is None or not os.path.exists(self.path(blob_id)):
+            return None
+        return {"id": blob_id, "size": row[0], "mime_type": row[1], "ref_count": row[2]}
+
+    def link(self, ref: str, blob_id: str) -> None:
+        """参照元（書類ID）がblobを参照していることを記録（以前の参照は置き換える）"""
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT INTO refs (ref, blob_id) VALUES (?, ?) ON CONFLICT(ref) DO UPDATE SET blob_id = excluded.blob_id",
+                (ref, blob_id)
+            )
+
+    def unlink(self, ref: str) -> None:
+        """参照元の参照を削除（blob自体はgc()で削除）"""
+        with self._connect() as connection:
+            connection.execute("DELETE FROM refs WHERE ref = ?", (ref,))
+
+    def rebuild_refs(self, refs: Dict[str, str]) -> int:
+        """
+        参照の記録を {参照元: blob ID} で置き換える（戻り値: 削除した参照数）
+        起動時に保存中の書類から作り直し、再起動で失われた書類の参照がblobを残し続けないようにする
+        """
+        with self._connect() as connection:
+            stale = connection.execute("SELECT COUNT(*) FROM refs").fetchone()[0]
+            connection.execute("DELETE FROM refs")
+            connection.executemany("INSERT INTO refs (ref, blob_id) VALUES (?, ?)", list(refs.items()))
+        removed = max(0, stale - len(refs))
+        if removed:
+            logger.info(f"保存中の書類のない参照を削除: {removed}件")
+        return removed
+
+    def gc(self, grace_seconds: Optional[float] = None) -> Dict[str, int]:
+        """
+        参照のないblobを削除
+        保存直後でまだ書類に紐付いていないblobを消さないよう、猶予期間内に保存されたものは残す
+        """
+        grace = settings.BLOB_GC_GRACE_SECONDS if grace_seconds is None else grace_seconds
+        cutoff = time.time() - grace
+        with self._connect() as connection:
+            rows = connection.execute(
+                "SELECT id, size FROM blobs WHERE created_at <= ? "
+                "AND NOT EXISTS (SELECT 1 FROM refs WHERE refs.blob_id = blobs.id)",
+                (cutoff,)
+            ).fetchall()
+            for blob_id, _ in rows:
+                try:
+                    os.remove(self.path(blob_id))
+                except FileNotFoundError:
+                    pass
+            connection.executemany("DELETE FROM blobs WHERE id = ?", [(blob_id,) for blob_id, _ in rows])
+
+        freed = sum(size for _, size in rows)
+        if rows:
+            logger.info(f"参照のないblobを削除: {len(rows)}件 ({freed} bytes)")
+        metrics.increment("blobs.collected", len(rows))
+        return {"removed": len(rows), "freed_bytes": freed}
+
+
+blob_store = BlobStore()
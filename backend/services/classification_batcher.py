@@ -0,0 +1,89 @@
+import asyncio
+from typing import Any, Coroutine, List, Optional, Set, Tuple
+from loguru import logger
+
+from core.config import settings
+from core.metrics import metrics
+from models.document import DocumentCategory
+from services.thumbnails import EncodedImage
+
+_Pending = Tuple[List[EncodedImage], "asyncio.Future[DocumentCategory]"]
+
+
+class ClassificationBatcher:
+    """
+    分類リクエストのマイクロバッチ化
+    短い待ち時間（linger）の間に集まった書類を最大CLASSIFY_BATCH_SIZE件ずつ1回のリクエストで分類する
+    一括分類の応答が解析できない場合は1件ずつの分類にフォールバックする
+    """
+
+    def __init__(self, classifier: Any, max_batch: Optional[int] = None, linger_ms: Optional[int] = None):
+        self.classifier = classifier
+        self.max_batch = max_batch or settings.CLASSIFY_BATCH_SIZE
+        self.linger = (settings.CLASSIFY_BATCH_LINGER_MS if linger_ms is None else linger_ms) / 1000
+        self._pending: List[_Pending] = []
+        # The event loop only keeps weak references to tasks; these keep flushes alive until they finish
+        self._tasks: Set["asyncio.Task[None]"] = set()
+        self._linger_task: Optional["asyncio.Task[None]"] = None
+
+    async def submit(self, images: List[EncodedImage]) -> DocumentCategory:
+        future = asyncio.get_running_loop().create_future()
+        batch = self._pending
+        batch.append((images, future))
+
+        if len(batch) >= self.max_batch:
+            self._pending = []
+            if self._linger_task is not None:
+                self._linger_task.cancel()  # its batch is being flushed now
+                self._linger_task = None
+            self._start(self._flush(batch))
+        elif len(batch) == 1:
+            self._linger_task = self._start(self._flush_after_linger(batch))
+
+        return await future
+
+    def _start(self, flush: Coroutine[Any, Any, None]) -> "asyncio.Task[None]":
+        task = asyncio.create_task(flush)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _flush_after_linger(self, batch: List[_Pending]) -> None:
+        await asyncio.sleep(self.linger)
+        # The batch may already have been flushed because it filled up
+        if batch is self._pending:
+            self._pending = []
+            self._linger_task = None
+            await self._flush(batch)
+
+    async def _flush(self, batch: List[_Pending]) -> None:
+        metrics.observe("classifier.batch_size", len(batch))
+        if len(batch) == 1:
+            await self._classify_single(*batch[0])
+            return
+
+        try:
+            categories = await self.classifier.classify_images_batch([images for images, _ in batch])
+        except Exception as e:
+            logger.warning(f"一括分類に失敗したため個別分類にフォールバックします ({len(batch)}件): {str(e)}")
+            metrics.increment("classifier.batch_fallback")
+            categories = [None] * len(batch)
+
+        # Items without a confident category are classified one by one
+        retries = []
+        for (images, future), category in zip(batch, categories):
+            if category is None:
+                retries.append(self._classify_single(images, future))
+            elif not future.done():
+                future.set_result(category)
+        if retries:
+            await asyncio.gather(*retries)
+
+    async def _classify_single(self, images: List[EncodedImage], future: "asyncio.Future[DocumentCategory]") -> None:
+        try:
+            category = await self.classifier.classify_images(images)
+        except Exception as e:
+            logger.error(f"書類分類エラー: {str(e)}")
+            category = DocumentCategory.UNKNOWN
+        if not future.done():
+            future.set_result(category)
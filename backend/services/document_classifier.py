@@ -1,26 +1,34 @@
 import google.generativeai as genai
-import base64
-import json
-from typing import Optional
+from typing import Any, List, Optional
 from loguru import logger
 
 from core.config import settings
+from core.metrics import metrics
 from models.document import DocumentCategory
+from services.model_router import ModelRouter
+from services.local_classifier import classify_text
+from services.thumbnails import EncodedImage
+from services.render_pool import render_pool
+from services.classification_batcher import ClassificationBatcher
 
-class DocumentClassifier:
-    """書類分類エンジン"""
-    
-    def __init__(self):
-        genai.configure(api_key=settings.GEMINI_API_KEY)
-        self.model = genai.GenerativeModel('gemini-2.5-flash')
-    
-    async def classify_document(self, image_base64: str) -> DocumentCategory:
-        """
-        画像から書類タイプを判定
-        """
-        prompt = """この画像の書類タイプを判定してください。
+# Map model output to DocumentCategory enum
+CATEGORY_MAP = {
+    "LAND_BUILDING": DocumentCategory.LAND_BUILDING,
+    "LISTED_STOCK": DocumentCategory.LISTED_STOCK,
+    "OTHER_INVESTMENT": DocumentCategory.OTHER_INVESTMENT,
+    "PUBLIC_BOND": DocumentCategory.PUBLIC_BOND,
+    "DEPOSIT": DocumentCategory.DEPOSIT,
+    "LIFE_INSURANCE": DocumentCategory.LIFE_INSURANCE,
+    "DEATH_RETIREMENT": DocumentCategory.DEATH_RETIREMENT,
+    "OTHER_PROPERTY": DocumentCategory.OTHER_PROPERTY,
+    "DEBT": DocumentCategory.DEBT,
+    "FUNERAL_EXPENSE": DocumentCategory.FUNERAL_EXPENSE,
+    "PASSBOOK": DocumentCategory.PASSBOOK,
+    "PROCEDURE_DOC": DocumentCategory.PROCEDURE_DOC,
+    "UNKNOWN": DocumentCategory.UNKNOWN
+}
 
-以下の書類タイプの中から最も適切なものを選んでください：
+CATEGORY_GUIDE = """以下の書類タイプの中から最も適切なものを選んでください：
 1. LAND_BUILDING: 登記簿謄本、名寄帳、固定資産税通知書、評価証明書
 2. LISTED_STOCK: 証券会社の報告書、株式・投資信託の残高証明書
 3. OTHER_INVESTMENT: 出資証明書、非上場株式の証明書
@@ -38,62 +46,153 @@ class DocumentClassifier:
 判定基準：
 - 書類のタイトルやヘッダー情報を重視
 - 表形式のデータがある場合、その内容を確認
-- 金融機関名、保険会社名、不動産情報などの特定キーワードを確認
+- 金融機関名、保険会社名、不動産情報などの特定キーワードを確認"""
 
-出力形式:
-{
-  "document_type": "書類タイプ名",
-  "confidence": 0.0-1.0,
-  "detected_keywords": ["検出キーワード1", "検出キーワード2"]
-}"""
+class DocumentClassifier:
+    """書類分類エンジン"""
+    
+    def __init__(self):
+        genai.configure(api_key=settings.GEMINI_API_KEY)
+        # Cheapest model first; escalate on low confidence
+        self.router = ModelRouter()
+        # Concurrent classifications are packed into one request when batching is enabled
+        self.batcher = ClassificationBatcher(self) if settings.CLASSIFY_BATCH_SIZE > 1 else None
+    
+    async def classify_document(self, content: bytes, filename: str = "", text: Optional[str] = None) -> DocumentCategory:
+        """
+        書類の先頭ページの縮小画像から書類タイプを判定
+        textがあれば先にローカルのキーワード分類を行い、確信度が高ければGeminiを呼ばない
+        """
+        if text:
+            local = classify_text(text)
+            is_hit = local.confidence >= settings.LOCAL_CLASSIFIER_CONFIDENCE_THRESHOLD
+            # 平均値がローカル分類のヒット率になる
+            metrics.observe("classifier.local.hit", 1.0 if is_hit else 0.0)
+            if is_hit:
+                logger.info(
+                    f"ローカル分類: {local.category.name} "
+                    f"(confidence={local.confidence}, keywords={local.detected_keywords})"
+                )
+                return local.category
         
         try:
-            image_data = base64.b64decode(image_base64)
+            images = await render_pool.classification_images(content, filename)
+            metrics.observe("classifier.bytes_sent", sum(len(data) for data, _ in images))
             
-            response = self.model.generate_content([
-                prompt,
-                {"mime_type": "image/jpeg", "data": image_data}
-            ], generation_config={
-                "temperature": 0.1,
-                "response_mime_type": "application/json"
-            })
-            
-            result = json.loads(response.text)
-            document_type = result.get("document_type", "UNKNOWN")
-            
-            # Map to DocumentCategory enum
-            category_map = {
-                "LAND_BUILDING": DocumentCategory.LAND_BUILDING,
-                "LISTED_STOCK": DocumentCategory.LISTED_STOCK,
-                "OTHER_INVESTMENT": DocumentCategory.OTHER_INVESTMENT,
-                "PUBLIC_BOND": DocumentCategory.PUBLIC_BOND,
-                "DEPOSIT": DocumentCategory.DEPOSIT,
-                "LIFE_INSURANCE": DocumentCategory.LIFE_INSURANCE,
-                "DEATH_RETIREMENT": DocumentCategory.DEATH_RETIREMENT,
-                "OTHER_PROPERTY": DocumentCategory.OTHER_PROPERTY,
-                "DEBT": DocumentCategory.DEBT,
-                "FUNERAL_EXPENSE": DocumentCategory.FUNERAL_EXPENSE,
-                "PASSBOOK": DocumentCategory.PASSBOOK,
-                "PROCEDURE_DOC": DocumentCategory.PROCEDURE_DOC,
-                "UNKNOWN": DocumentCategory.UNKNOWN
-            }
-            
-            return category_map.get(document_type, DocumentCategory.UNKNOWN)
+            if self.batcher is not None:
+                return await self.batcher.submit(images)
+            return await self.classify_images(images)
             
         except Exception as e:
             logger.error(f"書類分類エラー: {str(e)}")
             return DocumentCategory.UNKNOWN
     
-    def get_rename_format(self, category: DocumentCategory, content: str, date: Optional[str] = None) -> str:
+    async def classify_images(self, images: List[EncodedImage]) -> DocumentCategory:
+        """1書類分の画像をGeminiで分類"""
+        prompt = f"""この書類の画像（先頭ページ）から書類タイプを判定してください。
+
+{CATEGORY_GUIDE}
+
+出力形式:
+{{
+  "document_type": "書類タイプ名",
+  "confidence": 0.0-1.0,
+  "detected_keywords": ["検出キーワード1", "検出キーワード2"]
+}}"""
+        
+        routed = await self.router.generate(
+            "classify",
+            [prompt] + [{"mime_type": mime_type, "data": data} for data, mime_type in images],
+            generation_config={
+                "temperature": 0.1,
+                "response_mime_type": "application/json"
+            },
+            validate=self._check_classification
+        )
+        
+        result = routed.value if isinstance(routed.value, dict) else {}
+        document_type = result.get("document_type", "UNKNOWN")
+        
+        return CATEGORY_MAP.get(document_type, DocumentCategory.UNKNOWN)
+    
+    async def classify_images_batch(self, batch: List[List[EncodedImage]]) -> List[Optional[DocumentCategory]]:
+        """
+        複数書類の画像を1回のリクエストでまとめて分類
+        信頼度が閾値未満の書類はNoneを返す（呼び出し側で個別に再分類）
+        応答が解析できない場合は例外を送出する
+        """
+        prompt = f"""以下に{len(batch)}件の書類の画像が「書類1」「書類2」…の見出しに続いて並んでいます。
+書類ごとに書類タイプを判定してください。
+
+{CATEGORY_GUIDE}
+
+出力形式（書類の番号順に{len(batch)}件の配列）:
+[
+  {{
+    "index": 書類番号,
+    "document_type": "書類タイプ名",
+    "confidence": 0.0-1.0
+  }}
+]"""
+        
+        contents: List[Any] = [prompt]
+        for number, images in enumerate(batch, start=1):
+            contents.append(f"書類{number}")
+            contents.extend({"mime_type": mime_type, "data": data} for data, mime_type in images)
+        
+        routed = await self.router.generate(
+            "classify_batch",
+            contents,
+            generation_config={
+                "temperature": 0.1,
+                "response_mime_type": "application/json"
+            },
+            validate=lambda value: self._check_batch_classification(value, len(batch))
+        )
+        if not routed.accepted:
+            raise ValueError(f"一括分類の応答を解析できませんでした: {routed.escalation_reasons[-1]}")
+        
+        categories: List[Optional[DocumentCategory]] = [None] * len(batch)
+        for item in routed.value:
+            if self._check_classification(item) is None:
+                categories[int(item["index"]) - 1] = CATEGORY_MAP[item["document_type"]]
+        return categories
+    
+    def _check_batch_classification(self, result, expected: int) -> Optional[str]:
+        """一括分類結果の形式を検証（件数と番号が揃っていること）"""
+        if not isinstance(result, list) or len(result) != expected:
+            return "schema_error"
+        try:
+            indices = sorted(int(item["index"]) for item in result)
+        except (TypeError, KeyError, ValueError):
+            return "schema_error"
+        if indices != list(range(1, expected + 1)):
+            return "schema_error"
+        return None
+    
+    def _check_classification(self, result) -> Optional[str]:
+        """分類結果の検証（信頼度が閾値未満なら昇格）"""
+        if not isinstance(result, dict) or result.get("document_type") not in CATEGORY_MAP:
+            return "schema_error"
+        try:
+            confidence = float(result.get("confidence", 0))
+        except (TypeError, ValueError):
+            return "schema_error"
+        if confidence < settings.ESCALATION_CONFIDENCE_THRESHOLD:
+            return f"low_confidence: {confidence}"
+        return None
+    
+    @staticmethod
+    def get_rename_format(category: DocumentCategory, content: str, date: Optional[str] = None, sequence: int = 1) -> str:
         """
         書類タイプに応じたリネーム形式を生成
         
-        形式: {区分コード}_{連番}_{内容}_{機関名}_{基準日}.pdf
+        形式: {区分コード}{連番}_{区分名}_{内容}_{機関名}_{基準日}.pdf
+        連番は区分ごとに呼び出し側が振る（同じ区分で重複しない番号を渡す）
         """
         import datetime
         
-        # Get current timestamp for sequence
-        seq = datetime.datetime.now().strftime("%Y%m%d%H%M%S")[:3]
+        seq = f"{sequence:03d}"
         
         # Format date if provided
         if date:
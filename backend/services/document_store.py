@@ -0,0 +1,141 @@
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime
+from threading import Lock
+from typing import Any, Dict, List, Optional
+
+from models.case import Case
+from models.document import ProcessedDocument
+
+# Partition of the documents that belong to no case
+NO_CASE = ""
+
+
+@dataclass
+class CaseCounters:
+    """案件の集計（書類の保存・削除のたびに増減させる）"""
+    categories: Counter = field(default_factory=Counter)
+    duplicates: int = 0
+    updated_at: Optional[datetime] = None
+
+    def apply(self, document: ProcessedDocument, sign: int) -> None:
+        self.categories[document.category.value] += sign
+        if not self.categories[document.category.value]:
+            del self.categories[document.category.value]
+        if document.duplicate_of:
+            self.duplicates += sign
+        self.updated_at = datetime.now()
+
+
+class DocumentStore:
+    """
+    案件ごとに分けた処理済み書類の保存先
+    書類は案件の区画に持ち、書類IDから区画への索引と案件ごとの集計を保存・削除のたびに更新する。
+    案件単位の一覧・出力・削除はその案件の区画だけを読むため、全体の書類数によらない
+    """
+
+    def __init__(self):
+        self._partitions: Dict[str, Dict[str, ProcessedDocument]] = {}
+        self._case_of: Dict[str, str] = {}
+        self._cases: Dict[str, Case] = {}
+        self._counters: Dict[str, CaseCounters] = {}
+        self._lock = Lock()
+
+    # Access by document ID
+
+    def __contains__(self, document_id: str) -> bool:
+        return document_id in self._case_of
+
+    def __getitem__(self, document_id: str) -> ProcessedDocument:
+        return self._partitions[self._case_of[document_id]][document_id]
+
+    def __len__(self) -> int:
+        return len(self._case_of)
+
+    def get(self, document_id: str, default: Any = None) -> Optional[ProcessedDocument]:
+        return self[document_id] if document_id in self._case_of else default
+
+    def values(self) -> List[ProcessedDocument]:
+        """全案件の書類"""
+        return [doc for partition in self._partitions.values() for doc in partition.values()]
+
+    def put(self, document: ProcessedDocument) -> None:
+        """書類を案件の区画に保存（同じIDの書類は置き換える。未登録の案件IDは案件として登録する）"""
+        key = document.case_id or NO_CASE
+        with self._lock:
+            self._remove(document.id)
+            if document.case_id and document.case_id not in self._cases:
+                self._cases[document.case_id] = Case(id=document.case_id, name=document.case_id)
+            self._partitions.setdefault(key, {})[document.id] = document
+            self._case_of[document.id] = key
+            self._counters.setdefault(key, CaseCounters()).apply(document, 1)
+
+    def pop(self, document_id: str) -> ProcessedDocument:
+        with self._lock:
+            document = self._remove(document_id)
+        if document is None:
+            raise KeyError(document_id)
+        return document
+
+    def _remove(self, document_id: str) -> Optional[ProcessedDocument]:
+        key = self._case_of.pop(document_id, None)
+        if key is None:
+            return None
+        document = self._partitions[key].pop(document_id)
+        self._counters[key].apply(document, -1)
+        return document
+
+    # Cases
+
+    def create_case(self, case: Case) -> Case:
+        """案件を登録（同じIDの案件があればValueError）"""
+        with self._lock:
+            if case.id in self._cases:
+                raise ValueError(f"case already exists: {case.id}")
+            self._cases[case.id] = case
+            self._partitions.setdefault(case.id, {})
+            self._counters.setdefault(case.id, CaseCounters())
+        return case
+
+    def get_case(self, case_id: str) -> Optional[Case]:
+        return self._cases.get(case_id)
+
+    def case_documents(self, case_id: Optional[str]) -> List[ProcessedDocument]:
+        """案件の書類（保存順。Noneは案件のない書類）"""
+        return list(self._partitions.get(case_id or NO_CASE, {}).values())
+
+    def case_summary(self, case_id: str) -> Optional[Dict[str, Any]]:
+        """案件と書類の件数（区分別・重複）"""
+        case = self._cases.get(case_id)
+        if case is None:
+            return None
+        counters = self._counters.get(case_id, CaseCounters())
+        return {
+            **case.dict(),
+            "document_count": len(self._partitions.get(case_id, {})),
+            "categories": dict(counters.categories),
+            "duplicate_count": counters.duplicates,
+            "updated_at": counters.updated_at,
+        }
+
+    def cases(self) -> List[Dict[str, Any]]:
+        """全案件の集計（作成日時順）"""
+        ordered = sorted(self._cases.values(), key=lambda case: case.created_at)
+        return [self.case_summary(case.id) for case in ordered]
+
+    def remove_case(self, case_id: str) -> List[ProcessedDocument]:
+        """案件とその書類を削除し、削除した書類を返す"""
+        with self._lock:
+            self._cases.pop(case_id, None)
+            self._counters.pop(case_id, None)
+            documents = list(self._partitions.pop(case_id, {}).values())
+            for document in documents:
+                self._case_of.pop(document.id, None)
+        return documents
+
+    def clear(self) -> None:
+        with self._lock:
+            self._partitions.clear()
+            self._case_of.clear()
+            self._cases.clear()
+            self._counters.clear()
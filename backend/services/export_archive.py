@@ -0,0 +1,133 @@
+import csv
+import io
+import os
+import re
+import zipfile
+from collections import defaultdict
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from loguru import logger
+
+from core.metrics import metrics
+from models.document import DocumentCategory, ProcessedDocument
+from services.blob_store import blob_store
+from services.document_classifier import DocumentClassifier
+from services.ledger import account_key
+
+CHUNK_SIZE = 1024 * 1024
+MAX_SEGMENT_LENGTH = 40
+_UNSAFE = re.compile(r'[\\/:*?"<>|\s]+')
+_EXTENSIONS = {"application/pdf": ".pdf", "image/jpeg": ".jpg", "image/png": ".png", "image/heic": ".heic"}
+
+# Extracted fields that make up the name, per category (empty ones are skipped)
+_NAME_FIELDS = {
+    DocumentCategory.LAND_BUILDING: ("address", "lot_number"),
+    DocumentCategory.LISTED_STOCK: ("stock_name", "securities_company"),
+    DocumentCategory.DEPOSIT: ("account_type", "financial_institution"),
+    DocumentCategory.LIFE_INSURANCE: ("policy_number", "insurance_company"),
+}
+
+# (ZIP内のファイル名, blobファイルのパス, サイズ, 更新日時)
+ArchiveEntry = Tuple[str, str, int, Tuple[int, int, int, int, int, int]]
+
+
+def _segment(value: object) -> str:
+    """ファイル名に使えない文字を除いた名前の1要素"""
+    return _UNSAFE.sub("", str(value))[:MAX_SEGMENT_LENGTH]
+
+
+def rename_content(doc: ProcessedDocument) -> str:
+    """リネーム後の名前の内容部分（抽出データがなければ元ファイル名）"""
+    if doc.category == DocumentCategory.PASSBOOK:
+        segments = [_segment(account_key(doc))]
+    else:
+        data = doc.extracted_data or {}
+        segments = [_segment(data.get(key) or "") for key in _NAME_FIELDS.get(doc.category, ())]
+    segments = [segment for segment in segments if segment]
+    return "_".join(segments) or _segment(os.path.splitext(doc.original_filename)[0]) or doc.id
+
+
+def renamed_filenames(docs: List[ProcessedDocument], mime_types: Optional[Dict[str, Optional[str]]] = None) -> Dict[str, str]:
+    """
+    書類IDごとのリネーム後ファイル名
+    連番は区分ごとに処理日時順で振るため、同じ案件内で名前が重複しない。拡張子は原本の形式（mime_types）に合わせる
+    """
+    sequences: Dict[DocumentCategory, int] = defaultdict(int)
+    names = {}
+    for doc in sorted(docs, key=lambda doc: (doc.processed_at, doc.original_filename, doc.id)):
+        sequences[doc.category] += 1
+        name = DocumentClassifier.get_rename_format(doc.category, rename_content(doc), sequence=sequences[doc.category])
+        extension = _EXTENSIONS.get((mime_types or {}).get(doc.id), ".pdf")
+        names[doc.id] = name[:-len(".pdf")] + extension
+    return names
+
+
+class _ZipSink(io.RawIOBase):
+    """
+    ZIPの書き込み先（シーク不可）
+    書き込まれたバイト列を溜めておき、drain()で取り出す。zipfileはシークできない出力では各ファイルの後ろにサイズとCRCを書く
+    """
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        # Offsets are still needed for the central directory
+        return self._position
+
+    def drain(self) -> List[bytes]:
+        chunks, self._chunks = self._chunks, []
+        return chunks
+
+
+def iter_zip(entries: Iterable[ArchiveEntry], extra_files: Iterable[Tuple[str, bytes]] = ()) -> Iterator[bytes]:
+    """
+    ファイルをZIPにまとめながら少しずつ返す（アーカイブ全体をメモリに持たない）
+    PDF・画像はほとんど圧縮できないため無圧縮で格納する
+    """
+    sink = _ZipSink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_STORED) as archive:
+        for name, path, size, date_time in entries:
+            info = zipfile.ZipInfo(name, date_time=date_time)
+            info.file_size = size  # lets zipfile decide on ZIP64 before writing the header
+            with open(path, "rb") as source, archive.open(info, "w") as target:
+                while True:
+                    chunk = source.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    target.write(chunk)
+                    yield from sink.drain()
+            metrics.increment("export.zip.bytes", size)
+            yield from sink.drain()
+        for name, data in extra_files:
+            archive.writestr(name, data)
+    yield from sink.drain()
+
+
+def iter_case_archive(docs: List[ProcessedDocument]) -> Iterator[bytes]:
+    """案件の書類の原本をリネーム後の名前でZIPにまとめる（末尾に元ファイル名との対応表を付ける）"""
+    infos = {doc.id: blob_store.info(doc.blob_id) if doc.blob_id else None for doc in docs}
+    names = renamed_filenames(docs, {doc_id: info["mime_type"] for doc_id, info in infos.items() if info})
+    entries: List[ArchiveEntry] = []
+    manifest = io.StringIO()
+    writer = csv.writer(manifest)
+    writer.writerow(["リネーム後ファイル", "元ファイル", "区分", "書類ID"])
+    for doc in docs:
+        info = infos[doc.id]
+        if info is None:
+            logger.warning(f"原本がないためZIPに含めません: {doc.original_filename} ({doc.id})")
+            writer.writerow(["", doc.original_filename, doc.category.value, doc.id])
+            continue
+        entries.append((names[doc.id], blob_store.path(doc.blob_id), info["size"], doc.processed_at.timetuple()[:6]))
+        writer.writerow([names[doc.id], doc.original_filename, doc.category.value, doc.id])
+    entries.sort(key=lambda entry: entry[0])
+
+    return iter_zip(entries, [("ファイル一覧.csv", manifest.getvalue().encode("utf-8-sig"))])
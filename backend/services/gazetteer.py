@@ -0,0 +1,100 @@
+import csv
+import os
+import unicodedata
+from bisect import bisect_left
+from threading import Lock
+from typing import Any, Dict, List, Optional, Tuple
+
+# 全国地方公共団体コード（総務省）: code, prefecture, city (empty for the prefecture itself)
+DATA_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "municipalities.csv")
+
+
+def _normalize(value: Any) -> str:
+    return "".join(unicodedata.normalize("NFKC", str(value or "")).split())
+
+
+class Gazetteer:
+    """
+    市区町村名から都道府県を推定するための索引（同梱の全国地方公共団体コードを初回使用時に読み込む）
+    名前を整列した配列に持ち、所在の文字列の先頭から長さを変えて二分探索することで前方一致する市区町村を探す
+    """
+
+    def __init__(self, path: str = DATA_PATH):
+        self.path = path
+        self._lock = Lock()
+        self._names: Optional[List[str]] = None
+        self._entries: List[List[Tuple[str, str]]] = []  # parallel to _names: [(code, prefecture)]
+        self._prefectures: List[Tuple[str, str]] = []  # (code, prefecture)
+        self._max_length = 0
+
+    def _load(self) -> List[str]:
+        with self._lock:
+            if self._names is None:
+                index: Dict[str, List[Tuple[str, str]]] = {}
+                with open(self.path, encoding="utf-8", newline="") as file:
+                    for row in csv.DictReader(file):
+                        if row["city"]:
+                            index.setdefault(row["city"], []).append((row["code"], row["prefecture"]))
+                        else:
+                            self._prefectures.append((row["code"], row["prefecture"]))
+                names = sorted(index)
+                self._entries = [index[name] for name in names]
+                self._max_length = max(len(name) for name in names)
+                self._names = names
+            return self._names
+
+    def prefectures(self) -> List[Dict[str, str]]:
+        """都道府県の一覧（コード順）"""
+        self._load()
+        return [{"code": code[:2], "prefecture": prefecture} for code, prefecture in self._prefectures]
+
+    def _longest_match(self, text: str) -> Optional[int]:
+        """textの先頭と一致する最も長い市区町村名の位置（政令市は「横浜市中区」の「横浜市」で一致する）"""
+        names = self._load()
+        for length in range(min(len(text), self._max_length), 0, -1):
+            position = bisect_left(names, text[:length])
+            if position < len(names) and names[position] == text[:length]:
+                return position
+        return None
+
+    def candidates(self, city: Any = None, address: Any = None) -> List[Dict[str, str]]:
+        """
+        市区町村・大字の記載から考えられる都道府県と市区町村（同名の市区町村があれば複数）
+        都道府県が書かれていればそれに絞り、郡名は除いて探す。見つからなければ空リスト
+        """
+        self._load()
+        text = _normalize(city) + _normalize(address)
+        written = next((prefecture for _, prefecture in self._prefectures if text.startswith(prefecture)), None)
+        if written:
+            text = text[len(written):]
+        position = self._longest_match(text)
+        if position is None and "郡" in text:
+            # Towns and villages are listed without their county ("北葛城郡王寺町" is "王寺町");
+            # tried second so that names like "大和郡山市" still match as a whole
+            position = self._longest_match(text[text.index("郡") + 1:])
+        if position is None:
+            return [{"code": "", "prefecture": written, "city": ""}] if written else []
+        return [
+            {"code": code, "prefecture": prefecture, "city": self._names[position]}
+            for code, prefecture in self._entries[position]
+            if written is None or prefecture == written
+        ]
+
+
+def fill_prefecture(data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    土地・建物の抽出データに都道府県がなければ市区町村から補う
+    候補が1つに決まらない場合は都道府県を空のままにし、候補をprefecture_candidatesに入れる（画面で選択する）
+    """
+    if data.get("prefecture"):
+        return data
+    candidates = gazetteer.candidates(data.get("city"), data.get("address"))
+    prefectures = list(dict.fromkeys(candidate["prefecture"] for candidate in candidates))
+    if len(prefectures) == 1:
+        data["prefecture"] = prefectures[0]
+    elif prefectures:
+        data["prefecture_candidates"] = prefectures
+    return data
+
+
+gazetteer = Gazetteer()
@@ -1,46 +1,305 @@
 import google.generativeai as genai
 import base64
-import json
 import tempfile
 import os
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, AsyncIterator, List, Optional
 from datetime import datetime
 from loguru import logger
 import asyncio
+import io
 import re
+import time
+from PIL import Image
 
 from core.config import settings
-from models.document import DocumentCategory, PassbookTransaction
+from models.document import DocumentCategory, PassbookTransaction, DepositData, StockData, LandBuildingData, LifeInsuranceData
+from services.model_router import ModelRouter
+from services.pdf_text import extract_text_layer, has_usable_text_layer, page_fingerprints, extract_pages
+from services.page_cache import page_result_store
+from services.json_stream import JSONArrayStream
+from services.passbook_strips import stitch_strips, strip_boxes
+from services.gazetteer import fill_prefecture
+from services.render_pool import render_pool
+from services.json_repair import TruncatedJSON, loads_tolerant
+from services.response_schema import (
+    DocumentSummary, ImageExtraction, PdfExtraction,
+    array_schema, json_generation_config, key_information_dict, schema_from_model
+)
+from core.metrics import metrics
+
+# 通帳1行あたりの出力トークン数の目安（JSONのキー名を含む）
+PASSBOOK_TOKENS_PER_ROW = 60
+
+# 書類タイプごとの抽出結果スキーマ（レスポンススキーマとモデル昇格判定に使用）
+DOCUMENT_SCHEMAS = {
+    DocumentCategory.DEPOSIT: DepositData,
+    DocumentCategory.LISTED_STOCK: StockData,
+    DocumentCategory.LIFE_INSURANCE: LifeInsuranceData,
+    DocumentCategory.LAND_BUILDING: LandBuildingData,
+}
+
+# Response schemas derived from the Pydantic models
+PASSBOOK_SCHEMA = array_schema(schema_from_model(PassbookTransaction, exclude=["ページ"]))
+PASSBOOK_PACK_SCHEMA = array_schema(schema_from_model(PassbookTransaction))
 
 class GeminiOCRService:
     def __init__(self):
         genai.configure(api_key=settings.GEMINI_API_KEY)
-        # Use the latest and most capable model for PDF processing
-        self.model = genai.GenerativeModel('gemini-2.0-flash-exp')
+        # Cheapest model first; escalate only when the result fails validation
+        self.router = ModelRouter()
         
-    async def process_passbook(self, image_base64: str, include_handwriting: bool = False) -> List[Dict[str, Any]]:
+    async def process_passbook(self, image_base64: str, include_handwriting: bool = False, tile: bool = False) -> List[Dict[str, Any]]:
         """
         通帳画像を処理して取引データを抽出
         既存の通帳.jsのロジックをPythonに移植
+        tile=Trueの場合、縦長の画像は重なりのある帯に分割して並列に処理する
         """
         try:
-            current_year = datetime.now().year
-            reiwa_start_year = 2019
-            current_reiwa_year = current_year - reiwa_start_year + 1
+            # Prepare the image
+            image_data = base64.b64decode(image_base64)
             
-            handwriting_instruction = (
-                "手書きの文字や数字も認識に含めてください。" if include_handwriting
-                else "手書きと思われる文字や数字は無視し、印字された文字を中心に認識してください。"
-            )
+            if tile:
+                boxes = self._plan_strips(image_data)
+                if len(boxes) > 1:
+                    return await self._process_passbook_strips(image_data, boxes, include_handwriting)
             
-            dakuten_instruction = """日本語の文字認識、特に濁点（゛）や半濁点（゜）の識別は非常に重要です。
-例えば、「シ」と「ジ」、「ハ」と「バ」と「パ」、「カ」と「ガ」、「タ」と「ダ」などを正確に見分けてください。"""
+            # Call Gemini API (parse, drop zero rows, then verify balances per tier)
+            routed = await self._generate_passbook(image_data, include_handwriting)
             
-            prompt = f"""この通帳の画像から取引明細を抽出してください。画像の最下部まで、全ての行を注意深く読み取ってください。
+            if routed.value is None:
+                raise ValueError(f"通帳OCRの結果を解析できませんでした: {routed.escalation_reasons[-1]}")
+            
+            if routed.truncated:
+                logger.warning(f"出力が途中で切れたため、読み取れた{len(routed.value)}行のみ返します。")
+            elif not routed.accepted:
+                logger.warning("残高検算が一致しませんでした。")
+            
+            return routed.value
+            
+        except Exception as e:
+            logger.error(f"通帳OCR処理エラー: {str(e)}")
+            raise
+    
+    def _plan_strips(self, image_data: bytes) -> List[tuple]:
+        """帯に分割する範囲（分割不要・画像サイズを読めない場合は1つ以下）"""
+        try:
+            width, height = Image.open(io.BytesIO(image_data)).size
+        except Exception:
+            return []
+        strip_height = int(width * settings.PASSBOOK_STRIP_HEIGHT_RATIO)
+        overlap = int(strip_height * settings.PASSBOOK_STRIP_OVERLAP_RATIO)
+        return strip_boxes(width, height, strip_height, overlap)
+    
+    async def _process_passbook_strips(self, image_data: bytes, boxes: List[tuple], include_handwriting: bool) -> List[Dict[str, Any]]:
+        """帯ごとに並列で処理し、重なり部分の重複行を除いてつなぐ"""
+        strips = await render_pool.image_strips(image_data, boxes)
+        results = await asyncio.gather(*[
+            self._generate_passbook(strip, include_handwriting, strip=True) for strip in strips
+        ])
+        for index, routed in enumerate(results):
+            if routed.value is None:
+                raise ValueError(f"通帳OCRの結果を解析できませんでした（帯{index + 1}）: {routed.escalation_reasons[-1]}")
+        
+        transactions = stitch_strips([routed.value for routed in results])
+        metrics.observe("passbook.strips", len(strips))
+        logger.info(f"通帳画像を{len(strips)}個の帯に分割して処理: {sum(len(routed.value) for routed in results)}行 -> {len(transactions)}行")
+        if not self._verify_balances(transactions):
+            logger.warning("帯をつないだ結果の残高検算が一致しませんでした。")
+        return transactions
+    
+    async def _generate_passbook(self, image_data: bytes, include_handwriting: bool, tiers: Optional[List[str]] = None, strip: bool = False):
+        return await self.router.generate(
+            "passbook",
+            [self._get_passbook_prompt(include_handwriting, strip=strip), {"mime_type": "image/jpeg", "data": image_data}],
+            generation_config=self._passbook_generation_config(),
+            parse=self._parse_passbook,
+            validate=self._check_passbook,
+            tiers=tiers
+        )
+    
+    def _passbook_generation_config(self) -> Dict[str, Any]:
+        return json_generation_config(PASSBOOK_SCHEMA)
+    
+    async def stream_passbook(self, image_data: bytes, include_handwriting: bool = False) -> AsyncIterator[Dict[str, Any]]:
+        """
+        通帳画像の取引を、モデルの出力中に1行ずつイベントとして返す
+        イベント: transaction（取引1行）、reset（検証失敗で上位モデルの結果に置き換える前に送る）、done（完了）
+        最も安価なモデルの出力が途中で壊れた・残高検算が合わない場合は、上位モデルで再処理した結果を送り直す
+        """
+        started = time.perf_counter()
+        parser = JSONArrayStream()
+        transactions: List[Dict[str, Any]] = []
+        model_name = self.router.tiers[0]
+        reason = None
+        
+        try:
+            async for chunk in self.router.stream(
+                "passbook",
+                [self._get_passbook_prompt(include_handwriting), {"mime_type": "image/jpeg", "data": image_data}],
+                generation_config=self._passbook_generation_config(),
+                model_name=model_name
+            ):
+                for item in parser.feed(chunk):
+                    if not isinstance(item, dict) or not self._filter_zero_transactions([item]):
+                        continue
+                    if not transactions:
+                        metrics.observe("passbook.stream.first_transaction_seconds", time.perf_counter() - started)
+                    transactions.append(item)
+                    yield {"type": "transaction", "transaction": item}
+            if not parser.closed:
+                reason = "truncated"
+        except Exception as e:
+            reason = f"stream_error: {e}"
+        
+        reason = reason or self._check_passbook(transactions)
+        if reason is None:
+            yield {"type": "done", "count": len(transactions), "verified": True, "model": model_name}
+            return
+        
+        # Rows already sent cannot be validated retroactively: re-run on the higher tiers and resend
+        logger.info(f"ストリーミング結果を破棄して再処理します ({model_name}): {reason}")
+        metrics.increment("passbook.stream.reset")
+        yield {"type": "reset", "reason": reason}
+        tiers = self.router.tiers[1:] or self.router.tiers
+        routed = await self._generate_passbook(image_data, include_handwriting, tiers=tiers)
+        if routed.value is None:
+            raise ValueError(f"通帳OCRの結果を解析できませんでした: {routed.escalation_reasons[-1]}")
+        for item in routed.value:
+            yield {"type": "transaction", "transaction": item}
+        yield {"type": "done", "count": len(routed.value), "verified": routed.accepted, "model": routed.model_name}
+    
+    async def process_passbook_pages(self, pages: List[bytes], include_handwriting: bool = False) -> List[Dict[str, Any]]:
+        """
+        複数ページの通帳画像（ページ順のJPEG）を処理して取引データを抽出
+        長いプロンプトを毎ページ送らないよう、出力トークン上限に収まる枚数ずつ1リクエストにまとめる
+        各取引には通し番号の「ページ」を付与する
+        """
+        transactions: List[Dict[str, Any]] = []
+        for start, count in self._plan_page_packs(pages):
+            transactions.extend(await self._process_page_pack(pages, start, count, include_handwriting))
+        
+        if not self._verify_balances(transactions):
+            logger.warning("ページをまたいだ残高検算が一致しませんでした。")
+        return transactions
+    
+    async def _process_page_pack(self, pages: List[bytes], start: int, count: int, include_handwriting: bool) -> List[Dict[str, Any]]:
+        """ページのまとまりを1リクエストで処理（解析できない場合は半分に分割して再試行）"""
+        if count == 1:
+            rows = await self.process_passbook(base64.b64encode(pages[start]).decode('utf-8'), include_handwriting)
+            return [dict(row, ページ=start + 1) for row in rows]
+        
+        contents: List[Any] = [self._get_passbook_prompt(include_handwriting, page_count=count)]
+        for offset in range(count):
+            contents.append(f"ページ{offset + 1}")
+            contents.append({"mime_type": "image/jpeg", "data": pages[start + offset]})
+        
+        routed = await self.router.generate(
+            "passbook_pack",
+            contents,
+            generation_config=json_generation_config(
+                PASSBOOK_PACK_SCHEMA,
+                max_output_tokens=settings.PASSBOOK_MAX_OUTPUT_TOKENS
+            ),
+            parse=self._parse_passbook,
+            validate=lambda rows: self._check_passbook(rows) or self._check_page_numbers(rows, count)
+        )
+        
+        if routed.value is None or routed.truncated or self._check_page_numbers(routed.value, count):
+            # Most likely truncated output: halve the pack and try again
+            half = count // 2
+            logger.info(f"通帳ページのまとめ処理に失敗したため分割します: {count} -> {half} + {count - half}")
+            metrics.increment("passbook_pack.split")
+            return (
+                await self._process_page_pack(pages, start, half, include_handwriting) +
+                await self._process_page_pack(pages, start + half, count - half, include_handwriting)
+            )
+        
+        metrics.observe("passbook_pack.pages_per_request", count)
+        return [dict(row, ページ=start + int(row["ページ"])) for row in routed.value]
+    
+    def _check_page_numbers(self, transactions: List[Dict[str, Any]], page_count: int) -> Optional[str]:
+        """まとめ処理の結果に正しいページ番号が付いているかを検証"""
+        for row in transactions:
+            try:
+                page = int(row.get("ページ"))
+            except (TypeError, ValueError):
+                return "schema_error"
+            if not 1 <= page <= page_count:
+                return "schema_error"
+        return None
+    
+    def _plan_page_packs(self, pages: List[bytes]) -> List[tuple]:
+        """
+        ページを (開始位置, 枚数) のまとまりに分割
+        縦長のページほど行数が多いとみなし、推定出力トークンと送信バイト数が上限に収まる範囲でまとめる
+        """
+        token_budget = settings.PASSBOOK_MAX_OUTPUT_TOKENS * 0.8  # leave headroom for estimation error
+        packs = []
+        start, tokens, size = 0, 0.0, 0
+        for index, data in enumerate(pages):
+            page_tokens = self._estimate_page_output_tokens(data)
+            count = index - start
+            if count and (
+                count >= settings.PASSBOOK_PACK_MAX_PAGES
+                or tokens + page_tokens > token_budget
+                or size + len(data) > settings.PASSBOOK_PACK_MAX_BYTES
+            ):
+                packs.append((start, count))
+                start, tokens, size = index, 0.0, 0
+            tokens += page_tokens
+            size += len(data)
+        if start < len(pages):
+            packs.append((start, len(pages) - start))
+        return packs
+    
+    def _estimate_page_output_tokens(self, data: bytes) -> float:
+        """ページ画像の縦横比から出力トークン数を推定"""
+        try:
+            width, height = Image.open(io.BytesIO(data)).size
+            elongation = max(1.0, (height / width) / 1.4)  # a passbook page is about 1.4:1
+        except Exception:
+            elongation = 1.0
+        rows = settings.PASSBOOK_ROWS_PER_PAGE * elongation
+        return rows * PASSBOOK_TOKENS_PER_ROW
+    
+    def _get_passbook_prompt(self, include_handwriting: bool, page_count: int = 1, strip: bool = False) -> str:
+        """通帳OCRのプロンプト（複数ページをまとめる場合はページ番号の出力を追加、帯の場合は端で切れた行を除外）"""
+        current_year = datetime.now().year
+        reiwa_start_year = 2019
+        current_reiwa_year = current_year - reiwa_start_year + 1
+        
+        handwriting_instruction = (
+            "手書きの文字や数字も認識に含めてください。" if include_handwriting
+            else "手書きと思われる文字や数字は無視し、印字された文字を中心に認識してください。"
+        )
+        
+        dakuten_instruction = """日本語の文字認識、特に濁点（゛）や半濁点（゜）の識別は非常に重要です。
+例えば、「シ」と「ジ」、「ハ」と「バ」と「パ」、「カ」と「ガ」、「タ」と「ダ」などを正確に見分けてください。"""
+        
+        if page_count > 1:
+            target = (
+                f"以下の{page_count}枚の通帳ページ画像（「ページ1」〜「ページ{page_count}」の見出しに続き、ページ順に並んでいます）から取引明細を抽出してください。"
+                "各画像の最下部まで、全ての行を注意深く読み取り、ページ順・行順に出力してください。"
+            )
+            page_field = "、ページ（その取引が記載された画像の見出しの番号、半角整数）"
+            page_example = '\n    "ページ": 1,'
+        elif strip:
+            target = (
+                "この画像は通帳ページを横長の帯に切り出したものです。帯に写っている取引明細を全て抽出してください。"
+                "帯の上端・下端で途切れて一部しか写っていない行は出力しないでください。"
+            )
+            page_field = ""
+            page_example = ""
+        else:
+            target = "この通帳の画像から取引明細を抽出してください。画像の最下部まで、全ての行を注意深く読み取ってください。"
+            page_field = ""
+            page_example = ""
+        
+        return f"""{target}
 {dakuten_instruction}
 
 以下のJSONスキーマに厳密に従って結果を返してください。
-各取引について、取引日（yyyy-mm-dd形式、不明な場合はnull）、出金額（半角整数、該当なければ0）、入金額（半角整数、該当なければ0）、残高（半角整数、不明な場合はnull）、取引内容（文字列、摘要など、不明な場合は空文字）を抽出してください。
+各取引について、取引日（yyyy-mm-dd形式、不明な場合はnull）、出金額（半角整数、該当なければ0）、入金額（半角整数、該当なければ0）、残高（半角整数、不明な場合はnull）、取引内容（文字列、摘要など、不明な場合は空文字）{page_field}を抽出してください。
 
 日付の年は西暦 (yyyy-mm-dd形式) でお願いします。
 現在の西暦年は {current_year}年 (令和{current_reiwa_year}年) です。
@@ -51,7 +310,7 @@ class GeminiOCRService:
 
 出力形式:
 [
-  {{
+  {{{page_example}
     "取引日": "yyyy-mm-dd",
     "出金額": 0,
     "入金額": 0,
@@ -59,38 +318,34 @@ class GeminiOCRService:
     "取引内容": ""
   }}
 ]"""
-            
-            # Prepare the image
-            image_data = base64.b64decode(image_base64)
-            
-            # Call Gemini API
-            response = self.model.generate_content([
-                prompt,
-                {"mime_type": "image/jpeg", "data": image_data}
-            ], generation_config={
-                "temperature": 0.1,
-                "response_mime_type": "application/json"
-            })
-            
-            # Parse response
-            result = json.loads(response.text)
-            
-            # Filter out zero transactions
-            filtered_result = [
-                item for item in result
-                if not (item.get("出金額", 0) == 0 and item.get("入金額", 0) == 0)
-            ]
-            
-            # Verify balances
-            if not self._verify_balances(filtered_result):
-                logger.warning("残高検算が一致しませんでした。再分析を試みます。")
-                # 再分析ロジックをここに実装可能
-            
-            return filtered_result
-            
-        except Exception as e:
-            logger.error(f"通帳OCR処理エラー: {str(e)}")
-            raise
+    
+    def _parse_passbook_response(self, text: str) -> List[Dict[str, Any]]:
+        """通帳OCRのレスポンスJSONを取引リストに変換（軽微な崩れは修復する）"""
+        return loads_tolerant(text)
+    
+    def _parse_passbook(self, text: str) -> List[Dict[str, Any]]:
+        """レスポンスを解析して繰越行などを除外（途中で切れた場合も読み取れた行は除外処理して渡す）"""
+        try:
+            transactions = self._parse_passbook_response(text)
+        except TruncatedJSON as e:
+            partial = e.partial if isinstance(e.partial, list) else []
+            raise TruncatedJSON(str(e), self._filter_zero_transactions(partial)) from e
+        return self._filter_zero_transactions(transactions)
+    
+    def _filter_zero_transactions(self, transactions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """出金額・入金額がともに0の行（繰越行など）を除外"""
+        return [
+            item for item in transactions
+            if not (item.get("出金額", 0) == 0 and item.get("入金額", 0) == 0)
+        ]
+    
+    def _check_passbook(self, transactions: Any) -> Optional[str]:
+        """通帳OCR結果の検証（問題があれば昇格理由を返す）"""
+        if not isinstance(transactions, list) or not all(isinstance(item, dict) for item in transactions):
+            return "schema_error"
+        if not self._verify_balances(transactions):
+            return "balance_mismatch"
+        return None
     
     def _verify_balances(self, transactions: List[Dict[str, Any]]) -> bool:
         """残高検算を行う"""
@@ -119,65 +374,72 @@ class GeminiOCRService:
                 
         return True
     
-    async def extract_text_from_pdf(self, pdf_content: bytes) -> Dict[str, Any]:
+    async def extract_text_from_pdf(self, pdf_content: bytes, case_id: Optional[str] = None) -> Dict[str, Any]:
         """
         PDFファイルからテキストを抽出（Geminiのファイルアップロード機能を使用）
+        変更のないページは同じ案件の前回の結果をページ指紋で再利用し、新規・変更ページのみOCRする
         """
-        import tempfile
-        import os
-
         try:
             logger.info(f"Processing PDF, size: {len(pdf_content)} bytes")
 
-            # Create temporary file for PDF
-            with tempfile.NamedTemporaryFile(mode='wb', suffix='.pdf', delete=False) as tmp_file:
-                tmp_file.write(pdf_content)
-                tmp_path = tmp_file.name
-
-            try:
-                # Upload PDF to Gemini
-                logger.info(f"Uploading PDF to Gemini...")
-                pdf_file = genai.upload_file(tmp_path, mime_type="application/pdf")
-                logger.info(f"PDF uploaded: {pdf_file.name}")
-
-                prompt = """このPDFファイルから以下の情報を抽出してJSON形式で返してください：
-                1. 文書の種類（登記簿謄本、残高証明書、保険証券、通帳など）
-                2. 主要な情報（金額、日付、名前、住所、取引記録など）
-                3. その他重要と思われる情報
-
-                特に数値データは正確に抽出してください。
-
-                出力形式:
-                {
-                    "document_type": "文書種類",
-                    "extracted_text": "抽出したテキスト全体",
-                    "key_information": {
-                        // 文書に応じた重要情報
+            # Born-digital PDFs: read the embedded text layer instead of uploading for vision OCR
+            # (PDF parsing runs in a thread so it does not block the event loop)
+            text_pages = await asyncio.to_thread(extract_text_layer, pdf_content)
+            if has_usable_text_layer(text_pages):
+                metrics.increment("pdf.text_layer.hit")
+                logger.info(f"Using PDF text layer ({len(text_pages)} pages), skipping vision OCR")
+                return await self._extract_from_text_layer(text_pages)
+            metrics.increment("pdf.text_layer.miss")
+
+            # Only new or changed pages go to the model; the rest are reassembled from the page store
+            fingerprints = await asyncio.to_thread(page_fingerprints, pdf_content)
+            # (the page store is files on disk, read and written off the event loop)
+            page_results = await asyncio.to_thread(page_result_store.get_many, fingerprints, case_id)
+            missing = [number for number, cached in enumerate(page_results) if cached is None]
+            metrics.increment("pdf.pages.reused", len(fingerprints) - len(missing))
+            metrics.increment("pdf.pages.ocr", len(missing))
+
+            if fingerprints and not missing:
+                logger.info(f"All {len(fingerprints)} pages found in page store, skipping OCR")
+                return self._assemble_pdf_result(page_results, reused=len(fingerprints))
+
+            if fingerprints and len(missing) < len(fingerprints):
+                logger.info(f"Re-OCR {len(missing)} of {len(fingerprints)} pages (others unchanged)")
+                upload_content = extract_pages(pdf_content, missing)
+            else:
+                upload_content = pdf_content
+
+            routed = await self._generate_from_pdf_upload(upload_content, len(missing) or None)
+
+            if routed.accepted and isinstance(routed.value, dict):
+                fresh = {}
+                for number, page_result in zip(missing, routed.value["pages"]):
+                    page_result = {
+                        "document_type": routed.value.get("document_type"),
+                        "extracted_text": page_result.get("extracted_text", ""),
+                        "key_information": page_result.get("key_information") or {}
                     }
-                }"""
-
-                # Generate content with uploaded file
-                response = self.model.generate_content([prompt, pdf_file])
-
-                # Delete uploaded file from Gemini
-                genai.delete_file(pdf_file.name)
-                logger.info("PDF deleted from Gemini")
-
-            finally:
-                # Clean up temporary file
-                if os.path.exists(tmp_path):
-                    os.remove(tmp_path)
-
-            # Try to parse JSON response
-            try:
-                import json
-                result = json.loads(response.text)
-                result["success"] = True
-            except:
+                    page_results[number] = page_result
+                    fresh[fingerprints[number]] = page_result
+                await asyncio.to_thread(page_result_store.put_many, fresh, case_id)
+                if not fingerprints:
+                    page_results = [
+                        dict(page, document_type=routed.value.get("document_type"))
+                        for page in routed.value["pages"]
+                    ]
+                result = self._assemble_pdf_result(page_results, reused=len(fingerprints) - len(missing))
+            elif isinstance(routed.value, dict):
+                # Page split did not come back as requested: use the result as-is without caching
+                pages = routed.value.get("pages") or []
+                result = self._assemble_pdf_result(
+                    [dict(page, document_type=routed.value.get("document_type")) for page in pages if isinstance(page, dict)],
+                    reused=0
+                )
+            else:
                 # If not JSON, return as text
                 result = {
                     "document_type": "PDF",
-                    "extracted_text": response.text,
+                    "extracted_text": routed.text,
                     "success": True
                 }
 
@@ -192,6 +454,149 @@ class GeminiOCRService:
                 "extracted_text": ""
             }
 
+    async def _generate_from_pdf_upload(self, pdf_content: bytes, page_count: Optional[int]):
+        """PDFをGeminiにアップロードし、ページごとの抽出結果を生成"""
+        # Create temporary file for PDF
+        with tempfile.NamedTemporaryFile(mode='wb', suffix='.pdf', delete=False) as tmp_file:
+            tmp_file.write(pdf_content)
+            tmp_path = tmp_file.name
+
+        try:
+            # Upload PDF to Gemini
+            logger.info(f"Uploading PDF to Gemini...")
+            pdf_file = await asyncio.to_thread(genai.upload_file, tmp_path, mime_type="application/pdf")
+            logger.info(f"PDF uploaded: {pdf_file.name}")
+
+            prompt = """このPDFファイルから以下の情報をページごとに抽出してJSON形式で返してください：
+            1. 文書の種類（登記簿謄本、残高証明書、保険証券、通帳など）
+            2. 主要な情報（金額、日付、名前、住所、取引記録など）
+            3. その他重要と思われる情報
+
+            特に数値データは正確に抽出してください。
+            pagesにはPDFの全ページをページ順に1件ずつ含めてください。
+
+            出力形式:
+            {
+                "document_type": "文書種類",
+                "pages": [
+                    {
+                        "page": 1,
+                        "extracted_text": "そのページから抽出したテキスト全体",
+                        "key_information": [
+                            {"name": "項目名", "value": "そのページに記載された重要情報の値"}
+                        ]
+                    }
+                ]
+            }"""
+
+            # Generate content with uploaded file
+            try:
+                return await self.router.generate(
+                    "pdf",
+                    [prompt, pdf_file],
+                    generation_config=json_generation_config(schema_from_model(PdfExtraction)),
+                    parse=self._parse_pdf_pages,
+                    validate=lambda value: self._check_pdf_pages(value, page_count)
+                )
+            finally:
+                # Delete uploaded file from Gemini
+                await asyncio.to_thread(genai.delete_file, pdf_file.name)
+                logger.info("PDF deleted from Gemini")
+
+        finally:
+            # Clean up temporary file
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _parse_pdf_pages(self, text: str) -> Any:
+        """ページごとの抽出結果を解析し、重要情報を項目名をキーとするオブジェクトにする"""
+        try:
+            value = loads_tolerant(text)
+        except TruncatedJSON as e:
+            raise TruncatedJSON(str(e), self._normalize_pages(e.partial)) from e
+        return self._normalize_pages(value)
+
+    def _normalize_pages(self, value: Any) -> Any:
+        if isinstance(value, dict) and isinstance(value.get("pages"), list):
+            for page in value["pages"]:
+                if isinstance(page, dict):
+                    page["key_information"] = key_information_dict(page.get("key_information"))
+        return value
+
+    def _check_pdf_pages(self, value: Any, page_count: Optional[int]) -> Optional[str]:
+        """ページごとの抽出結果の形式とページ数を検証"""
+        if not isinstance(value, dict) or not isinstance(value.get("pages"), list):
+            return "schema_error"
+        if not all(isinstance(page, dict) for page in value["pages"]):
+            return "schema_error"
+        if page_count is not None and len(value["pages"]) != page_count:
+            return f"page_count_mismatch: {len(value['pages'])} != {page_count}"
+        return None
+
+    def _assemble_pdf_result(self, page_results: List[Dict[str, Any]], reused: int) -> Dict[str, Any]:
+        """
+        ページごとの結果を書類単位の結果（従来の形式）に組み立てる
+        重要情報は先のページの値を採り、後のページで値の異なる項目は key_information_conflicts に全ページの値を残す
+        """
+        key_information: Dict[str, Any] = {}
+        conflicts: Dict[str, List[Any]] = {}
+        for page in page_results:
+            for key, value in (page.get("key_information") or {}).items():
+                if key not in key_information:
+                    key_information[key] = value
+                elif value != key_information[key]:
+                    values = conflicts.setdefault(key, [key_information[key]])
+                    if value not in values:
+                        values.append(value)
+        document_types = [page.get("document_type") for page in page_results if page.get("document_type")]
+        return {
+            "document_type": document_types[0] if document_types else "PDF",
+            "extracted_text": "\n\n".join(page.get("extracted_text", "") for page in page_results),
+            "key_information": key_information,
+            "page_count": len(page_results),
+            "reused_pages": reused,
+            **({"key_information_conflicts": conflicts} if conflicts else {}),
+            "success": True
+        }
+
+    async def _extract_from_text_layer(self, text_pages: List[str]) -> Dict[str, Any]:
+        """
+        テキストレイヤーから文書種類と重要情報を抽出（画像を送らないテキストのみのプロンプト）
+        extracted_textはローカルで抽出した本文をそのまま使い、出力トークンを節約する
+        """
+        extracted_text = "\n\n".join(text_pages)
+        prompt = f"""以下はPDFから抽出したテキストです。この内容から以下の情報を抽出してJSON形式で返してください：
+1. 文書の種類（登記簿謄本、残高証明書、保険証券、通帳など）
+2. 主要な情報（金額、日付、名前、住所、取引記録など）
+3. その他重要と思われる情報
+
+特に数値データは正確に抽出してください。本文の再出力は不要です。
+
+出力形式:
+{{
+    "document_type": "文書種類",
+    "key_information": [
+        {{"name": "項目名", "value": "文書に応じた重要情報の値"}}
+    ]
+}}
+
+--- PDFテキスト ---
+{extracted_text}"""
+
+        routed = await self.router.generate(
+            "pdf_text",
+            [prompt],
+            generation_config=json_generation_config(schema_from_model(DocumentSummary)),
+            validate=self._check_object
+        )
+
+        result = routed.value if isinstance(routed.value, dict) else {"document_type": "PDF"}
+        result["key_information"] = key_information_dict(result.get("key_information"))
+        result["extracted_text"] = extracted_text
+        result["source"] = "text_layer"
+        result["success"] = True
+        return result
+
     async def extract_text_from_image(self, image_content: bytes) -> Dict[str, Any]:
         """
         画像ファイルからテキストを抽出
@@ -210,7 +615,7 @@ class GeminiOCRService:
             try:
                 # Upload image to Gemini
                 logger.info(f"Uploading image to Gemini...")
-                image_file = genai.upload_file(tmp_path, mime_type="image/jpeg")
+                image_file = await asyncio.to_thread(genai.upload_file, tmp_path, mime_type="image/jpeg")
                 logger.info(f"Image uploaded: {image_file.name}")
 
                 prompt = """この画像から全てのテキストを抽出してJSON形式で返してください。
@@ -219,31 +624,39 @@ class GeminiOCRService:
                 出力形式:
                 {
                     "extracted_text": "抽出したテキスト",
-                    "document_type": "推測される文書タイプ"
+                    "document_type": "推測される文書タイプ",
+                    "key_information": [
+                        {"name": "項目名", "value": "値"}
+                    ]
                 }"""
 
                 # Generate content with uploaded file
-                response = self.model.generate_content([prompt, image_file])
-
-                # Delete uploaded file from Gemini
-                genai.delete_file(image_file.name)
-                logger.info("Image deleted from Gemini")
+                try:
+                    routed = await self.router.generate(
+                        "image",
+                        [prompt, image_file],
+                        generation_config=json_generation_config(schema_from_model(ImageExtraction)),
+                        validate=self._check_object
+                    )
+                finally:
+                    # Delete uploaded file from Gemini
+                    await asyncio.to_thread(genai.delete_file, image_file.name)
+                    logger.info("Image deleted from Gemini")
 
             finally:
                 # Clean up temporary file
                 if os.path.exists(tmp_path):
                     os.remove(tmp_path)
 
-            # Try to parse JSON response
-            try:
-                import json
-                result = json.loads(response.text)
+            if isinstance(routed.value, dict):
+                result = routed.value
+                result["key_information"] = key_information_dict(result.get("key_information"))
                 result["success"] = True
-            except:
+            else:
                 # If not JSON, return as text
                 result = {
                     "document_type": "IMAGE",
-                    "extracted_text": response.text,
+                    "extracted_text": routed.text,
                     "success": True
                 }
 
@@ -277,20 +690,43 @@ class GeminiOCRService:
         try:
             image_data = base64.b64decode(image_base64)
             
-            response = self.model.generate_content([
-                prompt,
-                {"mime_type": "image/jpeg", "data": image_data}
-            ], generation_config={
-                "temperature": 0.1,
-                "response_mime_type": "application/json"
-            })
+            routed = await self.router.generate(
+                f"document.{document_type.name.lower()}",
+                [prompt, {"mime_type": "image/jpeg", "data": image_data}],
+                generation_config=json_generation_config(schema_from_model(DOCUMENT_SCHEMAS[document_type])),
+                validate=lambda value: self._check_document(document_type, value)
+            )
+            
+            if not isinstance(routed.value, dict):
+                raise ValueError(f"書類OCRの結果を解析できませんでした: {routed.escalation_reasons[-1]}")
+            if not routed.accepted:
+                logger.warning(f"書類OCRの結果がスキーマを満たしていません ({document_type}): {routed.escalation_reasons[-1]}")
+            if document_type == DocumentCategory.LAND_BUILDING:
+                # Usually not written on the document: inferred from the city without a model call
+                fill_prefecture(routed.value)
             
-            return json.loads(response.text)
+            return routed.value
             
         except Exception as e:
             logger.error(f"書類OCR処理エラー ({document_type}): {str(e)}")
             raise
     
+    def _check_object(self, value: Any) -> Optional[str]:
+        """JSONオブジェクトであることを検証"""
+        return None if isinstance(value, dict) else "schema_error"
+    
+    def _check_document(self, document_type: DocumentCategory, value: Any) -> Optional[str]:
+        """書類タイプのスキーマに照らして抽出結果を検証"""
+        if not isinstance(value, dict):
+            return "schema_error"
+        schema = DOCUMENT_SCHEMAS.get(document_type)
+        if schema is not None:
+            try:
+                schema.parse_obj(value)
+            except Exception:
+                return "schema_error"
+        return None
+    
     def _get_deposit_prompt(self) -> str:
         return """この残高証明書の画像から以下の情報を抽出してJSON形式で返してください：
 - 金融機関名
@@ -299,6 +735,7 @@ class GeminiOCRService:
 - 口座番号
 - 残高
 - 既経過利子（定期預金の場合）
+- 証明日（残高の基準日、YYYY-MM-DD形式）
 
 出力形式:
 {
@@ -307,7 +744,8 @@ class GeminiOCRService:
   "account_type": "預金種類",
   "account_number": "口座番号",
   "balance": 残高金額,
-  "accrued_interest": 既経過利子
+  "accrued_interest": 既経過利子,
+  "certificate_date": "YYYY-MM-DD"
 }"""
     
     def _get_stock_prompt(self) -> str:
@@ -352,7 +790,8 @@ class GeminiOCRService:
     
     def _get_land_building_prompt(self) -> str:
         return """この登記簿謄本・名寄帳・固定資産税通知書から以下の情報を抽出してJSON形式で返してください：
-- 所在地（都道府県、市区町村、大字・丁目）
+- 書類の種類（登記簿、名寄帳、固定資産税通知書、評価証明書のいずれか）
+- 所在地（都道府県、市区町村、大字・丁目）。都道府県は書類に記載がある場合のみ（推測しない）
 - 地番
 - 家屋番号
 - 登記地目（登記簿の場合）
@@ -365,6 +804,7 @@ class GeminiOCRService:
 
 出力形式:
 {
+  "document_type": "書類の種類",
   "prefecture": "都道府県",
   "city": "市区町村",
   "address": "大字・丁目",
@@ -0,0 +1,118 @@
+import json
+import re
+from typing import Any, List, Optional, Tuple
+
+from core.metrics import metrics
+
+# Python / JavaScript literals the model sometimes emits instead of JSON ones
+_LITERALS = {"None": "null", "True": "true", "False": "false", "NaN": "null", "undefined": "null"}
+_WORD = re.compile(r"[A-Za-z_]+")
+_FENCE = re.compile(r"^\s*```[a-zA-Z]*\s*|\s*```\s*$")
+
+
+class TruncatedJSON(ValueError):
+    """出力が途中で切れたJSON（partialに復元できた先頭部分を持つ）"""
+
+    def __init__(self, message: str, partial: Any):
+        super().__init__(message)
+        self.partial = partial
+
+
+def repair_json(text: str) -> Tuple[str, bool]:
+    """
+    よくある崩れを修復したJSON文字列と、途中で切れていたかどうかを返す
+    修復内容: 前後の説明文・コードフェンス、コメント、末尾カンマ、None/True/False、
+    途中で切れた出力（最後に完成した要素までで切り、開いている括弧を閉じる）
+    """
+    text = _FENCE.sub("", text.strip())
+    starts = [position for position in (text.find("{"), text.find("[")) if position >= 0]
+    if not starts:
+        return text, False
+    text = text[min(starts):]
+
+    out: List[str] = []
+    stack: List[str] = []
+    # Last point where cutting gives a usable prefix: (length of out, open brackets).
+    # Only element boundaries of arrays and of the root object count, so a truncated
+    # row is dropped rather than returned with missing keys.
+    safe: Optional[Tuple[int, List[str]]] = None
+
+    def at_boundary() -> bool:
+        return bool(stack) and (stack[-1] == "]" or len(stack) == 1)
+
+    position = 0
+    length = len(text)
+    while position < length:
+        char = text[position]
+        if char == '"':
+            end = position + 1
+            while end < length and text[end] != '"':
+                end += 2 if text[end] == "\\" else 1
+            if end >= length:
+                break  # unterminated string: truncated
+            out.append(text[position:end + 1])
+            position = end + 1
+            continue
+        if text.startswith("//", position):
+            newline = text.find("\n", position)
+            position = length if newline < 0 else newline
+            continue
+        if char in "{[":
+            stack.append("}" if char == "{" else "]")
+            out.append(char)
+            if char == "[":
+                safe = (len(out), list(stack))
+        elif char in "}]":
+            # Drop a trailing comma before the closing bracket
+            while out and out[-1].strip() in ("", ","):
+                if out.pop().strip() == ",":
+                    break
+            if stack:
+                out.append(stack.pop())
+            if not stack:
+                break
+            if at_boundary():
+                safe = (len(out), list(stack))
+        elif char == ",":
+            if at_boundary():
+                safe = (len(out), list(stack))
+            out.append(char)
+        else:
+            match = _WORD.match(text, position)
+            if match:
+                word = match.group()
+                out.append(_LITERALS.get(word, word))
+                position = match.end()
+                continue
+            out.append(char)
+        position += 1
+
+    if not stack:
+        return "".join(out), False
+    if safe is None:
+        return "", True
+    size, open_brackets = safe
+    return "".join(out[:size]) + "".join(reversed(open_brackets)), True
+
+
+def loads_tolerant(text: str) -> Any:
+    """
+    JSONを解析し、失敗した場合は修復して再解析する
+    途中で切れていた場合は復元できた先頭部分を持つTruncatedJSONを送出する
+    """
+    try:
+        return json.loads(text)
+    except ValueError:
+        pass
+
+    repaired, truncated = repair_json(text)
+    try:
+        value = json.loads(repaired)
+    except ValueError:
+        metrics.increment("json_repair.failed")
+        raise
+    if truncated:
+        metrics.increment("json_repair.truncated")
+        raise TruncatedJSON("output truncated", value)
+    metrics.increment("json_repair.repaired")
+    return value
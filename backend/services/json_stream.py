@@ -0,0 +1,63 @@
+import json
+from typing import Any, List
+
+
+class JSONArrayStream:
+    """
+    JSON配列の逐次パーサー
+    ストリーミング出力をfeed()で受け取り、配列直下のオブジェクトが閉じた時点でそれを返す。
+    配列の前の文字（```json などのコードフェンス）は読み飛ばす
+    """
+
+    def __init__(self):
+        self.started = False  # saw the opening "["
+        self.closed = False  # saw the closing "]"
+        self.count = 0
+        self._buffer: List[str] = []  # text of the object being read
+        self._depth = 0  # nesting depth inside the array
+        self._in_string = False
+        self._escaped = False
+
+    def feed(self, chunk: str) -> List[Any]:
+        """チャンクを読み込み、このチャンクで完成した要素のリストを返す"""
+        completed = []
+        start = 0 if self._depth else None
+        for position, char in enumerate(chunk):
+            if self.closed:
+                break
+            if not self.started:
+                if char == "[":
+                    self.started = True
+                continue
+
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+
+            if char == '"':
+                self._in_string = True
+            elif char in "{[":
+                if self._depth == 0:
+                    start = position
+                self._depth += 1
+            elif char in "}]":
+                if self._depth == 0:
+                    if char == "]":
+                        self.closed = True
+                    continue
+                self._depth -= 1
+                if self._depth == 0:
+                    self._buffer.append(chunk[start:position + 1])
+                    completed.append(json.loads("".join(self._buffer)))
+                    self._buffer = []
+                    start = None
+
+        if self._depth and start is not None:
+            self._buffer.append(chunk[start:])
+        self.count += len(completed)
+        return completed
@@ -0,0 +1,345 @@
+import re
+import unicodedata
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass, field
+from datetime import date
+from threading import Lock
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from loguru import logger
+import numpy as np
+
+from models.document import DocumentCategory, ProcessedDocument
+
+# 出典: (書類ID, 書類内の行番号（0始まり）)
+Source = Tuple[str, int]
+
+_DATE = re.compile(r"(\d{4})\D{1,2}(\d{1,2})\D{1,2}(\d{1,2})")
+# Page markers only ("_p2", "page3", "ページ4", "-2"): longer trailing numbers are usually the account number
+_FILENAME_SUFFIX = re.compile(r"([_\-\s]*(?<![a-z])(p|page|ページ)\s*\d+|[_\-\s]+\d{1,2})+$", re.IGNORECASE)
+
+
+def parse_date(value: Any) -> Optional[date]:
+    """取引日（yyyy-mm-dd・yyyy/mm/dd・yyyy年m月d日）を日付に変換"""
+    if isinstance(value, date):
+        return value
+    if not value:
+        return None
+    match = _DATE.search(unicodedata.normalize("NFKC", str(value)))
+    if not match:
+        return None
+    try:
+        return date(*(int(part) for part in match.groups()))
+    except ValueError:
+        return None
+
+
+def to_amount(value: Any) -> int:
+    """金額を整数に変換（カンマ・円記号付きの文字列、null を許容）"""
+    if value is None or value == "":
+        return 0
+    if isinstance(value, (int, float)):
+        return int(value)
+    digits = re.sub(r"[^\d\-]", "", unicodedata.normalize("NFKC", str(value)))
+    return int(digits) if digits not in ("", "-") else 0
+
+
+def normalize_text(value: Any) -> str:
+    """摘要・相手先の比較用正規化（全角半角・大文字小文字・空白の違いを無視）"""
+    return "".join(unicodedata.normalize("NFKC", str(value or "")).lower().split())
+
+
+def account_key(document: ProcessedDocument) -> str:
+    """
+    書類の口座キー
+    抽出データに口座情報（金融機関・支店・口座番号）があればそれを、なければファイル名からページ番号等を除いたものを使う
+    """
+    data = document.extracted_data
+    if data.get("account"):
+        return unicodedata.normalize("NFKC", str(data["account"])).strip()
+    parts = [data.get(key) for key in ("financial_institution", "branch", "account_number")]
+    if any(parts):
+        return "/".join(unicodedata.normalize("NFKC", str(part or "")).strip() for part in parts)
+    stem = document.original_filename.rsplit(".", 1)[0]
+    return _FILENAME_SUFFIX.sub("", unicodedata.normalize("NFKC", stem)).strip() or stem
+
+
+@dataclass
+class LedgerEntry:
+    """元帳の1取引（別の書類・別のページにある同一取引は出典をまとめて1件にする）"""
+    date: date
+    withdrawal: int
+    deposit: int
+    balance: Optional[int]
+    description: str
+    sources: List[Source] = field(default_factory=list)
+
+    @property
+    def key(self) -> Tuple:
+        return (self.date, self.withdrawal, self.deposit, self.balance, normalize_text(self.description))
+
+    def to_dict(self, account: str) -> Dict[str, Any]:
+        document_id, row = self.sources[0]
+        return {
+            "口座": account,
+            "取引日": self.date.isoformat(),
+            "出金額": self.withdrawal,
+            "入金額": self.deposit,
+            "残高": self.balance,
+            "取引内容": self.description,
+            "書類ID": document_id,
+            "行": row + 1,
+            "出典": [{"書類ID": source_id, "行": source_row + 1} for source_id, source_row in self.sources],
+        }
+
+
+@dataclass
+class LedgerColumns:
+    """元帳の列形式の表現（分析用のNumPy配列、行の並びは元帳と同じ日付順）"""
+    dates: np.ndarray  # int32, date.toordinal()
+    withdrawals: np.ndarray  # int64
+    deposits: np.ndarray  # int64
+    descriptions: np.ndarray  # int32 codes into description_texts
+    description_texts: List[str]  # normalized (normalize_text)
+
+
+class AccountLedger:
+    """
+    口座ごとの日付順の取引元帳
+    日付列の二分探索で期間検索し、金額順・相手先別の索引は更新後の初回検索時に作り直す
+    """
+
+    def __init__(self, account: str):
+        self.account = account
+        self._entries: List[LedgerEntry] = []
+        self._dates: List[int] = []
+        self._by_key: Dict[Tuple, List[LedgerEntry]] = {}
+        self._by_amount: Optional[Tuple[List[int], List[LedgerEntry]]] = None
+        self._by_description: Optional[Dict[str, List[LedgerEntry]]] = None
+        self._columns: Optional[LedgerColumns] = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def first_date(self) -> Optional[date]:
+        return self._entries[0].date if self._entries else None
+
+    @property
+    def last_date(self) -> Optional[date]:
+        return self._entries[-1].date if self._entries else None
+
+    def add(self, document_id: str, transactions: List[Dict[str, Any]]) -> Tuple[int, int]:
+        """
+        書類の取引を取り込む（戻り値: (追加件数, 重複件数)）
+        日付のない行は直前の行の日付を引き継ぐ（先頭行で日付不明の場合は取り込まない）
+        """
+        added: List[LedgerEntry] = []
+        duplicates = 0
+        current_date = None
+        # Pages of this document each entry was matched from: identical rows on one page
+        # (two equal ATM withdrawals on the same day) are separate transactions
+        claimed: Dict[int, Set[Any]] = {}
+        for row, transaction in enumerate(transactions):
+            current_date = parse_date(transaction.get("取引日")) or current_date
+            if current_date is None:
+                continue
+            balance = transaction.get("残高")
+            page = transaction.get("ページ")
+            entry = LedgerEntry(
+                date=current_date,
+                withdrawal=to_amount(transaction.get("出金額")),
+                deposit=to_amount(transaction.get("入金額")),
+                balance=to_amount(balance) if balance not in (None, "") else None,
+                description=str(transaction.get("取引内容") or ""),
+                sources=[(document_id, row)],
+            )
+            candidates = self._by_key.setdefault(entry.key, [])
+            existing = next((candidate for candidate in candidates if page not in claimed.get(id(candidate), ())), None)
+            if existing is not None:
+                # Overlapping pages (re-scans, overlapping passbook volumes) map to the same row
+                if (document_id, row) not in existing.sources:
+                    existing.sources.append((document_id, row))
+                claimed.setdefault(id(existing), set()).add(page)
+                duplicates += 1
+                continue
+            candidates.append(entry)
+            claimed[id(entry)] = {page}
+            added.append(entry)
+
+        if added:
+            # Timsort merges the already-sorted ledger with the new, mostly-sorted rows in near-linear time
+            self._entries.extend(added)
+            self._entries.sort(key=lambda entry: entry.date)
+            self._reindex()
+        return len(added), duplicates
+
+    def remove_document(self, document_id: str) -> int:
+        """書類由来の出典を外し、他の書類に出典が残らない取引を削除（戻り値: 削除件数）"""
+        kept: List[LedgerEntry] = []
+        removed = 0
+        for entry in self._entries:
+            entry.sources = [source for source in entry.sources if source[0] != document_id]
+            if entry.sources:
+                kept.append(entry)
+            else:
+                candidates = [candidate for candidate in self._by_key[entry.key] if candidate is not entry]
+                if candidates:
+                    self._by_key[entry.key] = candidates
+                else:
+                    del self._by_key[entry.key]
+                removed += 1
+        if removed:
+            self._entries = kept
+            self._reindex()
+        return removed
+
+    def between(self, start: Optional[date] = None, end: Optional[date] = None) -> List[LedgerEntry]:
+        """期間内（両端を含む）の取引を日付順に返す"""
+        low = bisect_left(self._dates, start.toordinal()) if start else 0
+        high = bisect_right(self._dates, end.toordinal()) if end else len(self._dates)
+        return self._entries[low:high]
+
+    def balance_at(self, day: date) -> Optional[LedgerEntry]:
+        """その日の終わり時点の残高を持つ取引（その日以前で残高の記載がある最後の取引、なければNone）"""
+        for position in range(bisect_right(self._dates, day.toordinal()) - 1, -1, -1):
+            if self._entries[position].balance is not None:
+                return self._entries[position]
+        return None
+
+    def at_least(self, min_amount: int, kind: str = "any", start: Optional[date] = None, end: Optional[date] = None) -> List[LedgerEntry]:
+        """
+        出金・入金額が閾値以上の取引を金額の大きい順に返す
+        kind: "withdrawal"（出金）・"deposit"（入金）・"any"（どちらか）
+        """
+        amounts, entries = self._amount_index()
+        results = []
+        for entry in entries[:bisect_right(amounts, -min_amount)]:
+            if kind == "withdrawal" and entry.withdrawal < min_amount:
+                continue
+            if kind == "deposit" and entry.deposit < min_amount:
+                continue
+            if (start and entry.date < start) or (end and entry.date > end):
+                continue
+            results.append(entry)
+        return results
+
+    def counterparty(self, query: str, start: Optional[date] = None, end: Optional[date] = None) -> List[LedgerEntry]:
+        """取引内容に相手先（部分一致、全角半角を無視）を含む取引を日付順に返す"""
+        needle = normalize_text(query)
+        if not needle:
+            return []
+        if self._by_description is None:
+            self._by_description = {}
+            for entry in self._entries:
+                self._by_description.setdefault(normalize_text(entry.description), []).append(entry)
+        # Descriptions repeat heavily (カード, 振込 〇〇), so scan distinct texts rather than rows
+        results = [
+            entry
+            for description, entries in self._by_description.items()
+            if needle in description
+            for entry in entries
+            if not (start and entry.date < start) and not (end and entry.date > end)
+        ]
+        results.sort(key=lambda entry: entry.date)
+        return results
+
+    def entry(self, position: int) -> LedgerEntry:
+        return self._entries[position]
+
+    def columns(self) -> LedgerColumns:
+        """列形式の表現（更新後の初回呼び出し時に作り直す）"""
+        if self._columns is None:
+            codes: Dict[str, int] = {}
+            descriptions = [codes.setdefault(normalize_text(entry.description), len(codes)) for entry in self._entries]
+            self._columns = LedgerColumns(
+                dates=np.array(self._dates, dtype=np.int32),
+                withdrawals=np.array([entry.withdrawal for entry in self._entries], dtype=np.int64),
+                deposits=np.array([entry.deposit for entry in self._entries], dtype=np.int64),
+                descriptions=np.array(descriptions, dtype=np.int32),
+                description_texts=list(codes),
+            )
+        return self._columns
+
+    def _amount_index(self) -> Tuple[List[int], List[LedgerEntry]]:
+        if self._by_amount is None:
+            # Sorted by negated amount so that a prefix slice gives the largest rows first
+            ordered = sorted(self._entries, key=lambda entry: -max(entry.withdrawal, entry.deposit))
+            self._by_amount = ([-max(entry.withdrawal, entry.deposit) for entry in ordered], ordered)
+        return self._by_amount
+
+    def _reindex(self) -> None:
+        self._dates = [entry.date.toordinal() for entry in self._entries]
+        self._by_amount = None
+        self._by_description = None
+        self._columns = None
+
+
+class LedgerStore:
+    """案件・口座ごとの取引元帳の集合（案件ごとに分けて持ち、案件単位の検索・削除はその案件の元帳だけを見る）"""
+
+    def __init__(self):
+        self._ledgers: Dict[str, Dict[str, AccountLedger]] = {}  # case -> account -> ledger
+        self._documents: Dict[str, Tuple[str, str]] = {}
+        self._lock = Lock()
+
+    def add_document(self, document: ProcessedDocument) -> None:
+        """通帳書類の取引を口座の元帳に取り込む（通帳以外・重複書類・取引のない書類は無視）"""
+        transactions = document.extracted_data.get("transactions")
+        with self._lock:
+            # Re-adding an edited document replaces its previous rows
+            self._remove(document.id)
+            if document.category != DocumentCategory.PASSBOOK or document.duplicate_of or not transactions:
+                return
+            ledger_id = (document.case_id or "", account_key(document))
+            ledger = self._ledgers.setdefault(ledger_id[0], {}).setdefault(ledger_id[1], AccountLedger(ledger_id[1]))
+            added, duplicates = ledger.add(document.id, transactions)
+            self._documents[document.id] = ledger_id
+        logger.info(f"元帳に取り込み: {document.id} -> {ledger.account} (追加{added}件, 重複{duplicates}件)")
+
+    def remove_document(self, document_id: str) -> None:
+        with self._lock:
+            self._remove(document_id)
+
+    def ledgers(self, case_id: Optional[str] = None, account: Optional[str] = None) -> List[AccountLedger]:
+        """案件の元帳（口座を指定した場合はその口座のみ）"""
+        ledgers = self._ledgers.get(case_id or "", {})
+        if account is not None:
+            return [ledgers[account]] if account in ledgers else []
+        return [ledger for _, ledger in sorted(ledgers.items())]
+
+    def remove_case(self, case_id: str) -> None:
+        """案件の元帳をすべて削除"""
+        with self._lock:
+            for ledger in self._ledgers.pop(case_id, {}).values():
+                for entry in ledger.between():
+                    for document_id, _ in entry.sources:
+                        self._documents.pop(document_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._ledgers.clear()
+            self._documents.clear()
+
+    def _remove(self, document_id: str) -> None:
+        ledger_id = self._documents.pop(document_id, None)
+        if ledger_id is None:
+            return
+        case_ledgers = self._ledgers.get(ledger_id[0], {})
+        ledger = case_ledgers.get(ledger_id[1])
+        if ledger is None:
+            return  # the case was removed as a whole
+        ledger.remove_document(document_id)
+        if not len(ledger):
+            del case_ledgers[ledger_id[1]]
+            if not case_ledgers:
+                del self._ledgers[ledger_id[0]]
+
+
+def merge_by_date(ledgers: Iterable[AccountLedger], select) -> List[Dict[str, Any]]:
+    """複数口座の検索結果を日付順の行リストにまとめる"""
+    rows = [(entry, ledger.account) for ledger in ledgers for entry in select(ledger)]
+    rows.sort(key=lambda item: item[0].date)
+    return [entry.to_dict(account) for entry, account in rows]
+
+
+ledger_store = LedgerStore()
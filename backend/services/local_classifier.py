@@ -0,0 +1,96 @@
+import unicodedata
+from dataclasses import dataclass, field
+from typing import List, Tuple
+
+from models.document import DocumentCategory
+
+# Keyword rules mirroring the categories listed in the DocumentClassifier prompt.
+# Longer, more specific keywords carry more weight than short generic ones.
+KEYWORD_RULES: List[Tuple[DocumentCategory, List[str]]] = [
+    (DocumentCategory.LAND_BUILDING, [
+        "登記事項証明書", "登記簿謄本", "名寄帳", "名寄台帳",
+        "固定資産税", "課税明細書", "評価証明書", "公課証明書", "家屋番号", "地番", "地積",
+    ]),
+    (DocumentCategory.LISTED_STOCK, [
+        "取引残高報告書", "特定口座", "投資信託", "証券株式会社", "保護預り", "銘柄",
+    ]),
+    (DocumentCategory.OTHER_INVESTMENT, [
+        "出資証明書", "出資金", "非上場株式", "持分払込",
+    ]),
+    (DocumentCategory.PUBLIC_BOND, [
+        "個人向け国債", "利付国債", "国債", "社債", "地方債", "債券",
+    ]),
+    (DocumentCategory.DEPOSIT, [
+        "預金残高証明書", "貯金残高証明書", "残高証明書", "定期預金", "普通預金", "既経過利息",
+    ]),
+    (DocumentCategory.LIFE_INSURANCE, [
+        "保険証券", "解約返戻金", "生命保険", "死亡保険金", "被保険者",
+    ]),
+    (DocumentCategory.DEATH_RETIREMENT, [
+        "死亡退職金", "退職手当金", "退職手当金等受給者別支払調書",
+    ]),
+    (DocumentCategory.OTHER_PROPERTY, [
+        "鑑定書", "自動車検査証", "車検証", "ゴルフ会員権",
+    ]),
+    (DocumentCategory.DEBT, [
+        "借入金残高証明書", "ローン残高", "借入金", "未払金", "診療費請求書",
+    ]),
+    (DocumentCategory.FUNERAL_EXPENSE, [
+        "葬儀", "葬祭", "お布施", "御布施", "火葬", "読経料",
+    ]),
+    (DocumentCategory.PASSBOOK, [
+        "普通預金通帳", "総合口座通帳", "入出金明細", "取引履歴", "お取引明細", "通帳",
+    ]),
+    (DocumentCategory.PROCEDURE_DOC, [
+        "法定相続情報一覧図", "戸籍謄本", "戸籍抄本", "戸籍全部事項証明書", "除籍謄本", "改製原戸籍",
+        "印鑑登録証明書", "印鑑証明書", "住民票",
+    ]),
+]
+
+HEADER_CHARS = 120  # 書類タイトルとみなす先頭の文字数
+HEADER_WEIGHT = 3  # タイトル部分で一致した場合の重み倍率
+STRONG_SCORE = 12  # この得点以上で根拠十分とみなす
+
+
+@dataclass
+class LocalClassification:
+    """ローカル分類の結果"""
+    category: DocumentCategory
+    confidence: float
+    detected_keywords: List[str] = field(default_factory=list)
+
+
+def classify_text(text: str) -> LocalClassification:
+    """
+    テキスト（PDFテキストレイヤー・OCR結果）からキーワード規則で書類タイプを判定
+
+    信頼度 = 最有力カテゴリの得点シェア × 根拠の強さ（STRONG_SCOREで飽和）
+    """
+    normalized = "".join(unicodedata.normalize("NFKC", text or "").split())
+    if not normalized:
+        return LocalClassification(DocumentCategory.UNKNOWN, 0.0)
+
+    header = normalized[:HEADER_CHARS]
+    matched = [
+        (category, keyword)
+        for category, rule_keywords in KEYWORD_RULES
+        for keyword in rule_keywords
+        if keyword in normalized
+    ]
+    # 長い（具体的な）キーワードに含まれる短いキーワードは数えない（例: 普通預金通帳 ⊃ 普通預金）
+    matched_keywords = {keyword for _, keyword in matched}
+    scores = {}
+    keywords = {}
+    for category, keyword in matched:
+        if any(keyword != other and keyword in other for other in matched_keywords):
+            continue
+        scores[category] = scores.get(category, 0) + len(keyword) * (HEADER_WEIGHT if keyword in header else 1)
+        keywords.setdefault(category, []).append(keyword)
+
+    if not scores:
+        return LocalClassification(DocumentCategory.UNKNOWN, 0.0)
+
+    best = max(scores, key=scores.get)
+    share = scores[best] / sum(scores.values())
+    strength = min(1.0, scores[best] / STRONG_SCORE)
+    return LocalClassification(best, round(share * strength, 3), keywords[best])
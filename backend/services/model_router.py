@@ -0,0 +1,181 @@
+import google.generativeai as genai
+import asyncio
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+from loguru import logger
+
+from core.config import settings
+from core.metrics import metrics
+from services.json_repair import TruncatedJSON, loads_tolerant
+
+# 検証関数: 解析結果を受け取り、昇格理由（問題なければNone）を返す
+Validator = Callable[[Any], Optional[str]]
+
+
+@dataclass
+class RoutedResponse:
+    """モデルルーティングの結果"""
+    value: Any
+    text: str
+    model_name: str
+    attempts: int
+    cost_usd: float
+    escalation_reasons: List[str] = field(default_factory=list)
+    accepted: bool = True  # 最上位モデルでも検証に失敗した場合はFalse
+    truncated: bool = False  # 最上位モデルでも出力が途中で切れた場合はTrue（valueは復元できた先頭部分）
+
+
+class ModelRouter:
+    """
+    段階的モデルルーティング
+    最も安価・高速なモデルから試行し、JSON解析失敗・検証失敗・低信頼度の場合のみ上位モデルへ昇格する
+    """
+
+    def __init__(self, tiers: Optional[List[str]] = None):
+        self.tiers = tiers or list(settings.MODEL_TIERS)
+        self._models: Dict[str, Any] = {}
+
+    def get_model(self, model_name: str):
+        if model_name not in self._models:
+            self._models[model_name] = genai.GenerativeModel(model_name)
+        return self._models[model_name]
+
+    async def generate(
+        self,
+        task: str,
+        contents: List[Any],
+        generation_config: Optional[Dict[str, Any]] = None,
+        parse: Callable[[str], Any] = loads_tolerant,
+        validate: Optional[Validator] = None,
+        tiers: Optional[List[str]] = None
+    ) -> RoutedResponse:
+        """
+        コンテンツを生成し、検証を通過した最初の結果を返す
+
+        どのモデルでも検証を通過しなかった場合は、試行した中で最もよい結果（検証に失敗した解析結果、
+        途中で切れた出力から復元できた先頭部分、解析できなかった出力の順）を accepted=False で返す
+        出力が途中で切れた場合（parseがTruncatedJSONを送出）は上位モデルで再試行し、その結果を返す場合は truncated=True
+        すべてのモデルでJSON解析に失敗した場合は value=None
+        tiersを指定するとその順で試行する（ストリーミング失敗後の上位モデルでの再試行など）
+        """
+        tiers = tiers or self.tiers
+        started = time.perf_counter()
+        reasons: List[str] = []
+        total_cost = 0.0
+        # (rank, value, text, model_name, truncated) of the most usable rejected response so far
+        best = (-1, None, "", tiers[-1], False)
+
+        for attempt, model_name in enumerate(tiers, start=1):
+            is_last = attempt == len(tiers)
+            response = await asyncio.to_thread(
+                self.get_model(model_name).generate_content,
+                contents,
+                generation_config=generation_config
+            )
+            total_cost += self._estimate_cost(model_name, response)
+            text = response.text
+
+            truncated = False
+            try:
+                value = parse(text)
+            except TruncatedJSON as e:
+                value, truncated = e.partial, True
+                reason = "truncated"
+            except Exception as e:
+                value = None
+                reason = f"parse_error: {e}"
+            else:
+                reason = validate(value) if validate else None
+            # The mean is the share of responses that could not be used as-is
+            metrics.observe(f"model_router.{task}.parse_failure", 1.0 if value is None or truncated else 0.0)
+
+            if reason is None:
+                self._record(task, model_name, attempt, total_cost, started, accepted=True)
+                return RoutedResponse(value, text, model_name, attempt, total_cost, reasons)
+
+            # A later tier that fails worse does not replace a parsed value from a cheaper one
+            rank = 0 if value is None else 1 if truncated else 2
+            if rank >= best[0]:
+                best = (rank, value, text, model_name, truncated)
+            reasons.append(f"{model_name}: {reason}")
+            if not is_last:
+                logger.info(f"モデル昇格 ({task}): {model_name} -> {tiers[attempt]} 理由: {reason}")
+
+        logger.warning(f"最上位モデルでも検証に失敗 ({task}): {reasons[-1]}")
+        _, value, text, model_name, truncated = best
+        self._record(task, model_name, len(tiers), total_cost, started, accepted=False)
+        return RoutedResponse(value, text, model_name, len(tiers), total_cost, reasons, accepted=False, truncated=truncated)
+
+    async def stream(
+        self,
+        task: str,
+        contents: List[Any],
+        generation_config: Optional[Dict[str, Any]] = None,
+        model_name: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """
+        1つのモデル（既定は最も安価なモデル）の出力をチャンクごとに返す
+        検証と昇格は呼び出し側で行う（出力済みのチャンクは取り消せないため）
+        """
+        model_name = model_name or self.tiers[0]
+        model = self.get_model(model_name)
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        started = time.perf_counter()
+
+        stop = threading.Event()
+
+        def produce() -> None:
+            # The SDK's streamed response is a blocking iterator; hand chunks over to the event loop
+            try:
+                response = model.generate_content(contents, generation_config=generation_config, stream=True)
+                for chunk in response:
+                    if stop.is_set():
+                        return  # the consumer is gone; stop reading the response
+                    loop.call_soon_threadsafe(queue.put_nowait, ("chunk", chunk.text))
+                loop.call_soon_threadsafe(queue.put_nowait, ("end", response))
+            except Exception as e:
+                if not stop.is_set():
+                    loop.call_soon_threadsafe(queue.put_nowait, ("error", e))
+
+        # Not awaited: if the consumer stops early, the stop flag ends the thread at the next chunk
+        loop.run_in_executor(None, produce)
+        try:
+            while True:
+                kind, payload = await queue.get()
+                if kind == "chunk":
+                    yield payload
+                elif kind == "error":
+                    raise payload
+                else:
+                    metrics.increment(f"model_router.{task}.stream.requests")
+                    metrics.increment(f"model_router.{task}.model.{model_name}")
+                    metrics.observe(f"model_router.{task}.cost_usd", self._estimate_cost(model_name, payload))
+                    metrics.observe(f"model_router.{task}.latency_seconds", time.perf_counter() - started)
+                    return
+        finally:
+            stop.set()
+
+    def _estimate_cost(self, model_name: str, response: Any) -> float:
+        """usage_metadataのトークン数から費用（USD）を概算"""
+        usage = getattr(response, "usage_metadata", None)
+        pricing = settings.MODEL_PRICING.get(model_name)
+        if usage is None or not pricing:
+            return 0.0
+        input_tokens = getattr(usage, "prompt_token_count", 0) or 0
+        output_tokens = getattr(usage, "candidates_token_count", 0) or 0
+        return (input_tokens * pricing[0] + output_tokens * pricing[1]) / 1_000_000
+
+    def _record(self, task: str, model_name: str, attempts: int, cost: float, started: float, accepted: bool) -> None:
+        prefix = f"model_router.{task}"
+        metrics.increment(f"{prefix}.requests")
+        metrics.increment(f"{prefix}.model.{model_name}")
+        metrics.increment(f"{prefix}.re_requests", attempts - 1)
+        if not accepted:
+            metrics.increment(f"{prefix}.rejected")
+        # 平均値がそれぞれ昇格率・書類あたり費用・レイテンシになる
+        metrics.observe(f"{prefix}.escalated", 1.0 if attempts > 1 else 0.0)
+        metrics.observe(f"{prefix}.cost_usd", cost)
+        metrics.observe(f"{prefix}.latency_seconds", time.perf_counter() - started)
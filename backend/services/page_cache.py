@@ -0,0 +1,109 @@
+import hashlib
+import json
+import os
+import shutil
+from threading import Lock
+from typing import Any, Dict, List, Optional
+from loguru import logger
+
+from core.config import settings
+
+# Directory of the page results that belong to no case
+NO_CASE_DIR = "_shared"
+
+
+class PageResultStore:
+    """
+    ページ指紋をキーとするページ単位のOCR結果の保存先
+    差し替え版PDFの再アップロード時に、変更のないページの結果を再利用する。
+    結果は案件ごとのディレクトリに分けて持ち（案件の削除でまとめて削除）、
+    全体の件数がmax_entriesを超えたら最も長く使われていないページから削除する
+    """
+
+    def __init__(self, root: Optional[str] = None, max_entries: Optional[int] = None):
+        self._root = root
+        self._max_entries = max_entries
+        self._count: Optional[int] = None  # counted on first write
+        self._lock = Lock()
+
+    @property
+    def root(self) -> str:
+        # Resolved lazily so INDEX_PATH overrides apply after import
+        return self._root or os.path.join(settings.INDEX_PATH, "pages")
+
+    @property
+    def max_entries(self) -> int:
+        return self._max_entries or settings.PAGE_RESULT_MAX_ENTRIES
+
+    def _case_dir(self, case_id: Optional[str]) -> str:
+        if not case_id:
+            return os.path.join(self.root, NO_CASE_DIR)
+        return os.path.join(self.root, hashlib.sha256(case_id.encode("utf-8")).hexdigest()[:32])
+
+    def _path(self, fingerprint: str, case_id: Optional[str]) -> str:
+        return os.path.join(self._case_dir(case_id), fingerprint[:2], f"{fingerprint}.json")
+
+    def get(self, fingerprint: str, case_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        path = self._path(fingerprint, case_id)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, encoding="utf-8") as f:
+                result = json.load(f)
+            os.utime(path)  # the modification time orders eviction
+            return result
+        except (OSError, ValueError) as e:
+            logger.warning(f"ページ結果の読み込みに失敗しました ({fingerprint[:12]}): {str(e)}")
+            return None
+
+    def put(self, fingerprint: str, result: Dict[str, Any], case_id: Optional[str] = None) -> None:
+        path = self._path(fingerprint, case_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        is_new = not os.path.exists(path)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        if is_new:
+            with self._lock:
+                # The first write counts the files on disk, the new one included
+                self._count = self._count + 1 if self._count is not None else len(self._files())
+                if self._count > self.max_entries:
+                    self._evict()
+
+    def get_many(self, fingerprints: List[str], case_id: Optional[str] = None) -> List[Optional[Dict[str, Any]]]:
+        """ページ指紋ごとの結果（ないページはNone）"""
+        return [self.get(fingerprint, case_id) for fingerprint in fingerprints]
+
+    def put_many(self, results: Dict[str, Dict[str, Any]], case_id: Optional[str] = None) -> None:
+        """ページ指紋ごとの結果をまとめて保存"""
+        for fingerprint, result in results.items():
+            self.put(fingerprint, result, case_id)
+
+    def remove_case(self, case_id: str) -> None:
+        """案件のページ結果をすべて削除"""
+        with self._lock:
+            shutil.rmtree(self._case_dir(case_id), ignore_errors=True)
+            self._count = None
+
+    def _files(self) -> List[str]:
+        return [
+            os.path.join(directory, name)
+            for directory, _, names in os.walk(self.root)
+            for name in names if name.endswith(".json")
+        ]
+
+    def _evict(self) -> None:
+        # Down to 90% at once, so the directory is not rescanned on every write
+        files = sorted(self._files(), key=lambda path: os.stat(path).st_mtime)
+        excess = len(files) - int(self.max_entries * 0.9)
+        for path in files[:max(0, excess)]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        self._count = len(files) - max(0, excess)
+        logger.info(f"古いページ結果を削除: {max(0, excess)}件")
+
+
+page_result_store = PageResultStore()
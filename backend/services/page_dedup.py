@@ -0,0 +1,169 @@
+import hashlib
+import json
+import os
+from threading import Lock
+from typing import Any, Dict, List, Optional, Tuple
+from loguru import logger
+
+from core.config import settings
+from services.pdf_text import page_fingerprints
+from services.thumbnails import detect_mime_type
+
+
+def page_keys(content: bytes, filename: str = "") -> List[str]:
+    """
+    ページごとの内容の鍵（PDFはページ指紋、画像はファイルのSHA-256。解析できないPDFは空リスト）
+    同じ銀行の様式の通帳は別のページでも知覚ハッシュが数ビットしか違わないため、重複は内容の完全一致だけで判定する
+    """
+    if detect_mime_type(content, filename) == "application/pdf":
+        return page_fingerprints(content)
+    return [hashlib.sha256(content).hexdigest()]
+
+
+class PageHashIndex:
+    """
+    ページ内容の鍵の索引（ファイルのSHA-256・ページごとの鍵の完全一致で検索）
+    pathを指定すると同じ案件の複数回のアップロードをまたいで永続化する
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._pages: Dict[str, Dict[str, Any]] = {}
+        self._files: Dict[str, Dict[str, Any]] = {}
+        self._lock = Lock()
+        if path and os.path.exists(path):
+            self._load()
+
+    def find_page(self, key: str) -> Optional[Dict[str, Any]]:
+        """同じ内容の登録済みページの参照情報"""
+        return self._pages.get(key)
+
+    def find_document(self, sha256: str, keys: List[str]) -> Optional[Dict[str, Any]]:
+        """
+        ファイル単位の重複を検索
+        内容が完全一致するか、全ページが同じ書類の同じページと同じ内容の場合にその参照情報を返す
+        """
+        if sha256 in self._files:
+            return self._files[sha256]
+        if not keys:
+            return None
+
+        document_ref = None
+        for page_number, key in enumerate(keys, start=1):
+            ref = self._pages.get(key)
+            if ref is None or ref.get("page") != page_number or ref.get("page_count") != len(keys):
+                return None
+            if document_ref is not None and ref.get("document") != document_ref.get("document"):
+                return None
+            document_ref = ref
+        return document_ref
+
+    def add_page(self, key: str, ref: Dict[str, Any]) -> None:
+        with self._lock:
+            self._pages.setdefault(key, ref)  # the first copy stays the original
+
+    def add_document(self, sha256: str, keys: List[str], ref: Dict[str, Any]) -> None:
+        """ファイルの全ページを登録（refには書類を識別する "document" を含める）"""
+        self._files[sha256] = ref
+        for page_number, key in enumerate(keys, start=1):
+            self.add_page(key, dict(ref, page=page_number, page_count=len(keys)))
+
+    def remove_document(self, document: Any) -> bool:
+        """書類の登録（ファイル・全ページ）を削除（削除した場合True）"""
+        with self._lock:
+            pages = {key: ref for key, ref in self._pages.items() if ref.get("document") != document}
+            files = {sha256: ref for sha256, ref in self._files.items() if ref.get("document") != document}
+            if len(pages) == len(self._pages) and len(files) == len(self._files):
+                return False
+            self._pages, self._files = pages, files
+        return True
+
+    def save(self) -> None:
+        if not self.path:
+            return
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"pages": self._pages, "files": self._files}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+
+    def _load(self) -> None:
+        with open(self.path, encoding="utf-8") as f:
+            data = json.load(f)
+        pages = data.get("pages", {})
+        if isinstance(pages, dict):
+            self._pages = pages
+        else:
+            # Indexes of perceptual hashes cannot be matched by content; their files still can
+            logger.info(f"知覚ハッシュのページ索引は使わずに読み込みます: {self.path}")
+        self._files = data.get("files", {})
+
+
+_case_indexes: Dict[str, PageHashIndex] = {}
+_case_indexes_lock = Lock()
+
+
+def _case_index_path(case_id: str) -> str:
+    safe_id = hashlib.sha256(case_id.encode("utf-8")).hexdigest()[:32]
+    return os.path.join(settings.INDEX_PATH, "phash", f"{safe_id}.json")
+
+
+def case_page_index(case_id: str) -> PageHashIndex:
+    """案件ごとの永続ページハッシュ索引"""
+    with _case_indexes_lock:
+        if case_id not in _case_indexes:
+            _case_indexes[case_id] = PageHashIndex(_case_index_path(case_id))
+        return _case_indexes[case_id]
+
+
+def remove_case_document_pages(case_id: str, document_id: str) -> None:
+    """案件のページハッシュ索引から書類の登録を削除（索引がなければ何もしない）"""
+    with _case_indexes_lock:
+        index = _case_indexes.get(case_id)
+    if index is None:
+        if not os.path.exists(_case_index_path(case_id)):
+            return
+        index = case_page_index(case_id)
+    if index.remove_document(document_id):
+        index.save()
+
+
+def remove_case_page_index(case_id: str) -> None:
+    """案件のページハッシュ索引を削除"""
+    with _case_indexes_lock:
+        index = _case_indexes.pop(case_id, None)
+        path = index.path if index is not None else _case_index_path(case_id)
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def split_duplicate_pages(keys: List[Optional[str]], index: PageHashIndex, ref: Dict[str, Any]) -> Tuple[List[int], List[Dict[str, Any]]]:
+    """
+    ページを未処理ページと重複ページに振り分ける（keysはページごとの内容の鍵、計算できなかったページはNone）
+    内容が完全一致するページだけを重複とする。索引には登録しない（OCRが済んでからregister_pagesで登録する）。
+    同じアップロード内で繰り返すページも重複とする。未処理ページの位置（0始まり）と、重複ページの重複元の情報を返す
+    """
+    seen: Dict[str, Dict[str, Any]] = {}
+    unique_positions: List[int] = []
+    duplicates: List[Dict[str, Any]] = []
+    for position, key in enumerate(keys):
+        if key is None:
+            unique_positions.append(position)
+            continue
+        original = index.find_page(key) or seen.get(key)
+        if original is not None:
+            duplicates.append({"page": position + 1, "duplicate_of": original})
+            continue
+        seen[key] = dict(ref, page=position + 1)
+        unique_positions.append(position)
+    return unique_positions, duplicates
+
+
+def register_pages(index: PageHashIndex, keys: List[Optional[str]], positions: List[int], ref: Dict[str, Any]) -> None:
+    """処理の済んだページを索引に登録"""
+    for position in positions:
+        if keys[position] is not None:
+            index.add_page(keys[position], dict(ref, page=position + 1))
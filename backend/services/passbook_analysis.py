@@ -0,0 +1,200 @@
+from bisect import bisect_left
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import numpy as np
+
+from core.config import settings
+from services.ledger import AccountLedger, normalize_text
+
+# Findings list at most this many source rows each
+MAX_SOURCES_PER_FINDING = 50
+
+
+@dataclass
+class Finding:
+    """分析で検出した要確認の取引（またはそのまとまり）"""
+    type: str
+    score: float
+    account: str
+    positions: List[int]  # rows of the account ledger
+    amount: int
+    detail: Dict[str, Any] = field(default_factory=dict)
+
+    def to_dict(self, ledger: AccountLedger) -> Dict[str, Any]:
+        entries = [ledger.entry(position) for position in self.positions]
+        return {
+            "type": self.type,
+            "score": round(self.score, 3),
+            "account": self.account,
+            "start_date": entries[0].date.isoformat(),
+            "end_date": entries[-1].date.isoformat(),
+            "amount": self.amount,
+            "count": len(entries),
+            "description": entries[0].description,
+            "detail": self.detail,
+            "sources": [
+                {"書類ID": entry.sources[0][0], "行": entry.sources[0][1] + 1, "取引日": entry.date.isoformat()}
+                for entry in entries[:MAX_SOURCES_PER_FINDING]
+            ],
+        }
+
+
+def lookback_period(date_of_death: Optional[date]) -> Tuple[Optional[date], Optional[date]]:
+    """相続開始日から遡る分析対象期間（相続開始日が不明な場合は全期間）"""
+    if date_of_death is None:
+        return None, None
+    years = settings.ANALYSIS_LOOKBACK_YEARS
+    try:
+        start = date_of_death.replace(year=date_of_death.year - years)
+    except ValueError:  # Feb 29
+        start = date_of_death.replace(year=date_of_death.year - years, day=28)
+    return start, date_of_death
+
+
+class PassbookScanner:
+    """
+    口座元帳の列データ（NumPy配列）に対する一括走査
+    高額取引・期間内の出金合計・定額の繰り返し出金・端数のない出金・指定した相手先との取引を検出する
+    """
+
+    def __init__(self, watch: Optional[Iterable[str]] = None):
+        self.large_amount = settings.ANALYSIS_LARGE_AMOUNT
+        self.window_days = settings.ANALYSIS_WINDOW_DAYS
+        self.window_amount = settings.ANALYSIS_WINDOW_AMOUNT
+        self.recurring_min_count = settings.ANALYSIS_RECURRING_MIN_COUNT
+        self.recurring_min_amount = settings.ANALYSIS_RECURRING_MIN_AMOUNT
+        self.round_unit = settings.ANALYSIS_ROUND_UNIT
+        self.watch = [name for name in (normalize_text(name) for name in watch or []) if name]
+
+    def scan(self, ledger: AccountLedger, start: Optional[date] = None, end: Optional[date] = None) -> List[Finding]:
+        columns = ledger.columns()
+        low = int(np.searchsorted(columns.dates, start.toordinal(), side="left")) if start else 0
+        high = int(np.searchsorted(columns.dates, end.toordinal(), side="right")) if end else len(columns.dates)
+        if high <= low:
+            return []
+
+        dates = columns.dates[low:high]
+        withdrawals = columns.withdrawals[low:high]
+        deposits = columns.deposits[low:high]
+        codes = columns.descriptions[low:high]
+
+        findings: List[Finding] = []
+        findings += self._large_transactions(ledger.account, withdrawals, deposits, low)
+        findings += self._window_sums(ledger.account, dates, withdrawals, low)
+        findings += self._recurring_amounts(ledger.account, dates, withdrawals, codes, low)
+        findings += self._round_amounts(ledger.account, withdrawals, low)
+        findings += self._watched_counterparties(ledger.account, withdrawals, deposits, codes, columns.description_texts, low)
+        return findings
+
+    def _large_transactions(self, account, withdrawals, deposits, offset) -> List[Finding]:
+        findings = []
+        for kind, amounts in (("large_withdrawal", withdrawals), ("large_deposit", deposits)):
+            for position in np.flatnonzero(amounts >= self.large_amount):
+                amount = int(amounts[position])
+                findings.append(Finding(kind, amount / self.large_amount, account, [offset + int(position)], amount))
+        return findings
+
+    def _window_sums(self, account, dates, withdrawals, offset) -> List[Finding]:
+        """各取引日で終わる期間の出金合計（累積和と二分探索）が閾値以上の、重ならない期間"""
+        sums = np.concatenate(([0], np.cumsum(withdrawals)))
+        counts = np.concatenate(([0], np.cumsum(withdrawals > 0)))
+        right = np.searchsorted(dates, dates, side="right")  # include later rows of the same day
+        left = np.searchsorted(dates, dates - (self.window_days - 1), side="left")
+        window_sums = sums[right] - sums[left]
+        # Windows driven by a single withdrawal are already reported as large transactions
+        candidates = np.flatnonzero((window_sums >= self.window_amount) & (counts[right] - counts[left] >= 2))
+        if not len(candidates):
+            return []
+
+        # Greedy: highest sums first, skipping windows that overlap one already taken
+        findings = []
+        taken_starts: List[int] = []
+        taken_ends: List[int] = []
+        for position in candidates[np.argsort(-window_sums[candidates], kind="stable")]:
+            window = (int(left[position]), int(right[position]))
+            index = bisect_left(taken_starts, window[1])
+            if index and taken_ends[index - 1] > window[0]:
+                continue
+            taken_starts.insert(index, window[0])
+            taken_ends.insert(index, window[1])
+            rows = [offset + row for row in range(*window) if withdrawals[row] > 0]
+            total = int(window_sums[position])
+            findings.append(Finding(
+                "window_withdrawals", total / self.window_amount, account, rows, total,
+                {"window_days": self.window_days}
+            ))
+        return findings
+
+    def _recurring_amounts(self, account, dates, withdrawals, codes, offset) -> List[Finding]:
+        """同じ相手先への同額の出金が繰り返されているもの（定期的な贈与の可能性）"""
+        mask = withdrawals >= self.recurring_min_amount
+        positions = np.flatnonzero(mask)
+        if len(positions) < self.recurring_min_count:
+            return []
+        keys = withdrawals[positions] * (int(codes.max()) + 1) + codes[positions]
+        _, inverse, group_counts = np.unique(keys, return_inverse=True, return_counts=True)
+        order = np.argsort(inverse, kind="stable")
+        boundaries = np.concatenate(([0], np.cumsum(group_counts)))
+
+        findings = []
+        for group in np.flatnonzero(group_counts >= self.recurring_min_count):
+            rows = positions[order[boundaries[group]:boundaries[group + 1]]]
+            amount = int(withdrawals[rows[0]])
+            intervals = np.diff(dates[rows])
+            findings.append(Finding(
+                "recurring_withdrawal", len(rows) * amount / self.large_amount, account,
+                [offset + int(row) for row in rows], amount * len(rows),
+                {"unit_amount": amount, "median_interval_days": int(np.median(intervals)) if len(intervals) else None}
+            ))
+        return findings
+
+    def _round_amounts(self, account, withdrawals, offset) -> List[Finding]:
+        """端数のない出金（現金での持ち出しの可能性、高額取引として検出済みのものを除く）"""
+        mask = (withdrawals >= self.round_unit) & (withdrawals % self.round_unit == 0) & (withdrawals < self.large_amount)
+        return [
+            Finding("round_withdrawal", 0.5 * int(withdrawals[position]) / self.large_amount, account, [offset + int(position)], int(withdrawals[position]))
+            for position in np.flatnonzero(mask)
+        ]
+
+    def _watched_counterparties(self, account, withdrawals, deposits, codes, texts, offset) -> List[Finding]:
+        """指定した相手先（親族名など）との取引を取引内容ごとにまとめたもの（名義預金・贈与の可能性）"""
+        if not self.watch:
+            return []
+        findings = []
+        for code, text in enumerate(texts):
+            if not any(name in text for name in self.watch):
+                continue
+            rows = np.flatnonzero(codes == code)
+            if not len(rows):
+                continue
+            withdrawn = int(withdrawals[rows].sum())
+            deposited = int(deposits[rows].sum())
+            findings.append(Finding(
+                "watched_counterparty", 1 + max(withdrawn, deposited) / self.large_amount, account,
+                [offset + int(row) for row in rows], withdrawn + deposited,
+                {"withdrawn": withdrawn, "deposited": deposited}
+            ))
+        return findings
+
+
+def analyze_ledgers(
+    ledgers: List[AccountLedger],
+    date_of_death: Optional[date] = None,
+    watch: Optional[Iterable[str]] = None,
+    limit: int = 100
+) -> Dict[str, Any]:
+    """案件の全口座を走査し、スコアの高い順に検出結果を返す"""
+    scanner = PassbookScanner(watch)
+    start, end = lookback_period(date_of_death)
+    scored = [(finding, ledger) for ledger in ledgers for finding in scanner.scan(ledger, start, end)]
+    scored.sort(key=lambda item: -item[0].score)
+    counts: Dict[str, int] = {}
+    for finding, _ in scored:
+        counts[finding.type] = counts.get(finding.type, 0) + 1
+    return {
+        "period": {"start": start, "end": end},
+        "total": len(scored),
+        "counts": counts,
+        "findings": [finding.to_dict(ledger) for finding, ledger in scored[:limit]],
+    }
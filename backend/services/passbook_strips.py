@@ -0,0 +1,69 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+# Rows are matched across strips on these keys; the description is left out because
+# the same row is often read with small differences near a strip edge
+ROW_KEYS = ("取引日", "出金額", "入金額", "残高")
+# Only the rows near the strip edges can be in the overlap band
+MAX_OVERLAP_ROWS = 10
+
+
+def strip_boxes(width: int, height: int, strip_height: int, overlap: int) -> List[Tuple[int, int, int, int]]:
+    """
+    縦長の画像を、上下に重なりを持つ横長の帯に分割する範囲 (left, top, right, bottom) のリスト
+    重なりの幅は1行より大きくし、帯の境目で切れた行がどちらかの帯には完全に写るようにする
+    """
+    if height <= strip_height:
+        return [(0, 0, width, height)]
+    step = strip_height - overlap
+    count = -(-(height - overlap) // step)  # ceil
+    # Spread the strips evenly so the last one is not a thin sliver
+    step = -(-(height - overlap) // count)
+    boxes = []
+    for index in range(count):
+        top = index * step
+        boxes.append((0, top, width, min(height, top + step + overlap)))
+    return boxes
+
+
+def row_key(row: Dict[str, Any]) -> Tuple:
+    return tuple(row.get(key) for key in ROW_KEYS)
+
+
+def _find_overlap(previous: List[Dict[str, Any]], following: List[Dict[str, Any]]) -> Optional[Tuple[int, int, int]]:
+    """
+    前の帯の末尾と次の帯の先頭で一致する行の並びを探す
+    戻り値: (前の帯の一致開始位置, 次の帯の一致開始位置, 一致した行数)
+    """
+    previous_keys = [row_key(row) for row in previous]
+    for start in range(min(len(following), MAX_OVERLAP_ROWS)):
+        key = row_key(following[start])
+        # The overlap band is at the end of the previous strip: search from the end
+        for position in range(len(previous_keys) - 1, max(-1, len(previous_keys) - 1 - MAX_OVERLAP_ROWS), -1):
+            if previous_keys[position] != key:
+                continue
+            length = 1
+            while (
+                position + length < len(previous_keys)
+                and start + length < len(following)
+                and previous_keys[position + length] == row_key(following[start + length])
+            ):
+                length += 1
+            return position, start, length
+    return None
+
+
+def stitch_strips(strips: List[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """
+    帯ごとの取引を1つの取引リストにつなぐ（重なり部分で二重に読まれた行を除く）
+    一致した行の後ろにある前の帯の行と、前にある次の帯の行は帯の端で切れて読み誤った行とみなし、
+    端から遠いもう一方の帯の読み取りを使う
+    """
+    rows: List[Dict[str, Any]] = []
+    for strip in strips:
+        overlap = _find_overlap(rows, strip) if rows else None
+        if overlap is None:
+            rows = rows + strip
+            continue
+        position, start, length = overlap
+        rows = rows[:position + length] + strip[start + length:]
+    return rows
@@ -0,0 +1,93 @@
+import hashlib
+import io
+import re
+from typing import List
+from loguru import logger
+from PyPDF2 import PdfReader, PdfWriter
+
+from core.config import settings
+
+# Characters expected in a correctly decoded Japanese text layer:
+# ASCII, kana, CJK ideographs, full-width forms and Japanese punctuation
+_READABLE = re.compile(r"[ -~　-ヿ㐀-䶿一-鿿＀-￯\s]")
+
+
+def extract_text_layer(pdf_content: bytes) -> List[str]:
+    """PDFのテキストレイヤーをページごとに抽出（読めない場合は空リスト）"""
+    try:
+        reader = PdfReader(io.BytesIO(pdf_content))
+        return [page.extract_text() or "" for page in reader.pages]
+    except Exception as e:
+        logger.warning(f"テキストレイヤー抽出エラー: {str(e)}")
+        return []
+
+
+def has_usable_text_layer(pages: List[str]) -> bool:
+    """
+    テキストレイヤーがOCRの代わりに使えるかを判定
+
+    全ページに一定量の文字があり、文字化け（ToUnicode欠落による制御文字・私用領域文字など）が少ないこと
+    """
+    if not pages:
+        return False
+
+    for text in pages:
+        stripped = "".join(text.split())
+        if len(stripped) < settings.TEXT_LAYER_MIN_CHARS_PER_PAGE:
+            return False
+        readable = len(_READABLE.findall(text))
+        if readable / len(text) < settings.TEXT_LAYER_MIN_READABLE_RATIO:
+            return False
+
+    return True
+
+
+def _hash_resources(resources, digest, seen: set) -> None:
+    """ページが参照する画像・フォームXObjectの生データをハッシュに加える"""
+    if not resources or "/XObject" not in resources:
+        return
+    xobjects = resources["/XObject"].get_object()
+    for name in sorted(xobjects.keys()):
+        ref = xobjects.raw_get(name)
+        key = (getattr(ref, "idnum", None), getattr(ref, "generation", None))
+        if key[0] is not None and key in seen:
+            continue
+        seen.add(key)
+        xobject = xobjects[name].get_object()
+        digest.update(name.encode("utf-8"))
+        digest.update(getattr(xobject, "_data", b"") or b"")
+        if xobject.get("/Subtype") == "/Form":
+            _hash_resources(xobject.get("/Resources"), digest, seen)
+
+
+def page_fingerprints(pdf_content: bytes) -> List[str]:
+    """
+    ページごとの内容指紋（描画命令・埋め込み画像・ページサイズのSHA-256）
+    差し替え版PDFでも変更のないページは同じ指紋になる。解析できない場合は空リスト
+    """
+    try:
+        reader = PdfReader(io.BytesIO(pdf_content))
+        fingerprints = []
+        for page in reader.pages:
+            digest = hashlib.sha256()
+            digest.update(repr([float(value) for value in page.mediabox]).encode("ascii"))
+            digest.update(str(page.get("/Rotate", 0)).encode("ascii"))
+            contents = page.get_contents()
+            digest.update(contents.get_data() if contents is not None else b"")
+            _hash_resources(page.get("/Resources"), digest, set())
+            fingerprints.append(digest.hexdigest())
+        return fingerprints
+    except Exception as e:
+        logger.warning(f"ページ指紋の計算に失敗しました: {str(e)}")
+        return []
+
+
+def extract_pages(pdf_content: bytes, page_numbers: List[int]) -> bytes:
+    """指定したページ（0始まり）だけを含むPDFを作成"""
+    reader = PdfReader(io.BytesIO(pdf_content))
+    writer = PdfWriter()
+    for number in page_numbers:
+        writer.add_page(reader.pages[number])
+    output = io.BytesIO()
+    writer.write(output)
+    return output.getvalue()
@@ -0,0 +1,207 @@
+import re
+import unicodedata
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from models.document import DocumentCategory, LandBuildingData, ProcessedDocument
+from services.ledger import normalize_text
+
+REGISTRY = "登記簿"
+TAX_LEDGER = "名寄帳等"  # 名寄帳・固定資産税通知書・評価証明書
+
+LAND = "土地"
+BUILDING = "家屋"
+
+# Fields taken from the tax ledger when both sources have them; everything else prefers the registry
+_TAX_FIELDS = ("taxed_land_category", "fixed_asset_tax_value")
+# Location fields are equal by key, so differences in how they are written are not conflicts
+_KEY_FIELDS = ("prefecture", "city", "address", "lot_number", "house_number", "document_type")
+
+_KANJI_DIGITS = {"〇": 0, "零": 0, "一": 1, "壱": 1, "二": 2, "弐": 2, "三": 3, "参": 3, "四": 4,
+                 "五": 5, "六": 6, "七": 7, "八": 8, "九": 9}
+_KANJI_UNITS = {"十": 10, "拾": 10, "百": 100, "千": 1000}
+_KANJI_NUMBER = re.compile("[〇零一壱二弐三参四五六七八九十拾百千]+")
+# In district names only numerals before a unit are numbers (九段北, 三田 and 八丁堀 are names)
+_DISTRICT_NUMBER = re.compile("[〇零一壱二弐三参四五六七八九十拾百千]+(?=丁目|番|号|地割)")
+_PREFECTURE = re.compile(r"^(東京都|北海道|(京都|大阪)府|.{2,3}県)")
+_COUNTY = re.compile(r"^.+?郡(?=.+[町村]$)")  # only towns and villages belong to a county
+_TRAILING_NUMBER = re.compile(r"(\d+(番地|番|号|の|-)?)+$")
+_DIGITS = re.compile(r"\d+")
+
+# (種別, 市区町村, 大字・丁目, 地番または家屋番号)
+ParcelKey = Tuple[str, str, str, str]
+
+
+def kanji_to_int(text: str) -> int:
+    """漢数字を整数に変換（「百二十三」のような位取りと「一〇二」のような桁の並びの両方）"""
+    if all(char in _KANJI_DIGITS for char in text):
+        return int("".join(str(_KANJI_DIGITS[char]) for char in text))
+    total, current = 0, 0
+    for char in text:
+        if char in _KANJI_UNITS:
+            total += (current or 1) * _KANJI_UNITS[char]
+            current = 0
+        else:
+            current = current * 10 + _KANJI_DIGITS[char]
+    return total + current
+
+
+def _normalize(value: Any) -> str:
+    text = unicodedata.normalize("NFKC", str(value or ""))
+    # Dashes and long vowel marks used as separators in lot numbers
+    return re.sub(r"[‐‑‒–—―−ーｰ]", "-", "".join(text.split()))
+
+
+def normalize_city(value: Any) -> str:
+    """市区町村の比較用の表記（都道府県・郡の部分を除く）"""
+    text = _PREFECTURE.sub("", _normalize(value))
+    return _COUNTY.sub("", text)
+
+
+def normalize_district(value: Any, city: str = "", number: str = "") -> str:
+    """
+    大字・丁目の比較用の表記（「大字」「字」を除き、丁目・番の前の漢数字を数字にする）
+    末尾に書かれた番号は、書類自身の地番・家屋番号（numberは正規化済み）と同じときだけ除く
+    """
+    text = _PREFECTURE.sub("", _normalize(value))
+    if city and text.startswith(city):
+        text = text[len(city):]
+    text = re.sub(r"^大?字", "", text)
+    text = _DISTRICT_NUMBER.sub(lambda match: str(kanji_to_int(match.group())), text)
+    # Tax ledgers often write the lot into the location ("山下町1-1"); other trailing
+    # numbers are part of the district ("本町3" is not "本町")
+    match = _TRAILING_NUMBER.search(text)
+    if match and number and match.start() > 0 and normalize_number(match.group()) == number:
+        return text[:match.start()]
+    return text
+
+
+def normalize_number(value: Any) -> str:
+    """地番・家屋番号の比較用の表記（「123番4」「123-4」「百二十三番の四」を「123-4」にそろえる）"""
+    text = _KANJI_NUMBER.sub(lambda match: str(kanji_to_int(match.group())), _normalize(value))
+    numbers = _DIGITS.findall(text)
+    return "-".join(str(int(number)) for number in numbers) if numbers else text
+
+
+def _comparable(value: Any) -> str:
+    """不一致の判定用（数値は表記の違いを無視する）"""
+    text = normalize_text(value).replace(",", "")
+    try:
+        return repr(float(text))
+    except ValueError:
+        return text
+
+
+def parcel_key(data: Dict[str, Any]) -> Optional[ParcelKey]:
+    """土地・家屋の所在のキー（地番・家屋番号がなければNone）"""
+    city = normalize_city(data.get("city"))
+    if data.get("house_number"):
+        kind, number = BUILDING, normalize_number(data["house_number"])
+    elif data.get("lot_number"):
+        kind, number = LAND, normalize_number(data["lot_number"])
+    else:
+        return None
+    return kind, city, normalize_district(data.get("address"), city, number), number
+
+
+def source_type(data: Dict[str, Any]) -> str:
+    """書類が登記簿か名寄帳等か（書類の種類の記載がなければ課税側の項目の有無で判断）"""
+    document_type = _normalize(data.get("document_type"))
+    if "登記" in document_type:
+        return REGISTRY
+    if any(word in document_type for word in ("名寄", "固定資産", "課税", "評価証明")):
+        return TAX_LEDGER
+    if data.get("fixed_asset_tax_value") or data.get("taxed_land_category"):
+        return TAX_LEDGER
+    return REGISTRY
+
+
+@dataclass
+class ParcelRecord:
+    """1筆の土地・1棟の家屋について、登記簿と名寄帳等の記載をまとめたもの（項目ごとに出典の書類を持つ）"""
+    key: Optional[ParcelKey]
+    documents: List[Tuple[ProcessedDocument, str]] = field(default_factory=list)  # (書類, 出典種別)
+    data: Dict[str, Any] = field(default_factory=dict)
+    sources: Dict[str, str] = field(default_factory=dict)  # 項目 -> 書類ID
+    conflicts: Dict[str, List[Any]] = field(default_factory=dict)  # 項目 -> 書類ごとに異なる値
+
+    @property
+    def kind(self) -> str:
+        return self.key[0] if self.key else (BUILDING if self.data.get("house_number") else LAND)
+
+    @property
+    def source_types(self) -> List[str]:
+        return sorted({source for _, source in self.documents}, key=(REGISTRY, TAX_LEDGER).index)
+
+    def consolidate(self) -> None:
+        """出典の優先順位（登記簿の項目は登記簿、課税の項目は名寄帳等、同じ種別は処理日時順）で項目の値を決める"""
+        self.data, self.sources, self.conflicts = {}, {}, {}
+        for name in LandBuildingData.__fields__:
+            preferred = TAX_LEDGER if name in _TAX_FIELDS else REGISTRY
+            ordered = sorted(self.documents, key=lambda item: (item[1] != preferred, item[0].processed_at))
+            if name == "owner_names":
+                self._merge_owners(ordered)
+                continue
+            values = [(doc, doc.extracted_data.get(name)) for doc, _ in ordered]
+            values = [(doc, value) for doc, value in values if value not in (None, "")]
+            if not values:
+                continue
+            self.data[name], self.sources[name] = values[0][1], values[0][0].id
+            distinct = {_comparable(value) for _, value in values}
+            if name not in _KEY_FIELDS and len(distinct) > 1:
+                self.conflicts[name] = list(dict.fromkeys(value for _, value in values))
+
+    def _merge_owners(self, ordered: List[Tuple[ProcessedDocument, str]]) -> None:
+        """所有者は全書類の記載を合わせる（表記の違いだけのものは1人とする）"""
+        owners: Dict[str, str] = {}
+        for doc, _ in ordered:
+            names = doc.extracted_data.get("owner_names") or []
+            if names and not owners:
+                self.sources["owner_names"] = doc.id
+            for owner in names:
+                owners.setdefault(normalize_text(owner), owner)
+        if owners:
+            self.data["owner_names"] = list(owners.values())
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "種別": self.kind,
+            "照合": "+".join(self.source_types),
+            **self.data,
+            "出典": dict(self.sources),
+            "書類": [
+                {"書類ID": doc.id, "元ファイル": doc.original_filename, "出典種別": source}
+                for doc, source in self.documents
+            ],
+            "不一致": self.conflicts,
+        }
+
+
+def merge_real_estate(docs: List[ProcessedDocument]) -> List[ParcelRecord]:
+    """
+    土地・建物の書類を所在（市区町村・大字・丁目・地番/家屋番号）ごとに1件にまとめる
+    正規化した所在のキーでハッシュ索引を作って突き合わせるため、書類数に比例した時間で済む。
+    市区町村の記載がない書類（市区町村発行の名寄帳に多い）は、残りのキーが一致する所在が1件だけならそこに含める
+    """
+    groups: Dict[Any, ParcelRecord] = {}
+    for doc in docs:
+        if doc.category != DocumentCategory.LAND_BUILDING or doc.duplicate_of:
+            continue
+        key = parcel_key(doc.extracted_data)
+        record = groups.setdefault(key if key else ("", "", "", doc.id), ParcelRecord(key))
+        record.documents.append((doc, source_type(doc.extracted_data)))
+
+    # Second index without the city, for records whose document did not give one
+    by_location: Dict[Tuple[str, str, str], List[ParcelKey]] = {}
+    for key, record in groups.items():
+        if record.key and key[1]:
+            by_location.setdefault((key[0], key[2], key[3]), []).append(key)
+    for key in [key for key, record in groups.items() if record.key and not key[1]]:
+        candidates = by_location.get((key[0], key[2], key[3]), [])
+        if len(candidates) == 1:
+            groups[candidates[0]].documents.extend(groups.pop(key).documents)
+
+    records = list(groups.values())
+    for record in records:
+        record.consolidate()
+    return records
@@ -0,0 +1,201 @@
+import re
+import unicodedata
+from datetime import date
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from models.document import DocumentCategory, ProcessedDocument
+from services.ledger import AccountLedger, parse_date, to_amount
+
+# Result statuses
+MATCHED = "matched"  # 通帳の残高と一致
+MISMATCHED = "mismatched"  # 通帳の残高と不一致
+NO_PASSBOOK = "no_passbook"  # 対応する通帳がない
+AMBIGUOUS = "ambiguous"  # 対応しうる通帳が複数
+NO_BALANCE = "no_balance"  # 通帳に基準日以前の残高がない
+NO_DATE = "no_date"  # 証明日も相続開始日もない
+NO_CERTIFICATE_BALANCE = "no_certificate_balance"  # 証明書から残高を読み取れていない
+
+_CORPORATE = re.compile(r"株式会社|\(株\)|有限会社")  # NFKC turns ㈱ into (株)
+_BRANCH_SUFFIX = re.compile(r"(支店|支所|出張所|営業部|本店営業部|店)$")
+_DIGITS = re.compile(r"\d+")
+
+# (金融機関, 支店, 口座番号) after normalization; missing parts are ""
+AccountIdentity = Tuple[str, str, str]
+
+# Item names of key_information (batch uploads) for each DepositData field
+_KEY_INFORMATION_NAMES = {
+    "financial_institution": ("金融機関", "金融機関名", "銀行名", "銀行"),
+    "branch": ("支店", "支店名", "店名", "取扱店", "取扱店名"),
+    "account_number": ("口座番号", "記号番号"),
+    "balance": ("残高", "預金残高", "証明残高", "残高金額", "合計残高"),
+    "certificate_date": ("証明日", "基準日", "残高証明日", "証明年月日"),
+}
+
+
+def _normalize(value: Any) -> str:
+    return "".join(unicodedata.normalize("NFKC", str(value or "")).split())
+
+
+def normalize_institution(value: Any) -> str:
+    """金融機関名の比較用の表記（「株式会社」等を除く。「銀行」は残す）"""
+    return _CORPORATE.sub("", _normalize(value))
+
+
+def normalize_branch(value: Any) -> str:
+    """支店名の比較用の表記（「支店」「出張所」等を除く）"""
+    text = _normalize(value)
+    return _BRANCH_SUFFIX.sub("", text) or text
+
+
+def normalize_account_number(value: Any) -> str:
+    """口座番号の比較用の表記（数字のみ、先頭の0を除く）"""
+    digits = "".join(_DIGITS.findall(_normalize(value)))
+    return digits.lstrip("0") or digits
+
+
+def certificate_fields(data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    残高証明書の抽出データから金融機関・支店・口座番号・残高・証明日を取り出す
+    一括アップロードの書類は預貯金データの項目を持たないため、重要情報（key_information）の項目名から読む
+    """
+    key_information = {_normalize(name): value for name, value in (data.get("key_information") or {}).items()}
+    fields = {}
+    for field, names in _KEY_INFORMATION_NAMES.items():
+        value = data.get(field)
+        if value is None or value == "":
+            value = next((key_information[name] for name in names if key_information.get(name) not in (None, "")), None)
+        fields[field] = value
+    return fields
+
+
+def ledger_identity(account: str) -> Tuple[AccountIdentity, str]:
+    """
+    元帳の口座キーを (金融機関, 支店, 口座番号) と正規化した全体の文字列に分ける
+    「金融機関/支店/口座番号」の形式でない口座キー（通帳の口座欄の自由記述）は、4桁以上の最も長い数字を口座番号とみなす
+    """
+    parts = account.split("/")
+    if len(parts) == 3:
+        return (normalize_institution(parts[0]), normalize_branch(parts[1]), normalize_account_number(parts[2])), _normalize(account)
+    text = _normalize(account)
+    numbers = sorted((number for number in _DIGITS.findall(text) if len(number) >= 4), key=len, reverse=True)
+    return ("", "", normalize_account_number(numbers[0]) if numbers else ""), text
+
+
+class AccountIndex:
+    """
+    元帳を口座番号と (金融機関, 支店) で引ける索引（証明書1件あたりハッシュ表の参照で候補を絞る）
+    口座番号のわからない元帳（ファイル名由来の口座キー）だけは、金融機関名・支店名を含むかを順に調べる
+    """
+
+    def __init__(self, ledgers: Iterable[AccountLedger]):
+        self._by_number: Dict[str, List[Tuple[AccountIdentity, str, AccountLedger]]] = {}
+        self._by_branch: Dict[Tuple[str, str], List[Tuple[AccountIdentity, str, AccountLedger]]] = {}
+        self._unnumbered: List[Tuple[AccountIdentity, str, AccountLedger]] = []
+        for ledger in ledgers:
+            identity, text = ledger_identity(ledger.account)
+            item = (identity, text, ledger)
+            if identity[2]:
+                self._by_number.setdefault(identity[2], []).append(item)
+            if identity[0]:
+                self._by_branch.setdefault(identity[:2], []).append(item)
+            elif not identity[2]:
+                # Keys taken from file names often carry no account number at all
+                self._unnumbered.append(item)
+
+    def find(self, identity: AccountIdentity) -> List[AccountLedger]:
+        """証明書の口座に対応する元帳の候補"""
+        institution, branch, number = identity
+        # The same number at different banks: keep the ones that do not contradict the bank and branch
+        candidates = [
+            item for item in self._by_number.get(number, [])
+            if _compatible(item, institution, 0) and _compatible(item, branch, 1)
+        ]
+        if not candidates and institution:
+            # Ledgers with a different account number are other accounts at the same branch
+            candidates = [item for item in self._by_branch.get((institution, branch), []) if not number or not item[0][2]]
+            candidates += [
+                item for item in self._unnumbered
+                if institution in item[1] and (not branch or branch in item[1])
+            ]
+        return [ledger for _, _, ledger in candidates]
+
+
+def _compatible(item: Tuple[AccountIdentity, str, AccountLedger], value: str, part: int) -> bool:
+    identity, text, _ = item
+    if not value:
+        return True
+    if identity[part]:
+        return identity[part] == value
+    return value in text  # free-form account key: the name only has to appear in it
+
+
+def reconcile(
+    documents: Iterable[ProcessedDocument],
+    ledgers: Iterable[AccountLedger],
+    date_of_death: Optional[date] = None
+) -> Dict[str, Any]:
+    """
+    残高証明書（預貯金の書類）の残高を、同じ口座の通帳の基準日時点の残高と突き合わせる
+    基準日は証明書の証明日、なければ相続開始日
+    """
+    index = AccountIndex(ledgers)
+    results = []
+    for doc in documents:
+        if doc.category != DocumentCategory.DEPOSIT or doc.duplicate_of:
+            continue
+        results.append(_reconcile_certificate(doc, index, date_of_death))
+
+    summary: Dict[str, int] = {}
+    for result in results:
+        summary[result["status"]] = summary.get(result["status"], 0) + 1
+    return {"summary": summary, "results": results}
+
+
+def _reconcile_certificate(doc: ProcessedDocument, index: AccountIndex, date_of_death: Optional[date]) -> Dict[str, Any]:
+    data = certificate_fields(doc.extracted_data)
+    as_of = parse_date(data["certificate_date"]) or date_of_death
+    # A missing balance is not a balance of zero
+    certificate_balance = to_amount(data["balance"]) if data["balance"] not in (None, "") else None
+    identity = (
+        normalize_institution(data.get("financial_institution")),
+        normalize_branch(data.get("branch")),
+        normalize_account_number(data.get("account_number")),
+    )
+    result: Dict[str, Any] = {
+        "document_id": doc.id,
+        "filename": doc.original_filename,
+        "financial_institution": data.get("financial_institution"),
+        "branch": data.get("branch"),
+        "account_number": data.get("account_number"),
+        "as_of": as_of,
+        "certificate_balance": certificate_balance,
+        "account": None,
+        "passbook_balance": None,
+        "passbook_date": None,
+        "difference": None,
+        "source": None,
+    }
+
+    candidates = index.find(identity)
+    if not candidates:
+        return dict(result, status=NO_PASSBOOK)
+    if len(candidates) > 1:
+        return dict(result, status=AMBIGUOUS, candidates=[ledger.account for ledger in candidates])
+    ledger = candidates[0]
+    result["account"] = ledger.account
+    if certificate_balance is None:
+        return dict(result, status=NO_CERTIFICATE_BALANCE)
+    if as_of is None:
+        return dict(result, status=NO_DATE)
+
+    entry = ledger.balance_at(as_of)
+    if entry is None:
+        return dict(result, status=NO_BALANCE)
+    document_id, row = entry.sources[0]
+    result.update(
+        passbook_balance=entry.balance,
+        passbook_date=entry.date,
+        difference=certificate_balance - entry.balance,
+        source={"書類ID": document_id, "行": row + 1},
+    )
+    return dict(result, status=MATCHED if entry.balance == certificate_balance else MISMATCHED)
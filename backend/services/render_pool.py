@@ -0,0 +1,203 @@
+import asyncio
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from threading import Lock
+from typing import Any, Dict, List, Optional, Tuple
+from loguru import logger
+from PyPDF2 import PdfReader
+
+from core.config import settings
+from core.metrics import metrics
+from services.thumbnails import (
+    EncodedImage, detect_mime_type, encode_jpeg, render_file_page,
+    thumbnail_cache, thumbnail_dpi, thumbnail_key
+)
+
+# Job kind "jpeg" returns paths of encoded page images.
+# A "crop" option (left, top, right, bottom) cuts that box out of the page before encoding.
+
+
+def available_cpus() -> int:
+    """コンテナで使えるCPU数（cgroupのCPU上限とアフィニティの小さい方）"""
+    count = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+    try:
+        quota, period = Path("/sys/fs/cgroup/cpu.max").read_text().split()
+        if quota != "max":
+            count = min(count, max(1, int(quota) // int(period)))
+    except (OSError, ValueError):
+        pass
+    return max(1, count)
+
+
+def _run_job(path: str, mime_type: str, page: Optional[int], dpi: int, kind: str, options: Dict[str, Any], submitted: float) -> Tuple[float, float, List[Any]]:
+    """
+    ワーカープロセスで1ページ分を描画（画像は1ファイル分）
+    入力は一時ファイルから読み、JPEGは一時ファイルに書いてパスを返す（大きなバイト列をプロセス間で受け渡さない）
+    """
+    started = time.time()
+    images = render_file_page(path, mime_type, dpi, page)
+    box = options.pop("crop", None)
+    if box is not None:
+        images = [image.crop(tuple(box)) for image in images]
+    results = []
+    for image in images:
+        fd, output = tempfile.mkstemp(suffix=".jpg")
+        with os.fdopen(fd, "wb") as file:
+            file.write(encode_jpeg(image, **options))
+        results.append(output)
+    return started - submitted, time.time() - started, results
+
+
+def _pdf_page_count(path: str) -> int:
+    return len(PdfReader(path).pages)
+
+
+def _write_input(content: bytes, suffix: str) -> str:
+    fd, path = tempfile.mkstemp(suffix=suffix)
+    with os.fdopen(fd, "wb") as file:
+        file.write(content)
+    return path
+
+
+def _collect_outputs(paths: List[str]) -> List[bytes]:
+    """ワーカーが書いたJPEGを読み込み、一時ファイルを削除"""
+    outputs = []
+    for path in paths:
+        outputs.append(Path(path).read_bytes())
+        os.unlink(path)
+    return outputs
+
+
+def _discard_outputs(outcomes: List[Any], kind: str) -> None:
+    if kind != "jpeg":
+        return
+    for outcome in outcomes:
+        if not isinstance(outcome, BaseException):
+            for path in outcome[2]:
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+
+
+class RenderPool:
+    """
+    PDFのページ描画・画像のデコードと縮小を行うプロセスプール
+    CPU負荷の高い処理をイベントループから外し、PDFはページ単位の作業に分けて並列に描画する
+    """
+
+    def __init__(self, workers: int = 0):
+        self.workers = workers or available_cpus()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # spawn: forking a process that runs an event loop and threads is unsafe
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+                logger.info(f"描画プロセスプールを開始: {self.workers} workers")
+            return self._executor
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    async def _render(
+        self,
+        content: bytes,
+        mime_type: str,
+        kind: str,
+        dpi: int,
+        options: Optional[Dict[str, Any]] = None,
+        max_pages: Optional[int] = None,
+        crops: Optional[List[Tuple[int, int, int, int]]] = None
+    ) -> List[Any]:
+        """ページごと（cropsを指定した場合は切り出す範囲ごと）の作業をプールに投入し、順番どおりの結果を返す"""
+        is_pdf = mime_type == "application/pdf"
+        path = await asyncio.to_thread(_write_input, content, ".pdf" if is_pdf else ".img")
+        try:
+            pages: List[Optional[int]] = [None]
+            if is_pdf:
+                count = await asyncio.to_thread(_pdf_page_count, path)
+                pages = list(range(1, min(count, max_pages or count) + 1))
+            items = [(page, options or {}) for page in pages]
+            if crops is not None:
+                items = [(pages[0], {**(options or {}), "crop": box}) for box in crops]
+
+            executor = self._get_executor()
+            loop = asyncio.get_running_loop()
+            submitted = time.time()
+            outcomes = await asyncio.gather(
+                *[loop.run_in_executor(executor, _run_job, path, mime_type, page, dpi, kind, item_options, submitted) for page, item_options in items],
+                return_exceptions=True
+            )
+        finally:
+            os.unlink(path)
+
+        errors = [outcome for outcome in outcomes if isinstance(outcome, BaseException)]
+        if errors:
+            _discard_outputs(outcomes, kind)
+            if isinstance(errors[0], BrokenProcessPool):
+                self.shutdown()  # a worker died; start a fresh pool on the next job
+            raise errors[0]
+
+        elapsed = time.time() - submitted
+        for wait, seconds, _ in outcomes:
+            metrics.observe("render.queue_wait_seconds", wait)
+            metrics.observe("render.page_seconds", seconds)
+        metrics.increment("render.pages", len(items))
+        metrics.observe("render.pages_per_second", len(items) / elapsed if elapsed > 0 else 0.0)
+
+        results = [result for _, _, page_results in outcomes for result in page_results]
+        if kind == "jpeg":
+            return await asyncio.to_thread(_collect_outputs, results)
+        return results
+
+    async def page_jpegs(self, content: bytes, filename: str = "", dpi: int = 200) -> List[bytes]:
+        """PDF・画像をページごとのJPEGに変換（JPEGはそのまま返す）"""
+        mime_type = detect_mime_type(content, filename)
+        if mime_type == "image/jpeg":
+            return [content]
+        return await self._render(content, mime_type, "jpeg", dpi, {"quality": 90})
+
+    async def image_strips(self, content: bytes, boxes: List[Tuple[int, int, int, int]], filename: str = "") -> List[bytes]:
+        """画像から指定範囲（left, top, right, bottom）を切り出したJPEGを範囲ごとに並列で生成"""
+        mime_type = detect_mime_type(content, filename)
+        return await self._render(content, mime_type, "jpeg", settings.PASSBOOK_RENDER_DPI, {"quality": 90}, crops=boxes)
+
+    async def classification_images(self, content: bytes, filename: str = "") -> List[EncodedImage]:
+        """分類用に先頭ページを縮小したJPEG（描画できない形式は元データを正しいMIMEタイプで返す）"""
+        key = thumbnail_key(content)
+        cached = thumbnail_cache.get(key)
+        if cached is not None:
+            return cached
+
+        max_side = settings.CLASSIFY_THUMBNAIL_MAX_SIDE
+        mime_type = detect_mime_type(content, filename)
+        try:
+            pages = await self._render(
+                content, mime_type, "jpeg", thumbnail_dpi(max_side),
+                {"max_side": max_side}, max_pages=settings.CLASSIFY_THUMBNAIL_PAGES
+            )
+            images = [(data, "image/jpeg") for data in pages[:settings.CLASSIFY_THUMBNAIL_PAGES]]
+        except Exception as e:
+            logger.warning(f"サムネイル生成に失敗したため元データで分類します ({mime_type}): {str(e)}")
+            # The original itself (up to the upload limit) is not worth a cache slot
+            return [(content, mime_type)]
+
+        thumbnail_cache.put(key, images)
+        return images
+
+
+render_pool = RenderPool(settings.RENDER_WORKERS)
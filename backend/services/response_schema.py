@@ -0,0 +1,124 @@
+from datetime import date, datetime
+from enum import Enum
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Type
+import google.generativeai as genai
+from pydantic import BaseModel, Field
+from pydantic.fields import ModelField, SHAPE_LIST, SHAPE_SINGLETON
+
+# Gemini response schemas use the OpenAPI subset with upper-case type names
+_SCALAR_TYPES = {
+    str: "STRING",
+    bool: "BOOLEAN",  # before int: bool is a subclass of int
+    int: "INTEGER",
+    float: "NUMBER",
+    date: "STRING",
+    datetime: "STRING",
+}
+
+
+class KeyValue(BaseModel):
+    """重要情報の1項目（スキーマでは自由なキーのオブジェクトを表せないため項目名と値の組にする）"""
+    name: str = Field(..., description="項目名")
+    value: str = Field(..., description="値")
+
+
+class ImageExtraction(BaseModel):
+    """画像からの抽出結果"""
+    document_type: str = Field(..., description="推測される文書タイプ")
+    extracted_text: str = Field(..., description="抽出したテキスト")
+    key_information: List[KeyValue] = Field(default_factory=list, description="金額・日付・名前などの重要情報")
+
+
+class PageExtraction(BaseModel):
+    """PDFの1ページからの抽出結果"""
+    page: int = Field(..., description="ページ番号")
+    extracted_text: str = Field(..., description="そのページから抽出したテキスト全体")
+    key_information: List[KeyValue] = Field(default_factory=list, description="そのページに記載された重要情報")
+
+
+class PdfExtraction(BaseModel):
+    """PDFからのページごとの抽出結果"""
+    document_type: str = Field(..., description="文書種類")
+    pages: List[PageExtraction] = Field(..., description="全ページ（ページ順）")
+
+
+class DocumentSummary(BaseModel):
+    """テキストレイヤーからの抽出結果（本文は再出力しない）"""
+    document_type: str = Field(..., description="文書種類")
+    key_information: List[KeyValue] = Field(default_factory=list, description="文書に応じた重要情報")
+
+
+def _value_schema(field_type: Any) -> Dict[str, Any]:
+    if isinstance(field_type, type) and issubclass(field_type, BaseModel):
+        return schema_from_model(field_type)
+    if isinstance(field_type, type) and issubclass(field_type, Enum):
+        return {"type": "STRING", "enum": [str(member.value) for member in field_type]}
+    for python_type, schema_type in _SCALAR_TYPES.items():
+        if isinstance(field_type, type) and issubclass(field_type, python_type):
+            return {"type": schema_type}
+    raise TypeError(f"レスポンススキーマに変換できない型です: {field_type}")
+
+
+def _field_schema(field: ModelField) -> Dict[str, Any]:
+    if field.shape == SHAPE_LIST:
+        schema = {"type": "ARRAY", "items": _value_schema(field.type_)}
+    elif field.shape == SHAPE_SINGLETON:
+        schema = _value_schema(field.type_)
+    else:
+        raise TypeError(f"レスポンススキーマに変換できない項目です: {field.name}")
+    description = field.field_info.description
+    if field.type_ in (date, datetime):
+        description = f"{description}（yyyy-mm-dd）" if description else "yyyy-mm-dd"
+    if description:
+        schema["description"] = description
+    if field.allow_none:
+        schema["nullable"] = True
+    return schema
+
+
+def schema_from_model(model: Type[BaseModel], exclude: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    PydanticモデルからGeminiのレスポンススキーマを生成
+    キーは別名（alias）を使い、全項目を必須にする（Optionalの項目はnullを許可）
+    """
+    properties = {
+        field.alias: _field_schema(field)
+        for field in model.__fields__.values()
+        if field.alias not in (exclude or [])
+    }
+    return {"type": "OBJECT", "properties": properties, "required": list(properties)}
+
+
+def array_schema(item_schema: Dict[str, Any]) -> Dict[str, Any]:
+    return {"type": "ARRAY", "items": item_schema}
+
+
+@lru_cache(maxsize=1)
+def supports_response_schema() -> bool:
+    """
+    インストール済みのSDKがresponse_schemaを受け付けるか
+    requirements.txtの版（0.7系）は対応している。それより古いSDKではスキーマを付けずに送る
+    """
+    config_type = getattr(genai.types, "GenerationConfig", None)
+    return config_type is not None and "response_schema" in getattr(config_type, "__annotations__", {})
+
+
+def json_generation_config(schema: Optional[Dict[str, Any]] = None, **options: Any) -> Dict[str, Any]:
+    """JSON出力用の生成設定（SDKが対応していればレスポンススキーマで出力形式を強制する）"""
+    config: Dict[str, Any] = {"temperature": 0.1, "response_mime_type": "application/json"}
+    if schema is not None and supports_response_schema():
+        config["response_schema"] = schema
+    config.update(options)
+    return config
+
+
+def key_information_dict(value: Any) -> Dict[str, Any]:
+    """重要情報（項目名と値の組のリスト、または従来のオブジェクト）をオブジェクトに変換"""
+    if isinstance(value, dict):
+        return value
+    result: Dict[str, Any] = {}
+    for item in value or []:
+        if isinstance(item, dict) and item.get("name"):
+            result[item["name"]] = item.get("value")
+    return result
@@ -0,0 +1,174 @@
+import re
+import sqlite3
+import time
+import unicodedata
+from threading import Lock
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from core.metrics import metrics
+from models.document import DocumentCategory, ProcessedDocument
+from models.passbook import transaction_rows
+
+# Passbook transactions are indexed one row each; per-page results repeat extracted_text
+_SKIPPED_FIELDS = ("transactions", "pages")
+_NON_WORD = re.compile(r"\W+")
+SNIPPET_CONTEXT = 20
+
+
+def _display_text(value: Any) -> str:
+    """スニペット用の表記（全角半角をそろえ、空白を1つにする）"""
+    return " ".join(unicodedata.normalize("NFKC", str(value)).split())
+
+
+def _searchable(value: Any) -> str:
+    """検索用の表記（全角半角・大文字小文字をそろえ、空白・記号を除く）"""
+    return _NON_WORD.sub("", unicodedata.normalize("NFKC", str(value)).lower())
+
+
+def bigrams(text: str) -> str:
+    """
+    2文字ずつずらした語の並び（FTS5のunicode61トークナイザーで1語ずつに分かれる）
+    末尾の1文字も語として加え、1文字の前方一致検索で末尾の文字も見つかるようにする
+    """
+    if not text:
+        return ""
+    return " ".join([text[i:i + 2] for i in range(len(text) - 1)] + [text[-1]])
+
+
+def _match_expression(query: str) -> Optional[str]:
+    """検索語（空白区切りでAND）をFTS5の検索式に変換（2文字以上の語は連続する2文字の並び、1文字の語は前方一致）"""
+    terms = []
+    for word in query.split():
+        term = _searchable(word)
+        if len(term) == 1:
+            terms.append(f'"{term}"*')
+        elif term:
+            terms.append('"' + " ".join(term[i:i + 2] for i in range(len(term) - 1)) + '"')
+    return " AND ".join(terms) or None
+
+
+def _snippet(text: str, query: str) -> str:
+    """本文の中で最初に一致した検索語の前後（一致部分は【】で囲む）"""
+    for word in query.split():
+        chars = _searchable(word)
+        if not chars:
+            continue
+        # Matches across the spaces and symbols that the index ignores ("1234-567" for "1234567")
+        match = re.search(r"\W*".join(map(re.escape, chars)), text, re.IGNORECASE)
+        if match:
+            start, end = match.span()
+            prefix = ("…" if start > SNIPPET_CONTEXT else "") + text[max(0, start - SNIPPET_CONTEXT):start]
+            suffix = text[end:end + SNIPPET_CONTEXT] + ("…" if end + SNIPPET_CONTEXT < len(text) else "")
+            return f"{prefix}【{match.group()}】{suffix}"
+    return text[:SNIPPET_CONTEXT * 2]
+
+
+def _fields(value: Any, path: str = "") -> Iterator[Tuple[str, str]]:
+    """抽出データの文字列・数値の項目を (項目のパス, 値) で列挙（入れ子のdict・listも辿る）"""
+    if isinstance(value, dict):
+        for key, item in value.items():
+            if not path and key in _SKIPPED_FIELDS:
+                continue
+            yield from _fields(item, f"{path}.{key}" if path else str(key))
+    elif isinstance(value, list):
+        for item in value:
+            yield from _fields(item, path)
+    elif isinstance(value, (str, int, float)) and not isinstance(value, bool) and str(value).strip():
+        yield path, str(value)
+
+
+class SearchIndex:
+    """
+    書類の全文検索索引（SQLite FTS5）
+    日本語は単語に区切らずに2文字単位の語で索引し、抽出テキスト・抽出項目・通帳の取引内容を1行ずつ持つ。
+    書類の保存・更新・削除のたびにその書類の行だけを入れ替える
+    """
+
+    def __init__(self, path: str = ":memory:"):
+        self._lock = Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS entries USING fts5("
+            "grams, text UNINDEXED, document_id UNINDEXED, case_id UNINDEXED, field UNINDEXED, row UNINDEXED, "
+            "tokenize = 'unicode61 remove_diacritics 0')"
+        )
+        # Row IDs per document, so that updates do not scan the UNINDEXED columns
+        self._connection.execute("CREATE TABLE IF NOT EXISTS document_rows (document_id TEXT NOT NULL, entry INTEGER NOT NULL)")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS document_rows_id ON document_rows (document_id)")
+
+    def _entries(self, document: ProcessedDocument) -> Iterator[Tuple[str, Optional[int], str]]:
+        """(項目, 取引の行番号, 値)"""
+        yield "元ファイル", None, document.original_filename
+        for field, value in _fields(document.extracted_data):
+            yield field, None, value
+        if document.category == DocumentCategory.PASSBOOK:
+            for row, transaction in enumerate(transaction_rows(document.extracted_data.get("transactions"))):
+                if transaction.get("取引内容"):
+                    yield "取引内容", row, str(transaction["取引内容"])
+
+    def add_document(self, document: ProcessedDocument) -> None:
+        """書類を索引に追加（すでにある場合は置き換える）"""
+        rows = [
+            (bigrams(_searchable(value)), _display_text(value), document.id, document.case_id, field, row)
+            for field, row, value in self._entries(document)
+        ]
+        with self._lock, self._connection:
+            self._delete(document.id)
+            for entry in rows:
+                cursor = self._connection.execute(
+                    "INSERT INTO entries (grams, text, document_id, case_id, field, row) VALUES (?, ?, ?, ?, ?, ?)", entry
+                )
+                self._connection.execute(
+                    "INSERT INTO document_rows (document_id, entry) VALUES (?, ?)", (document.id, cursor.lastrowid)
+                )
+        metrics.increment("search.indexed_entries", len(rows))
+
+    def remove_document(self, document_id: str) -> None:
+        with self._lock, self._connection:
+            self._delete(document_id)
+
+    def _delete(self, document_id: str) -> None:
+        entries = [row[0] for row in self._connection.execute(
+            "SELECT entry FROM document_rows WHERE document_id = ?", (document_id,)
+        )]
+        self._connection.executemany("DELETE FROM entries WHERE rowid = ?", [(entry,) for entry in entries])
+        self._connection.execute("DELETE FROM document_rows WHERE document_id = ?", (document_id,))
+
+    def search(self, query: str, case_id: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        """
+        検索語を含む項目を関連度順に返す（空白区切りの語はすべて含むもの）
+        各結果は書類ID・項目・通帳の行番号（1始まり）と、一致部分を【】で囲んだ前後の文
+        """
+        expression = _match_expression(query)
+        if expression is None:
+            return []
+        started = time.perf_counter()
+        sql = "SELECT document_id, case_id, field, row, text, bm25(entries) FROM entries WHERE entries MATCH ?"
+        parameters: List[Any] = [expression]
+        if case_id is not None:
+            sql += " AND case_id = ?"
+            parameters.append(case_id)
+        sql += " ORDER BY bm25(entries) LIMIT ?"
+        parameters.append(limit)
+        with self._lock:
+            rows = self._connection.execute(sql, parameters).fetchall()
+        metrics.observe("search.query_seconds", time.perf_counter() - started)
+        return [
+            {
+                "document_id": document_id,
+                "case_id": row_case_id,
+                "field": field,
+                "row": row + 1 if row is not None else None,
+                "snippet": _snippet(text, query),
+                "score": -score,
+            }
+            for document_id, row_case_id, field, row, text, score in rows
+        ]
+
+    def clear(self) -> None:
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM entries")
+            self._connection.execute("DELETE FROM document_rows")
+
+
+search_index = SearchIndex()
@@ -0,0 +1,99 @@
+import hashlib
+import io
+from collections import OrderedDict
+from threading import Lock
+from typing import List, Optional, Tuple
+from PIL import Image
+
+from core.config import settings
+
+# HEIC/HEIF decoding is optional; without it those images are sent to the model as-is
+try:
+    from pillow_heif import register_heif_opener
+    register_heif_opener()
+except ImportError:
+    pass
+
+# (画像バイト列, MIMEタイプ)
+EncodedImage = Tuple[bytes, str]
+
+
+def detect_mime_type(content: bytes, filename: str = "") -> str:
+    """先頭バイト（なければ拡張子）からMIMEタイプを判定"""
+    if content.startswith(b"%PDF"):
+        return "application/pdf"
+    if content.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if content.startswith(b"\x89PNG"):
+        return "image/png"
+    if content[4:12] in (b"ftypheic", b"ftypheix", b"ftypmif1", b"ftypmsf1", b"ftypheif"):
+        return "image/heic"
+
+    name = filename.lower()
+    if name.endswith(".pdf"):
+        return "application/pdf"
+    if name.endswith(".png"):
+        return "image/png"
+    if name.endswith((".heic", ".heif")):
+        return "image/heic"
+    return "image/jpeg"
+
+
+def render_file_page(path: str, mime_type: str, dpi: int, page: Optional[int] = None) -> List[Image.Image]:
+    """ファイルからページ画像を描画（PDFはpageで指定した1ページ、画像はファイル全体）"""
+    if mime_type == "application/pdf":
+        from pdf2image import convert_from_path
+        first = page or 1
+        return convert_from_path(path, dpi=dpi, first_page=first, last_page=page)
+
+    image = Image.open(path)
+    image.load()
+    return [image]
+
+
+def encode_jpeg(image: Image.Image, max_side: Optional[int] = None, quality: int = 80) -> bytes:
+    """長辺をmax_side以下に縮小してJPEGにエンコード"""
+    if image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    if max_side and max(image.size) > max_side:
+        image = image.copy()
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+    output = io.BytesIO()
+    image.save(output, format="JPEG", quality=quality, optimize=True)
+    return output.getvalue()
+
+
+class ThumbnailCache:
+    """コンテンツハッシュをキーとする分類用サムネイルのLRUキャッシュ"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, List[EncodedImage]]" = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key: str) -> Optional[List[EncodedImage]]:
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key: str, images: List[EncodedImage]) -> None:
+        with self._lock:
+            self._entries[key] = images
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+thumbnail_cache = ThumbnailCache(settings.THUMBNAIL_CACHE_SIZE)
+
+
+def thumbnail_key(content: bytes) -> str:
+    """分類用サムネイルのキャッシュキー（内容と描画設定）"""
+    return f"{hashlib.sha256(content).hexdigest()}:{settings.CLASSIFY_THUMBNAIL_PAGES}:{settings.CLASSIFY_THUMBNAIL_MAX_SIDE}"
+
+
+def thumbnail_dpi(max_side: int) -> int:
+    # Render just large enough for the thumbnail; 72dpi A4 is ~842px on the long side
+    return max(50, int(72 * max_side / 842))
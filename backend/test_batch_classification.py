@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""一括分類（マイクロバッチ）のテスト"""
+
+import asyncio
+import gc
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from models.document import DocumentCategory
+from services.classification_batcher import ClassificationBatcher
+from services.document_classifier import DocumentClassifier
+
+
+class FakeClassifier:
+    def __init__(self, batch_result=None, batch_error=None):
+        self.batch_calls = []
+        self.single_calls = []
+        self.batch_result = batch_result
+        self.batch_error = batch_error
+
+    async def classify_images_batch(self, batch):
+        self.batch_calls.append(batch)
+        if self.batch_error:
+            raise self.batch_error
+        return self.batch_result or [DocumentCategory.DEPOSIT] * len(batch)
+
+    async def classify_images(self, images):
+        self.single_calls.append(images)
+        return DocumentCategory.PASSBOOK
+
+
+def image(name):
+    return [(name.encode(), "image/jpeg")]
+
+
+@pytest.mark.asyncio
+async def test_concurrent_submits_share_one_request():
+    fake = FakeClassifier()
+    batcher = ClassificationBatcher(fake, max_batch=4, linger_ms=10)
+
+    results = await asyncio.gather(*[batcher.submit(image(str(i))) for i in range(5)])
+
+    assert [len(batch) for batch in fake.batch_calls] == [4]
+    assert len(fake.single_calls) == 1  # the fifth lingered alone
+    assert results == [DocumentCategory.DEPOSIT] * 4 + [DocumentCategory.PASSBOOK]
+
+
+@pytest.mark.asyncio
+async def test_flush_tasks_are_held_until_done():
+    fake = FakeClassifier()
+    batcher = ClassificationBatcher(fake, max_batch=4, linger_ms=10)
+
+    pending = asyncio.ensure_future(batcher.submit(image("a")))
+    await asyncio.sleep(0)
+    assert len(batcher._tasks) == 1  # the linger flush is referenced while it runs
+    gc.collect()
+
+    assert await pending == DocumentCategory.PASSBOOK
+    await asyncio.sleep(0)
+    assert batcher._tasks == set()
+
+
+@pytest.mark.asyncio
+async def test_batch_error_falls_back_to_single_calls():
+    fake = FakeClassifier(batch_error=ValueError("bad json"))
+    batcher = ClassificationBatcher(fake, max_batch=3, linger_ms=10)
+
+    results = await asyncio.gather(*[batcher.submit(image(str(i))) for i in range(3)])
+
+    assert results == [DocumentCategory.PASSBOOK] * 3
+    assert len(fake.single_calls) == 3
+
+
+@pytest.mark.asyncio
+async def test_unsure_items_are_reclassified_individually():
+    fake = FakeClassifier(batch_result=[DocumentCategory.DEPOSIT, None])
+    batcher = ClassificationBatcher(fake, max_batch=2, linger_ms=10)
+
+    results = await asyncio.gather(batcher.submit(image("a")), batcher.submit(image("b")))
+
+    assert results == [DocumentCategory.DEPOSIT, DocumentCategory.PASSBOOK]
+    assert fake.single_calls == [image("b")]
+
+
+def stub_classifier(text):
+    classifier = DocumentClassifier()
+    sent = []
+
+    class Model:
+        def generate_content(self, contents, generation_config=None):
+            sent.append(contents)
+            return SimpleNamespace(text=text)
+
+    classifier.router.get_model = lambda name: Model()
+    return classifier, sent
+
+
+@pytest.mark.asyncio
+async def test_classify_images_batch_maps_indices():
+    response = json.dumps([
+        {"index": 2, "document_type": "PASSBOOK", "confidence": 0.95},
+        {"index": 1, "document_type": "LAND_BUILDING", "confidence": 0.3},
+    ])
+    classifier, sent = stub_classifier(response)
+
+    categories = await classifier.classify_images_batch([image("a"), image("b")])
+
+    assert categories == [None, DocumentCategory.PASSBOOK]
+    assert "書類1" in sent[0] and "書類2" in sent[0]
+
+
+@pytest.mark.asyncio
+async def test_classify_images_batch_raises_on_wrong_count():
+    classifier, _ = stub_classifier(json.dumps([{"index": 1, "document_type": "DEBT", "confidence": 0.9}]))
+
+    with pytest.raises(ValueError):
+        await classifier.classify_images_batch([image("a"), image("b")])
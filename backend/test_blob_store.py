@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""アップロード原本のblob保存のテスト"""
+
+import os
+
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from api import blobs, documents
+from models.document import DocumentCategory, ProcessedDocument
+from services.blob_store import BlobStore
+from services.document_store import DocumentStore
+
+CONTENT = bytes(range(256)) * 4
+
+
+@pytest.fixture
+def store(monkeypatch, tmp_path):
+    store = BlobStore(str(tmp_path / "blobs"))
+    monkeypatch.setattr(blobs, "blob_store", store)
+    monkeypatch.setattr(documents, "blob_store", store)
+    return store
+
+
+def request(headers=None, method="GET"):
+    return Request({
+        "type": "http",
+        "method": method,
+        "path": "/",
+        "headers": [(key.lower().encode(), value.encode()) for key, value in (headers or {}).items()],
+    })
+
+
+async def send_response(response, method="GET"):
+    messages = []
+
+    async def receive():
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        messages.append(message)
+
+    await response({"type": "http", "method": method}, receive, send)
+    status = messages[0]["status"]
+    headers = {key.decode(): value.decode() for key, value in messages[0]["headers"]}
+    return status, headers, b"".join(message.get("body", b"") for message in messages[1:])
+
+
+def test_same_content_is_stored_once(store):
+    first = store.put(CONTENT, "application/pdf")
+    second = store.put(CONTENT, "application/pdf")
+
+    assert first == second
+    assert os.path.relpath(store.path(first), store.root).split(os.sep)[:2] == [first[:2], first[2:4]]
+    stored = [name for _, _, names in os.walk(store.root) for name in names if not name.startswith("blobs.sqlite3")]
+    assert stored == [first]
+
+
+def test_gc_removes_only_unreferenced_blobs_after_grace(store):
+    kept = store.put(CONTENT)
+    dropped = store.put(b"other")
+    store.link("case-a/doc", kept)
+    store.link("case-b/doc", kept)
+    store.link("case-a/other", dropped)
+    store.unlink("case-a/other")
+
+    assert store.gc(grace_seconds=3600) == {"removed": 0, "freed_bytes": 0}
+    assert store.gc(grace_seconds=0) == {"removed": 1, "freed_bytes": 5}
+    assert store.info(dropped) is None
+    assert store.info(kept)["ref_count"] == 2
+
+
+def test_refs_of_documents_lost_in_a_restart_are_dropped(store):
+    kept = store.put(CONTENT)
+    orphaned = store.put(b"other")
+    store.link("doc-live", kept)
+    store.link("doc-lost", orphaned)
+
+    # A fresh process only has the documents it still holds
+    restarted = BlobStore(store.root)
+    assert restarted.rebuild_refs({"doc-live": kept}) == 1
+
+    assert restarted.gc(grace_seconds=0) == {"removed": 1, "freed_bytes": 5}
+    assert restarted.info(kept)["ref_count"] == 1
+
+
+@pytest.mark.asyncio
+async def test_full_and_range_responses(store):
+    blob_id = store.put(CONTENT, "application/pdf")
+
+    status, headers, body = await send_response(await blobs.blob_response(request(), blob_id))
+    assert (status, body, headers["accept-ranges"]) == (200, CONTENT, "bytes")
+
+    status, headers, body = await send_response(await blobs.blob_response(request({"Range": "bytes=10-19"}), blob_id))
+    assert (status, body, headers["content-range"]) == (206, CONTENT[10:20], f"bytes 10-19/{len(CONTENT)}")
+
+    status, headers, body = await send_response(await blobs.blob_response(request({"Range": "bytes=-4"}), blob_id))
+    assert (status, body) == (206, CONTENT[-4:])
+
+    status, headers, body = await send_response(await blobs.blob_response(request({"Range": "bytes=1000-"}), blob_id))
+    assert (status, body) == (206, CONTENT[1000:])
+
+    with pytest.raises(HTTPException) as error:
+        await blobs.blob_response(request({"Range": f"bytes={len(CONTENT)}-"}), blob_id)
+    assert error.value.status_code == 416
+
+
+@pytest.mark.asyncio
+async def test_zero_copy_send_is_used_when_server_supports_it(store):
+    blob_id = store.put(CONTENT)
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {"type": "http", "method": "GET", "extensions": {"http.response.zerocopysend": {}}}
+    await (await blobs.blob_response(request({"Range": "bytes=4-7"}), blob_id))(scope, None, send)
+
+    assert messages[1]["type"] == "http.response.zerocopysend"
+    assert (messages[1]["offset"], messages[1]["count"]) == (4, 4)
+
+
+@pytest.mark.asyncio
+async def test_document_original_and_reference_counting(store, monkeypatch):
+    monkeypatch.setattr(documents, "documents_storage", DocumentStore())
+    blob_id = store.put(CONTENT, "application/pdf")
+    for case_id in ("case-a", "case-b"):
+        documents.save_document(ProcessedDocument(
+            id=f"{case_id}-doc", original_filename="登記簿.pdf", category=DocumentCategory.LAND_BUILDING,
+            case_id=case_id, blob_id=blob_id
+        ))
+
+    status, headers, body = await send_response(await documents.get_original("case-a-doc", request()))
+    assert (status, body) == (200, CONTENT)
+    assert "%E7%99%BB%E8%A8%98%E7%B0%BF.pdf" in headers["content-disposition"]
+
+    await documents.delete_document("case-a-doc")
+    assert store.info(blob_id)["ref_count"] == 1
+    await documents.delete_document("case-b-doc")
+    assert store.gc(grace_seconds=0)["removed"] == 1
@@ -0,0 +1,132 @@
+"""案件単位の書類の保存・一覧・出力・削除のテスト"""
+
+import time
+
+import pytest
+from fastapi import HTTPException
+
+from api import cases, documents
+from models.case import CaseCreateRequest
+from models.document import DocumentCategory, ProcessedDocument
+from services import page_dedup
+from services.document_store import DocumentStore
+from services.ledger import ledger_store
+from services.search_index import SearchIndex
+
+
+def passbook(doc_id, case_id, **fields):
+    return ProcessedDocument(
+        id=doc_id, original_filename=f"{doc_id}.pdf", category=DocumentCategory.PASSBOOK, case_id=case_id,
+        extracted_data={"transactions": [{"取引日": "2024-01-05", "出金額": 1000, "入金額": 0, "残高": 9000, "取引内容": "家賃"}]},
+        **fields
+    )
+
+
+def deposit(doc_id, case_id, **fields):
+    return ProcessedDocument(
+        id=doc_id, original_filename=f"{doc_id}.pdf", category=DocumentCategory.DEPOSIT, case_id=case_id,
+        extracted_data={"financial_institution": "みずほ銀行", "balance": 100}, **fields
+    )
+
+
+@pytest.fixture(autouse=True)
+def clean_store(monkeypatch, tmp_path):
+    store = DocumentStore()
+    monkeypatch.setattr(documents, "documents_storage", store)
+    monkeypatch.setattr(cases, "documents_storage", store)
+    monkeypatch.setattr(documents, "search_index", SearchIndex())
+    monkeypatch.setattr(page_dedup.settings, "INDEX_PATH", str(tmp_path))
+    monkeypatch.setattr(page_dedup, "_case_indexes", {})
+    ledger_store.clear()
+    yield store
+    ledger_store.clear()
+
+
+def test_store_keeps_partitions_and_counters(clean_store):
+    store = clean_store
+    store.put(passbook("a", "case-1"))
+    store.put(deposit("b", "case-1", duplicate_of="a"))
+    store.put(deposit("c", "case-2"))
+    store.put(deposit("loose", None))
+
+    assert len(store) == 4 and "b" in store and store.get("missing") is None
+    assert [doc.id for doc in store.case_documents("case-1")] == ["a", "b"]
+    assert [doc.id for doc in store.case_documents(None)] == ["loose"]
+    summary = store.case_summary("case-1")
+    assert summary["name"] == "case-1"  # registered on the first document
+    assert summary["document_count"] == 2
+    assert summary["categories"] == {DocumentCategory.PASSBOOK.value: 1, DocumentCategory.DEPOSIT.value: 1}
+    assert summary["duplicate_count"] == 1
+
+    # Moving a document to another case updates both partitions
+    store.put(deposit("b", "case-2"))
+    assert store.case_summary("case-1")["categories"] == {DocumentCategory.PASSBOOK.value: 1}
+    assert store.case_summary("case-1")["duplicate_count"] == 0
+    assert store.case_summary("case-2")["document_count"] == 2
+
+    store.pop("a")
+    assert store.case_summary("case-1")["document_count"] == 0
+    with pytest.raises(KeyError):
+        store.pop("a")
+
+
+@pytest.mark.asyncio
+async def test_case_endpoints():
+    created = await cases.create_case(CaseCreateRequest(id="case-1", name="山田太郎", date_of_death="2024-03-31"))
+    assert created["document_count"] == 0
+    with pytest.raises(HTTPException) as error:
+        await cases.create_case(CaseCreateRequest(id="case-1", name="重複"))
+    assert error.value.status_code == 409
+    generated = await cases.create_case(CaseCreateRequest(name="佐藤花子"))
+    assert generated["id"].startswith("case_")
+
+    documents.save_document(passbook("book", "case-1"))
+    documents.save_document(deposit("cert", "case-1"))
+    documents.save_document(deposit("other", "case-2"))
+
+    listed = {case["id"]: case for case in await cases.list_cases()}
+    assert listed["case-1"]["name"] == "山田太郎" and listed["case-1"]["document_count"] == 2
+    assert listed["case-2"]["document_count"] == 1
+    assert [doc.id for doc in await cases.list_case_documents("case-1", category=DocumentCategory.DEPOSIT)] == ["cert"]
+    assert [doc.id for doc in await documents.list_documents(category=None, case_id="case-2")] == ["other"]
+
+    response = await cases.export_case_csv("case-1")
+    body = b"".join([chunk async for chunk in response.body_iterator]).decode("utf-8-sig")
+    assert "book.pdf" in body and "cert.pdf" in body and "other.pdf" not in body
+
+    with pytest.raises(HTTPException) as error:
+        await cases.get_case("missing")
+    assert error.value.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_delete_case_removes_only_its_data():
+    for case_id in ("case-1", "case-2"):
+        documents.save_document(passbook(f"book-{case_id}", case_id))
+        documents.save_document(deposit(f"cert-{case_id}", case_id))
+
+    result = await cases.delete_case("case-1")
+
+    assert result["deleted_documents"] == 2
+    assert documents.documents_storage.get_case("case-1") is None
+    assert "book-case-1" not in documents.documents_storage
+    assert ledger_store.ledgers("case-1") == []
+    assert len(ledger_store.ledgers("case-2")) == 1
+    assert [hit["document_id"] for hit in documents.search_index.search("家賃")] == ["book-case-2"]
+    # Documents of the deleted case can be stored again
+    documents.save_document(passbook("book-case-1", "case-1"))
+    assert len(ledger_store.ledgers("case-1")) == 1
+
+
+def test_case_lookup_does_not_scan_other_cases(clean_store):
+    store = clean_store
+    for number in range(20000):
+        store.put(deposit(f"d{number}", f"case-{number % 200}"))
+
+    started = time.perf_counter()
+    for _ in range(200):
+        docs = store.case_documents("case-7")
+    elapsed = time.perf_counter() - started
+
+    assert len(docs) == 100
+    assert elapsed < 0.2
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""リネーム済み原本のZIPエクスポートのテスト"""
+
+import io
+import zipfile
+from datetime import datetime, timedelta
+
+import pytest
+
+from api import blobs, documents
+from models.document import DocumentCategory, ProcessedDocument
+from services import export_archive
+from services.blob_store import BlobStore
+from services.export_archive import CHUNK_SIZE, renamed_filenames
+from services.document_store import DocumentStore
+
+
+@pytest.fixture
+def store(monkeypatch, tmp_path):
+    store = BlobStore(str(tmp_path / "blobs"))
+    for module in (blobs, documents, export_archive):
+        monkeypatch.setattr(module, "blob_store", store)
+    monkeypatch.setattr(documents, "documents_storage", DocumentStore())
+    return store
+
+
+def deposit(doc_id, minutes, blob_id=None, **data):
+    return ProcessedDocument(
+        id=doc_id,
+        original_filename=f"{doc_id}.pdf",
+        category=DocumentCategory.DEPOSIT,
+        extracted_data={"account_type": "普通預金", "financial_institution": "みらい銀行", **data},
+        processed_at=datetime(2024, 4, 1, 9, 0) + timedelta(minutes=minutes),
+        case_id="case-1",
+        blob_id=blob_id
+    )
+
+
+def test_names_are_sequential_per_category_and_unique():
+    docs = [deposit(f"d{i}", minutes=-i) for i in range(3)] + [
+        ProcessedDocument(id="s1", original_filename="明細 2024/03.pdf", category=DocumentCategory.LISTED_STOCK)
+    ]
+
+    names = renamed_filenames(docs, {"d0": "image/jpeg"})
+
+    assert names["d2"] == "D001_預金_普通預金_みらい銀行_R05.pdf"
+    assert names["d1"].startswith("D002_")
+    assert names["d0"] == "D003_預金_普通預金_みらい銀行_R05.jpg"
+    # No extracted fields: falls back to the original filename without unsafe characters
+    assert names["s1"] == "S001_株式_明細202403_R05.pdf"
+    assert len(set(names.values())) == len(names)
+
+
+@pytest.mark.asyncio
+async def test_case_zip_streams_renamed_originals(store):
+    large = bytes(range(256)) * (CHUNK_SIZE // 256 * 3 + 7)
+    docs = [
+        deposit("a", 0, store.put(b"%PDF-a", "application/pdf")),
+        deposit("b", 1, store.put(large, "application/pdf")),
+        deposit("c", 2),  # no original kept
+    ]
+    for doc in docs:
+        documents.save_document(doc)
+    documents.save_document(deposit("other-case", 3, store.put(b"%PDF-x")).copy(update={"case_id": "case-2"}))
+
+    response = await documents.export_zip(case_id="case-1")
+    chunks = [chunk async for chunk in response.body_iterator]
+
+    # Written on the fly: no chunk holds more than one read of a source file
+    assert len(chunks) > 3
+    assert max(len(chunk) for chunk in chunks) <= CHUNK_SIZE + 1024
+    with zipfile.ZipFile(io.BytesIO(b"".join(chunks))) as archive:
+        assert archive.testzip() is None
+        assert archive.namelist() == [
+            "D001_預金_普通預金_みらい銀行_R05.pdf",
+            "D002_預金_普通預金_みらい銀行_R05.pdf",
+            "ファイル一覧.csv",
+        ]
+        assert archive.read("D002_預金_普通預金_みらい銀行_R05.pdf") == large
+        manifest = archive.read("ファイル一覧.csv").decode("utf-8-sig")
+    assert "c.pdf" in manifest
+
+
+def test_zip_is_written_to_a_non_seekable_sink():
+    assert not export_archive._ZipSink().seekable()
+
+    data = b"".join(export_archive.iter_zip([], [("a.txt", b"abc")]))
+
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        # Sizes and CRC follow the data in a data descriptor
+        assert archive.getinfo("a.txt").flag_bits & 0x08
+        assert archive.read("a.txt") == b"abc"
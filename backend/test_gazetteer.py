@@ -0,0 +1,60 @@
+"""市区町村から都道府県を推定する索引のテスト"""
+
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from models.document import DocumentCategory
+from services.gazetteer import Gazetteer, fill_prefecture, gazetteer
+from services.gemini_ocr import GeminiOCRService
+from services.model_router import ModelRouter
+
+
+@pytest.mark.parametrize("city, address, expected", [
+    ("千代田区", "九段北一丁目", ["東京都"]),
+    ("横浜市中区", "山下町", ["神奈川県"]),  # ward of a designated city
+    ("北葛城郡王寺町", "", ["奈良県"]),  # county prefix
+    ("大和郡山市", "北郡山町", ["奈良県"]),  # "郡" inside the city name
+    ("府中市", "宮西町", ["東京都", "広島県"]),  # same name in two prefectures
+    ("広島県府中市", "", ["広島県"]),  # written prefecture narrows the candidates
+    ("ｻﾝﾌﾟﾙ", "山下町", []),
+])
+def test_candidates(city, address, expected):
+    assert [candidate["prefecture"] for candidate in gazetteer.candidates(city, address)] == expected
+
+
+def test_city_given_in_the_address_field():
+    assert gazetteer.candidates(None, "横浜市中区山下町1-1")[0]["city"] == "横浜市"
+
+
+def test_prefecture_list_and_lazy_load():
+    fresh = Gazetteer()
+    assert fresh._names is None
+    prefectures = fresh.prefectures()
+    assert len(prefectures) == 47
+    assert prefectures[12] == {"code": "13", "prefecture": "東京都"}
+
+
+def test_fill_prefecture():
+    assert fill_prefecture({"city": "千代田区"})["prefecture"] == "東京都"
+    ambiguous = fill_prefecture({"city": "府中市"})
+    assert "prefecture" not in ambiguous
+    assert ambiguous["prefecture_candidates"] == ["東京都", "広島県"]
+    # A prefecture read from the document is kept
+    assert fill_prefecture({"prefecture": "大阪府", "city": "千代田区"})["prefecture"] == "大阪府"
+
+
+@pytest.mark.asyncio
+async def test_land_building_ocr_fills_the_prefecture():
+    class Model:
+        def generate_content(self, contents, generation_config=None):
+            return SimpleNamespace(text=json.dumps({"city": "横浜市西区", "address": "みなとみらい二丁目", "lot_number": "3番1"}))
+
+    service = GeminiOCRService()
+    service.router = ModelRouter(tiers=["gemini-2.0-flash-lite"])
+    service.router.get_model = lambda name: Model()
+
+    data = await service.process_general_document("", DocumentCategory.LAND_BUILDING)
+
+    assert data["prefecture"] == "神奈川県"
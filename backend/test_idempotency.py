@@ -0,0 +1,165 @@
+"""同じ一括処理リクエストの集約と結果の再送のテスト"""
+
+import asyncio
+import io
+
+import pytest
+from fastapi import HTTPException
+from starlette.datastructures import UploadFile
+
+from api import documents, ocr
+from core.idempotency import IdempotencyCache
+from core.metrics import metrics
+from core.uploads import UploadBudget
+from models.document import DocumentCategory, ProcessedDocument
+from services.document_store import DocumentStore
+from services.search_index import SearchIndex
+
+
+@pytest.mark.asyncio
+async def test_concurrent_requests_share_one_computation():
+    cache = IdempotencyCache(ttl_seconds=60, max_entries=8)
+    calls = []
+    release = asyncio.Event()
+
+    async def compute():
+        calls.append(1)
+        await release.wait()
+        return {"value": 1}
+
+    first = asyncio.create_task(cache.run("k", "f", compute))
+    second = asyncio.create_task(cache.run("k", "f", compute))
+    await asyncio.sleep(0)
+    release.set()
+
+    assert await first == ({"value": 1}, False)
+    assert await second == ({"value": 1}, True)
+    assert len(calls) == 1
+    # Completed results are replayed without running again
+    assert await cache.run("k", "f", compute) == ({"value": 1}, True)
+    assert len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_failures_are_not_kept():
+    cache = IdempotencyCache(ttl_seconds=60, max_entries=8)
+    attempts = []
+
+    async def flaky():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RuntimeError("quota")
+        return "ok"
+
+    with pytest.raises(RuntimeError):
+        await cache.run("k", "f", flaky)
+    assert await cache.run("k", "f", flaky) == ("ok", False)
+
+    async def partial():
+        return {"failed_count": 1}
+
+    await cache.run("p", "f", partial, keep=lambda result: result["failed_count"] == 0)
+    assert await cache.run("p", "f", partial, keep=lambda result: result["failed_count"] == 0) == ({"failed_count": 1}, False)
+
+
+@pytest.mark.asyncio
+async def test_expired_results_and_reused_keys():
+    cache = IdempotencyCache(ttl_seconds=0, max_entries=8)
+
+    async def compute():
+        return "done"
+
+    await cache.run("k", "f", compute)
+    assert await cache.run("k", "f", compute) == ("done", False)
+
+    cache.ttl_seconds = 60
+    await cache.run("used", "request-a", compute)
+    with pytest.raises(HTTPException) as error:
+        await cache.run("used", "request-b", compute)
+    assert error.value.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_double_submitted_batch_is_processed_once(monkeypatch, tmp_path):
+    monkeypatch.setattr(ocr.settings, "UPLOAD_PATH", str(tmp_path / "uploads"))
+    monkeypatch.setattr(ocr, "batch_requests", IdempotencyCache(ttl_seconds=60, max_entries=8))
+    monkeypatch.setattr(documents, "documents_storage", DocumentStore())
+    monkeypatch.setattr(documents, "search_index", SearchIndex())
+    metrics.reset()
+    processed = []
+
+    async def fake_process(filename, contents, auto_classify, case_id=None):
+        processed.append(filename)
+        await asyncio.sleep(0.01)
+        return ProcessedDocument(
+            id=f"D_{filename}", original_filename=filename, category=DocumentCategory.DEPOSIT, extracted_data={}
+        )
+
+    monkeypatch.setattr(ocr, "_process_batch_file", fake_process)
+
+    def request(key=None, data=b"scan"):
+        return ocr.process_batch(
+            files=[UploadFile(io.BytesIO(data), filename="a.txt")], auto_classify=False, case_id=None, idempotency_key=key
+        )
+
+    first, second = await asyncio.gather(request(), request())
+    assert processed == ["a.txt"]
+    assert first["replayed"] is False and second["replayed"] is True
+    assert second["documents"][0]["id"] == first["documents"][0]["id"]
+
+    # A retry with the same key replays; different content is processed
+    await request(key="click-1")
+    assert (await request(key="click-1"))["replayed"] is True
+    await request(data=b"other scan")
+    assert processed == ["a.txt", "a.txt", "a.txt"]
+    assert metrics.snapshot()["counters"]["idempotency.coalesced"] == 1
+    
+    # Once its documents are deleted, the stored result is not replayed
+    await documents.delete_document("D_a.txt")
+    again = await request()
+    assert again["replayed"] is False
+    assert processed == ["a.txt", "a.txt", "a.txt", "a.txt"]
+    assert metrics.snapshot()["counters"]["idempotency.invalidated"] == 1
+
+
+@pytest.mark.asyncio
+async def test_batch_outlives_its_request(monkeypatch, tmp_path):
+    monkeypatch.setattr(ocr.settings, "UPLOAD_PATH", str(tmp_path / "uploads"))
+    monkeypatch.setattr(ocr, "batch_requests", IdempotencyCache(ttl_seconds=60, max_entries=8))
+    monkeypatch.setattr(ocr, "upload_budget", UploadBudget(max_bytes=1024))
+    monkeypatch.setattr(documents, "documents_storage", DocumentStore())
+    monkeypatch.setattr(documents, "search_index", SearchIndex())
+    started, proceed = asyncio.Event(), asyncio.Event()
+
+    process_batch = ocr._process_batch
+
+    async def delayed_batch(*args):
+        started.set()
+        await proceed.wait()
+        return await process_batch(*args)
+
+    async def fake_process(filename, contents, auto_classify, case_id=None):
+        assert contents == b"scan"
+        return ProcessedDocument(
+            id=f"D_{filename}", original_filename=filename, category=DocumentCategory.DEPOSIT, extracted_data={}
+        )
+
+    monkeypatch.setattr(ocr, "_process_batch", delayed_batch)
+    monkeypatch.setattr(ocr, "_process_batch_file", fake_process)
+    def request(upload):
+        return ocr.process_batch(files=[upload], auto_classify=False, case_id=None, idempotency_key="click-1")
+
+    upload = UploadFile(io.BytesIO(b"scan"), filename="a.txt")
+    first = asyncio.create_task(request(upload))
+    await started.wait()
+
+    # The client disconnects and Starlette closes the request's files; the batch holds their contents
+    first.cancel()
+    await upload.close()
+    assert ocr.upload_budget.in_flight == 4
+    retry = asyncio.create_task(request(UploadFile(io.BytesIO(b"scan"), filename="a.txt")))
+    proceed.set()
+    result = await retry
+    assert result["replayed"] is True and result["processed_count"] == 1
+    assert documents.documents_storage.get("D_a.txt") is not None
+    assert ocr.upload_budget.in_flight == 0
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""レスポンススキーマとJSON修復パーサーのテスト"""
+
+import json
+
+import pytest
+
+from models.document import LandBuildingData, PassbookTransaction
+from services import response_schema
+from services.json_repair import TruncatedJSON, loads_tolerant
+from services.response_schema import json_generation_config, key_information_dict, schema_from_model
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('```json\n[{"a": 1,}, {"b": 2},]\n```', [{"a": 1}, {"b": 2}]),
+    ('結果は以下です。\n{"a": None, "b": True} 以上', {"a": None, "b": True}),
+    ('{"a": 1, // コメント\n "b": "x // y"}', {"a": 1, "b": "x // y"}),
+])
+def test_common_errors_are_repaired(text, expected):
+    assert loads_tolerant(text) == expected
+
+
+def test_truncated_array_keeps_complete_rows_only():
+    with pytest.raises(TruncatedJSON) as error:
+        loads_tolerant('[{"取引日": "2024-01-05", "出金額": 100}, {"取引日": "2024-01-')
+
+    assert error.value.partial == [{"取引日": "2024-01-05", "出金額": 100}]
+
+
+def test_truncated_object_keeps_complete_pages():
+    with pytest.raises(TruncatedJSON) as error:
+        loads_tolerant('{"document_type": "登記簿", "pages": [{"page": 1}, {"page": 2, "extracted_text": "甲')
+
+    assert error.value.partial == {"document_type": "登記簿", "pages": [{"page": 1}]}
+
+
+def test_unrecoverable_text_raises_value_error():
+    with pytest.raises(ValueError):
+        loads_tolerant("読み取れませんでした")
+
+
+def test_schema_uses_aliases_and_nullable_optionals():
+    schema = schema_from_model(PassbookTransaction, exclude=["ページ"])
+
+    assert list(schema["properties"]) == ["取引日", "出金額", "入金額", "残高", "取引内容"]
+    assert schema["required"] == list(schema["properties"])
+    assert schema["properties"]["残高"] == {"type": "INTEGER", "description": "残高（不明な場合はnull）", "nullable": True}
+    assert schema_from_model(LandBuildingData)["properties"]["owner_names"]["items"] == {"type": "STRING"}
+    json.dumps(schema)  # plain JSON-serializable dict
+
+
+def test_schema_only_sent_when_sdk_supports_it(monkeypatch):
+    monkeypatch.setattr(response_schema, "supports_response_schema", lambda: False)
+    assert "response_schema" not in json_generation_config({"type": "OBJECT"})
+
+    monkeypatch.setattr(response_schema, "supports_response_schema", lambda: True)
+    assert json_generation_config({"type": "OBJECT"}, max_output_tokens=10)["response_schema"] == {"type": "OBJECT"}
+
+
+def test_key_information_pairs_become_object():
+    assert key_information_dict([{"name": "地番", "value": "12-3"}, {"value": "x"}]) == {"地番": "12-3"}
+    assert key_information_dict({"地番": "12-3"}) == {"地番": "12-3"}
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""口座別取引元帳のテスト"""
+
+from datetime import date
+
+import pytest
+
+from api import documents, ledger as ledger_api, ocr
+from models.document import DocumentCategory, ProcessedDocument
+from services.ledger import AccountLedger, account_key, ledger_store
+from services.document_store import DocumentStore
+
+
+def row(day, withdrawal=0, deposit=0, balance=None, description="カード"):
+    return {"取引日": day, "出金額": withdrawal, "入金額": deposit, "残高": balance, "取引内容": description}
+
+
+def passbook(doc_id, filename, transactions, case_id="case-1"):
+    return ProcessedDocument(
+        id=doc_id,
+        original_filename=filename,
+        category=DocumentCategory.PASSBOOK,
+        extracted_data={"transactions": transactions},
+        case_id=case_id
+    )
+
+
+@pytest.fixture(autouse=True)
+def clean_store(monkeypatch):
+    monkeypatch.setattr(documents, "documents_storage", DocumentStore())
+    ledger_store.clear()
+    yield
+    ledger_store.clear()
+
+
+def test_overlapping_documents_are_merged_in_date_order():
+    ledger = AccountLedger("acct")
+    ledger.add("D_2", [row("2024-03-01", 500, balance=9000), row("2024-04-01", 1000, balance=8000)])
+    added, duplicates = ledger.add("D_1", [row("2024-01-10", 500, balance=9500), row("2024/03/01", 500, balance=9000)])
+
+    assert (added, duplicates) == (1, 1)
+    assert [entry.date for entry in ledger.between()] == [date(2024, 1, 10), date(2024, 3, 1), date(2024, 4, 1)]
+    assert ledger.between()[1].sources == [("D_2", 0), ("D_1", 1)]
+
+    ledger.remove_document("D_2")
+    assert [entry.date for entry in ledger.between()] == [date(2024, 1, 10), date(2024, 3, 1)]
+
+
+def test_queries():
+    ledger = AccountLedger("acct")
+    ledger.add("D_1", [
+        row("2023-12-31", 3_000_000, balance=1, description="ATM"),
+        row("2024-01-05", deposit=50_000, balance=2, description="振込 ヤマダ タロウ"),
+        row(None, 1_000_000, balance=3, description="振込 ﾔﾏﾀﾞ ﾊﾅｺ"),
+        row("2024-02-01", 200, balance=4),
+    ])
+
+    assert len(ledger.between(date(2024, 1, 1), date(2024, 1, 31))) == 2
+    assert [entry.withdrawal for entry in ledger.at_least(1_000_000)] == [3_000_000, 1_000_000]
+    assert [entry.balance for entry in ledger.at_least(50_000, "deposit")] == [2]
+    assert [entry.balance for entry in ledger.counterparty("ヤマダ")] == [2, 3]
+    assert ledger.counterparty("ヤマダ")[1].date == date(2024, 1, 5)  # undated row inherits the previous date
+
+
+def test_account_key_strips_page_suffix():
+    assert account_key(passbook("T_1", "みずほ普通_p2.jpg", [])) == "みずほ普通"
+    assert account_key(passbook("T_2", "みずほ普通-3.pdf", [])) == "みずほ普通"
+    assert account_key(passbook("T_3", "三井住友_1234567_page2.pdf", [])) == "三井住友_1234567"
+    # Account numbers in the file name are kept apart
+    assert account_key(passbook("T_4", "三井住友_7654321.pdf", [])) != account_key(passbook("T_5", "三井住友_1234567.pdf", []))
+
+
+def test_identical_rows_within_a_page_are_kept():
+    ledger = AccountLedger("acct")
+    atm = dict(row("2024-01-05", 10_000, description="ATM"), ページ=1)
+
+    assert ledger.add("D_1", [atm, dict(atm), dict(atm, ページ=2)]) == (2, 1)  # page 2 overlaps page 1
+    assert ledger.between()[0].sources == [("D_1", 0), ("D_1", 2)]
+    # Another scan of the same page matches both withdrawals
+    assert ledger.add("D_2", [dict(atm), dict(atm)]) == (0, 2)
+
+    ledger.remove_document("D_1")
+    assert len(ledger) == 2
+    ledger.remove_document("D_2")
+    assert len(ledger) == 0
+
+
+@pytest.mark.asyncio
+async def test_stored_passbooks_are_queryable_per_case():
+    await documents.store_document(passbook("T_1", "三井住友_1.jpg", [row("2024-01-05", 100_000, balance=1)]))
+    await documents.store_document(passbook("T_2", "三井住友_2.jpg", [row("2024-01-05", 100_000, balance=1), row("2024-02-05", 20, balance=2)]))
+    await documents.store_document(passbook("T_3", "ゆうちょ.jpg", [row("2024-01-20", 500_000, balance=9)], case_id="case-2"))
+
+    accounts = await ledger_api.list_accounts(case_id="case-1")
+    large = await ledger_api.large_transactions(min_amount=100_000, kind="any", case_id="case-1", account=None, start=None, end=None, limit=10)
+
+    assert [(item["account"], item["count"]) for item in accounts] == [("三井住友", 2)]
+    assert large["total"] == 1
+    assert [source["書類ID"] for source in large["transactions"][0]["出典"]] == ["T_1", "T_2"]
+
+    await documents.delete_document("T_1")
+    remaining = await ledger_api.transactions_between(case_id="case-1", account="三井住友", start=None, end=None, limit=10)
+    assert remaining["transactions"][0]["書類ID"] == "T_2"
+
+
+@pytest.mark.asyncio
+async def test_batch_passbook_is_read_once(monkeypatch):
+    calls = []
+
+    async def classify_document(content, filename="", text=None):
+        return DocumentCategory.PASSBOOK
+
+    async def page_jpegs(contents, filename="", dpi=200):
+        return [b"page-1", b"page-2"]
+
+    async def process_passbook_pages(pages):
+        calls.append(("rows", len(pages)))
+        return [row("2024-01-05", 1000, balance=9000)]
+
+    async def extract_text_from_image(contents):
+        calls.append(("text", 1))
+        return {"success": True, "extracted_text": "通帳"}
+
+    monkeypatch.setattr(ocr.classifier, "classify_document", classify_document)
+    monkeypatch.setattr(ocr.render_pool, "page_jpegs", page_jpegs)
+    monkeypatch.setattr(ocr.ocr_service, "process_passbook_pages", process_passbook_pages)
+    monkeypatch.setattr(ocr.ocr_service, "extract_text_from_image", extract_text_from_image)
+
+    doc = await ocr._process_batch_file("みずほ_p1.jpg", b"scan", auto_classify=True, case_id="case-1")
+
+    assert calls == [("rows", 2)]
+    assert doc.category == DocumentCategory.PASSBOOK
+    assert doc.extracted_data["transactions"][0]["出金額"] == 1000
+
+    # The page text is still read when the rows cannot be
+    async def broken_pages(pages):
+        raise RuntimeError("model down")
+
+    monkeypatch.setattr(ocr.ocr_service, "process_passbook_pages", broken_pages)
+    doc = await ocr._process_batch_file("みずほ_p1.jpg", b"scan", auto_classify=True, case_id="case-1")
+    assert doc.extracted_data["extracted_text"] == "通帳" and calls[-1] == ("text", 1)
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""ローカルキーワード分類のテスト"""
+
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from core.metrics import metrics
+from models.document import DocumentCategory
+from services.document_classifier import DocumentClassifier
+from services.local_classifier import classify_text
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("登記事項証明書（土地）\n所在 中央区銀座一丁目\n地番 12番3\n地積 100.00", DocumentCategory.LAND_BUILDING),
+    ("預金残高証明書\n普通預金 口座番号 1234567 残高 1,000,000円", DocumentCategory.DEPOSIT),
+    ("保険証券\n被保険者 山田太郎 死亡保険金 10,000,000円", DocumentCategory.LIFE_INSURANCE),
+    ("普通預金通帳\n2024-01-01 カード 10,000", DocumentCategory.PASSBOOK),
+    ("法定相続情報一覧図", DocumentCategory.PROCEDURE_DOC),
+])
+def test_obvious_titles_are_confident(text, expected):
+    result = classify_text(text)
+
+    assert result.category == expected
+    assert result.confidence >= 0.85
+
+
+def test_full_width_text_is_normalized():
+    assert classify_text("ｏｏ銀行　残高証明書").category == DocumentCategory.DEPOSIT
+
+
+def test_conflicting_keywords_are_unsure():
+    result = classify_text("残高証明書\n投資信託 特定口座")
+
+    assert result.confidence < 0.85
+
+
+def test_no_keywords_is_unknown():
+    result = classify_text("お知らせ")
+
+    assert result.category == DocumentCategory.UNKNOWN
+    assert result.confidence == 0.0
+
+
+@pytest.mark.asyncio
+async def test_local_hit_skips_remote_call():
+    metrics.reset()
+    classifier = DocumentClassifier()
+    calls = []
+
+    class Model:
+        def generate_content(self, contents, generation_config=None):
+            calls.append(contents)
+            return SimpleNamespace(text=json.dumps({"document_type": "DEBT", "confidence": 0.95}))
+
+    classifier.router.get_model = lambda name: Model()
+
+    assert await classifier.classify_document(b"", text="預金残高証明書") == DocumentCategory.DEPOSIT
+    assert calls == []
+
+    assert await classifier.classify_document(b"", text="お知らせ") == DocumentCategory.DEBT
+    assert len(calls) == 1
+
+    assert metrics.snapshot()["summaries"]["classifier.local.hit"]["mean"] == 0.5
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""段階的モデルルーティングのテスト（Geminiはスタブ化）"""
+
+import sys
+import json
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+# Add backend to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from core.metrics import metrics
+from services.model_router import ModelRouter
+from services.gemini_ocr import GeminiOCRService
+
+
+class StubModel:
+    def __init__(self, text, prompt_tokens=1000, output_tokens=500):
+        self.text = text
+        self.calls = 0
+        self.usage = SimpleNamespace(prompt_token_count=prompt_tokens, candidates_token_count=output_tokens)
+
+    def generate_content(self, contents, generation_config=None):
+        self.calls += 1
+        return SimpleNamespace(text=self.text, usage_metadata=self.usage)
+
+
+def make_router(responses):
+    router = ModelRouter(tiers=list(responses))
+    router.get_model = lambda name: responses[name]
+    return router
+
+
+@pytest.fixture(autouse=True)
+def reset_metrics():
+    metrics.reset()
+
+
+@pytest.mark.asyncio
+async def test_first_tier_accepted_without_escalation():
+    fast, strong = StubModel('{"ok": true}'), StubModel('{"ok": true}')
+    router = make_router({"gemini-2.0-flash-lite": fast, "gemini-2.5-flash": strong})
+
+    routed = await router.generate("test", ["prompt"])
+
+    assert routed.value == {"ok": True}
+    assert routed.model_name == "gemini-2.0-flash-lite"
+    assert routed.attempts == 1
+    assert strong.calls == 0
+    assert routed.cost_usd == pytest.approx((1000 * 0.075 + 500 * 0.30) / 1_000_000)
+    assert metrics.snapshot()["summaries"]["model_router.test.escalated"]["mean"] == 0.0
+
+
+@pytest.mark.asyncio
+async def test_escalates_on_parse_error():
+    router = make_router({
+        "gemini-2.0-flash-lite": StubModel('画像を読み取れませんでした'),
+        "gemini-2.5-flash": StubModel('{"ok": true}'),
+    })
+
+    routed = await router.generate("test", ["prompt"])
+
+    assert routed.model_name == "gemini-2.5-flash"
+    assert routed.attempts == 2
+    assert routed.escalation_reasons[0].startswith("gemini-2.0-flash-lite: parse_error")
+    assert metrics.snapshot()["summaries"]["model_router.test.escalated"]["mean"] == 1.0
+    assert metrics.snapshot()["summaries"]["model_router.test.parse_failure"]["mean"] == 0.5
+
+
+@pytest.mark.asyncio
+async def test_truncated_output_escalates_and_keeps_prefix():
+    router = make_router({
+        "gemini-2.0-flash-lite": StubModel('[{"a": 1}, {"b": 2}, {"c": '),
+        "gemini-2.5-flash": StubModel('[{"a": 1}, {"b": 2}, {"c": 3'),
+    })
+
+    routed = await router.generate("test", ["prompt"])
+
+    assert routed.escalation_reasons == ["gemini-2.0-flash-lite: truncated", "gemini-2.5-flash: truncated"]
+    assert routed.truncated and not routed.accepted
+    assert routed.value == [{"a": 1}, {"b": 2}]
+    assert metrics.snapshot()["counters"]["model_router.test.re_requests"] == 1
+
+
+@pytest.mark.asyncio
+async def test_last_tier_failure_is_not_accepted():
+    router = make_router({"a": StubModel("not json"), "b": StubModel("still not json")})
+
+    routed = await router.generate("test", ["prompt"])
+
+    assert routed.value is None
+    assert routed.accepted is False
+    assert routed.text == "still not json"
+    assert metrics.snapshot()["counters"]["model_router.test.rejected"] == 1
+
+
+@pytest.mark.asyncio
+async def test_parsed_value_survives_a_worse_last_tier():
+    router = make_router({"a": StubModel('{"total": 1}'), "b": StubModel("not json")})
+
+    routed = await router.generate("test", ["prompt"], validate=lambda value: "total mismatch")
+
+    assert routed.value == {"total": 1}
+    assert routed.model_name == "a" and routed.text == '{"total": 1}'
+    assert routed.accepted is False and routed.truncated is False
+    assert routed.escalation_reasons[0] == "a: total mismatch"
+    assert routed.escalation_reasons[1].startswith("b: parse_error")
+
+
+@pytest.mark.asyncio
+async def test_passbook_keeps_rows_when_the_last_tier_is_unparsable():
+    broken = [
+        {"取引日": "2024-01-01", "出金額": 0, "入金額": 1000, "残高": 1000, "取引内容": "入金"},
+        {"取引日": "2024-01-02", "出金額": 300, "入金額": 0, "残高": 900, "取引内容": "カード"},
+    ]
+    service = GeminiOCRService()
+    service.router = make_router({
+        "gemini-2.0-flash-lite": StubModel(json.dumps(broken, ensure_ascii=False)),
+        "gemini-2.5-flash": StubModel("申し訳ありません"),
+    })
+
+    assert await service.process_passbook("") == broken
+
+
+@pytest.mark.asyncio
+async def test_passbook_escalates_on_balance_mismatch():
+    broken = [
+        {"取引日": "2024-01-01", "出金額": 0, "入金額": 1000, "残高": 1000, "取引内容": "入金"},
+        {"取引日": "2024-01-02", "出金額": 300, "入金額": 0, "残高": 900, "取引内容": "カード"},
+    ]
+    fixed = [dict(broken[0]), dict(broken[1], 残高=700)]
+    fast = StubModel(json.dumps(broken, ensure_ascii=False))
+    strong = StubModel(json.dumps(fixed, ensure_ascii=False))
+
+    service = GeminiOCRService()
+    service.router = make_router({"gemini-2.0-flash-lite": fast, "gemini-2.5-flash": strong})
+
+    transactions = await service.process_passbook("")
+
+    assert transactions == fixed
+    assert strong.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_stream_stops_reading_when_the_consumer_stops():
+    read, finished = [], threading.Event()
+
+    class SlowStream:
+        def generate_content(self, contents, generation_config=None, stream=False):
+            def chunks():
+                try:
+                    for number in range(100):
+                        time.sleep(0.01)
+                        read.append(number)
+                        yield SimpleNamespace(text=str(number))
+                finally:
+                    finished.set()
+            return chunks()
+
+    router = make_router({"a": SlowStream()})
+    stream = router.stream("test", ["prompt"])
+    assert await stream.__anext__() == "0"
+    await stream.aclose()
+
+    assert finished.wait(timeout=0.5)
+    assert len(read) < 10
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""差し替え版PDFのページ単位の再OCRのテスト"""
+
+import io
+import json
+import os
+from types import SimpleNamespace
+
+import pytest
+from PyPDF2 import PdfReader
+
+from services import gemini_ocr
+from services.gemini_ocr import GeminiOCRService
+from services.page_cache import PageResultStore, page_result_store
+from services.pdf_text import extract_pages, page_fingerprints
+
+
+class PageModel:
+    """アップロードされたPDFのページごとに、その先頭行を抽出結果として返す"""
+
+    def __init__(self):
+        self.uploaded_pages = []
+
+    def generate_content(self, contents, generation_config=None):
+        pages = self.uploaded_pages[-1]
+        return SimpleNamespace(text=json.dumps({
+            "document_type": "登記簿謄本",
+            "pages": [
+                {"page": number, "extracted_text": text, "key_information": {f"p{text}": text}}
+                for number, text in enumerate(pages, start=1)
+            ]
+        }, ensure_ascii=False))
+
+
+@pytest.fixture
+def service(monkeypatch, tmp_path):
+    monkeypatch.setattr(gemini_ocr.settings, "INDEX_PATH", str(tmp_path))
+    model = PageModel()
+
+    def upload_file(path, mime_type=None):
+        with open(path, "rb") as f:
+            model.uploaded_pages.append([page.extract_text().strip() for page in PdfReader(f).pages])
+        return SimpleNamespace(name="files/test")
+
+    monkeypatch.setattr(gemini_ocr.genai, "upload_file", upload_file, raising=False)
+    monkeypatch.setattr(gemini_ocr.genai, "delete_file", lambda name: None, raising=False)
+    ocr = GeminiOCRService()
+    ocr.router.get_model = lambda name: model
+    return ocr, model
+
+
+def test_fingerprints_ignore_unchanged_pages(make_pdf):
+    original = page_fingerprints(make_pdf(["A", "B", "C"]))
+    revised = page_fingerprints(make_pdf(["A", "B2", "C"]))
+
+    assert original[0] == revised[0] and original[2] == revised[2]
+    assert original[1] != revised[1]
+
+
+def test_extract_pages_keeps_selected_pages(make_pdf):
+    subset = extract_pages(make_pdf(["A", "B", "C"]), [0, 2])
+
+    assert [page.extract_text().strip() for page in PdfReader(io.BytesIO(subset)).pages] == ["A", "C"]
+
+
+@pytest.mark.asyncio
+async def test_revised_pdf_only_reocrs_changed_pages(service, make_pdf):
+    ocr, model = service
+
+    first = await ocr.extract_text_from_pdf(make_pdf(["A", "B", "C"]))
+    revised = await ocr.extract_text_from_pdf(make_pdf(["A", "B2", "C", "D"]))
+
+    assert model.uploaded_pages == [["A", "B", "C"], ["B2", "D"]]
+    assert first["reused_pages"] == 0
+    assert revised["reused_pages"] == 2
+    assert revised["extracted_text"] == "A\n\nB2\n\nC\n\nD"
+    assert list(revised["key_information"]) == ["pA", "pB2", "pC", "pD"]
+    assert revised["document_type"] == "登記簿謄本"
+
+
+@pytest.mark.asyncio
+async def test_identical_pdf_skips_upload(service, make_pdf):
+    ocr, model = service
+
+    await ocr.extract_text_from_pdf(make_pdf(["A", "B"]))
+    again = await ocr.extract_text_from_pdf(make_pdf(["A", "B"]))
+
+    assert len(model.uploaded_pages) == 1
+    assert again["reused_pages"] == 2
+    assert again["success"] is True
+
+
+def test_later_pages_do_not_overwrite_key_information():
+    result = GeminiOCRService()._assemble_pdf_result([
+        {"extracted_text": "1", "key_information": {"残高": "1,000,000", "銀行": "みずほ"}},
+        {"extracted_text": "2", "key_information": {"銀行": "みずほ"}},
+        {"extracted_text": "3", "key_information": {"残高": "250,000", "日付": "2024-03-31"}},
+    ], reused=0)
+
+    assert result["key_information"] == {"残高": "1,000,000", "銀行": "みずほ", "日付": "2024-03-31"}
+    assert result["key_information_conflicts"] == {"残高": ["1,000,000", "250,000"]}
+
+
+@pytest.mark.asyncio
+async def test_page_results_are_kept_per_case(service, make_pdf):
+    ocr, model = service
+
+    await ocr.extract_text_from_pdf(make_pdf(["A", "B"]), case_id="case-1")
+    await ocr.extract_text_from_pdf(make_pdf(["A", "B"]), case_id="case-1")
+    await ocr.extract_text_from_pdf(make_pdf(["A", "B"]), case_id="case-2")
+    assert len(model.uploaded_pages) == 2
+
+    page_result_store.remove_case("case-1")
+    await ocr.extract_text_from_pdf(make_pdf(["A", "B"]), case_id="case-1")
+    assert len(model.uploaded_pages) == 3
+
+
+def test_least_recently_used_pages_are_evicted(tmp_path):
+    store = PageResultStore(str(tmp_path), max_entries=10)
+    for number in range(10):
+        store.put(f"{number:064x}", {"extracted_text": str(number)})
+        os.utime(store._path(f"{number:064x}", None), (number, number))
+    store.get(f"{0:064x}")  # recently used
+
+    store.put(f"{10:064x}", {"extracted_text": "10"})
+
+    assert store.get(f"{0:064x}") is not None
+    assert store.get(f"{1:064x}") is None and store.get(f"{2:064x}") is None
+    assert store.get(f"{10:064x}") is not None
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""内容の一致による重複ページ・重複ファイルの検出のテスト"""
+
+import io
+import json
+import random
+
+import pytest
+from fastapi import HTTPException
+from PIL import Image, ImageDraw
+from starlette.datastructures import UploadFile
+
+from api import documents, ocr
+from models.document import DocumentCategory, ProcessedDocument
+from services import page_dedup
+from services.document_store import DocumentStore
+from services.page_dedup import PageHashIndex, page_keys, register_pages, split_duplicate_pages
+
+
+def document_image(seed: int) -> Image.Image:
+    """罫線と文字列に見立てた矩形を描いた書類風の画像"""
+    rng = random.Random(seed)
+    image = Image.new("RGB", (700, 1000), "white")
+    draw = ImageDraw.Draw(image)
+    for row in range(25):
+        y = 60 + row * 36
+        draw.line([(40, y), (660, y)], fill="gray")
+        x = 50
+        while x < 640:
+            width = rng.randint(10, 80)
+            draw.rectangle([x, y + 8, x + width, y + 26], fill="black")
+            x += width + rng.randint(10, 40)
+    return image
+
+
+def template_page(seed: int) -> Image.Image:
+    """同じ銀行の様式（見出し・罫線）で、行の日付と金額だけが異なる通帳のページ"""
+    rng = random.Random(seed)
+    image = Image.new("RGB", (700, 1000), "white")
+    draw = ImageDraw.Draw(image)
+    draw.rectangle([40, 20, 660, 50], fill="black")
+    for row in range(25):
+        y = 60 + row * 36
+        draw.line([(40, y), (660, y)], fill="gray")
+        for x in (160, 300, 440, 560):
+            draw.line([(x, y), (x, y + 36)], fill="gray")
+        draw.text((50, y + 10), f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}", fill="black")
+        draw.text((320, y + 10), f"{rng.randint(1, 999) * 100:,}", fill="black")
+        draw.text((460, y + 10), f"{rng.randint(1, 9999) * 100:,}", fill="black")
+    return image
+
+
+def jpeg(image: Image.Image, quality: int = 90) -> bytes:
+    output = io.BytesIO()
+    image.save(output, format="JPEG", quality=quality)
+    return output.getvalue()
+
+
+def pdf(*images: Image.Image) -> bytes:
+    output = io.BytesIO()
+    images[0].save(output, format="PDF", save_all=True, append_images=list(images[1:]))
+    return output.getvalue()
+
+
+def test_same_template_pages_are_not_duplicates():
+    pages = [template_page(seed) for seed in range(6)]
+    keys = page_keys(pdf(*pages, pages[2]))
+
+    unique, duplicates = split_duplicate_pages(keys, PageHashIndex(), {"document": "passbook.pdf"})
+
+    # Only the repeated page is skipped; pages that merely share the layout are all read
+    assert unique == [0, 1, 2, 3, 4, 5]
+    assert [(item["page"], item["duplicate_of"]["page"]) for item in duplicates] == [(7, 3)]
+
+
+def test_index_persists_across_instances(tmp_path):
+    path = str(tmp_path / "case.json")
+    index = PageHashIndex(path)
+    key = page_keys(jpeg(document_image(1)))[0]
+    index.add_document("sha-a", [key], {"document": "D_1"})
+    index.save()
+
+    reloaded = PageHashIndex(path)
+
+    assert reloaded.find_document("sha-a", []) == {"document": "D_1"}
+    assert reloaded.find_document("sha-b", [key])["document"] == "D_1"
+
+
+def test_index_of_perceptual_hashes_keeps_its_files(tmp_path):
+    path = tmp_path / "case.json"
+    path.write_text(json.dumps({"pages": [["ff00", {"document": "D_1", "page": 1}]], "files": {"sha-a": {"document": "D_1"}}}))
+
+    index = PageHashIndex(str(path))
+
+    assert index.find_document("sha-a", []) == {"document": "D_1"}
+    assert index.find_page("ff00") is None
+
+
+def test_document_match_requires_all_pages():
+    index = PageHashIndex()
+    first, second, other = (page_keys(jpeg(document_image(seed)))[0] for seed in (1, 2, 3))
+    index.add_document("sha-a", [first, second], {"document": "D_1"})
+
+    assert index.find_document("sha-b", [first, second])["document"] == "D_1"
+    assert index.find_document("sha-c", [first, other]) is None
+    assert index.find_document("sha-d", [first]) is None
+
+
+def test_split_duplicate_pages_within_upload():
+    pages = [jpeg(document_image(1)), jpeg(document_image(2)), jpeg(document_image(1)), jpeg(document_image(1), quality=50)]
+    keys = [page_keys(page)[0] for page in pages] + [None]  # the last page has no key
+    index = PageHashIndex()
+
+    unique, duplicates = split_duplicate_pages(keys, index, {"document": "passbook.pdf"})
+
+    # The exact copy is skipped; the recompressed one differs in content and is read
+    assert unique == [0, 1, 3, 4]
+    assert duplicates == [{"page": 3, "duplicate_of": {"document": "passbook.pdf", "page": 1}}]
+    # Nothing is registered until the pages have been processed
+    assert index.find_page(keys[0]) is None
+    register_pages(index, keys, unique, {"document": "passbook.pdf"})
+    assert index.find_page(keys[1])["page"] == 2
+
+
+def test_remove_document():
+    index = PageHashIndex()
+    first, second = (page_keys(jpeg(document_image(seed)))[0] for seed in (1, 2))
+    index.add_document("sha-a", [first], {"document": "D_1"})
+    index.add_document("sha-b", [second], {"document": "D_2"})
+
+    assert index.remove_document("D_1")
+    assert not index.remove_document("D_1")
+    assert index.find_document("sha-a", [first]) is None
+    assert index.find_document("sha-b", [second])["document"] == "D_2"
+
+
+@pytest.mark.asyncio
+async def test_failed_pages_are_not_registered(monkeypatch, tmp_path):
+    monkeypatch.setattr(ocr.settings, "INDEX_PATH", str(tmp_path))
+    monkeypatch.setattr(page_dedup, "_case_indexes", {})
+    calls = []
+
+    async def page_jpegs(contents, filename="", dpi=200):
+        return [contents]
+
+    async def read_pages(pages, include_handwriting=False):
+        calls.append(len(pages))
+        if len(calls) == 1:
+            raise RuntimeError("model error")
+        return [{"取引日": "2024-01-05", "ページ": 1}]
+
+    monkeypatch.setattr(ocr.render_pool, "page_jpegs", page_jpegs)
+    monkeypatch.setattr(ocr.ocr_service, "process_passbook_pages", read_pages)
+    scan = jpeg(document_image(1))
+
+    with pytest.raises(HTTPException):
+        await ocr.process_passbook_pages(files=[UploadFile(io.BytesIO(scan), filename="p1.jpg")], case_id="case-retry")
+    result = await ocr.process_passbook_pages(files=[UploadFile(io.BytesIO(scan), filename="p1.jpg")], case_id="case-retry")
+
+    assert calls == [1, 1]
+    assert result["duplicate_pages"] == [] and result["count"] == 1
+
+
+@pytest.mark.asyncio
+async def test_passbook_pages_skip_only_repeated_content(monkeypatch):
+    async def page_jpegs(contents, filename="", dpi=200):
+        return [contents]
+
+    async def read_pages(pages, include_handwriting=False):
+        return [{"取引日": "2024-01-05", "ページ": number} for number in range(1, len(pages) + 1)]
+
+    monkeypatch.setattr(ocr.render_pool, "page_jpegs", page_jpegs)
+    monkeypatch.setattr(ocr.ocr_service, "process_passbook_pages", read_pages)
+    first, second = jpeg(template_page(1)), jpeg(template_page(2))
+    files = [UploadFile(io.BytesIO(data), filename=name) for name, data in (("p1.jpg", first), ("p2.jpg", second), ("copy.jpg", first))]
+
+    result = await ocr.process_passbook_pages(files=files, case_id=None)
+
+    assert [item["page"] for item in result["duplicate_pages"]] == [3]
+    assert [row["ページ"] for row in result["transactions"]] == [1, 2]
+
+
+@pytest.mark.asyncio
+async def test_process_batch_skips_duplicate_files(monkeypatch, tmp_path):
+    monkeypatch.setattr(ocr.settings, "INDEX_PATH", str(tmp_path))
+    monkeypatch.setattr(page_dedup, "_case_indexes", {})
+    monkeypatch.setattr(ocr.settings, "UPLOAD_PATH", str(tmp_path / "uploads"))
+    monkeypatch.setattr(documents, "documents_storage", DocumentStore())
+    processed = []
+
+    async def fake_process(filename, contents, auto_classify, case_id=None):
+        processed.append(filename)
+        return ProcessedDocument(
+            id=f"D_{filename}",
+            original_filename=filename,
+            category=DocumentCategory.DEPOSIT,
+            extracted_data={"balance": 100},
+            case_id=case_id
+        )
+
+    monkeypatch.setattr(ocr, "_process_batch_file", fake_process)
+    scan = jpeg(template_page(1))
+
+    def upload(name, data):
+        return UploadFile(io.BytesIO(data), filename=name)
+
+    first = await ocr.process_batch(
+        files=[upload("a.jpg", scan), upload("copy.jpg", scan), upload("b.jpg", jpeg(template_page(2)))],
+        auto_classify=True,
+        case_id="case-1"
+    )
+    second = await ocr.process_batch(
+        files=[upload("resent.jpg", scan), upload("next-page.jpg", jpeg(template_page(3)))],
+        auto_classify=True,
+        case_id="case-1"
+    )
+
+    assert sorted(processed) == ["a.jpg", "b.jpg", "next-page.jpg"]  # files are read and processed concurrently
+    assert first["duplicate_count"] == 1
+    assert first["documents"][1]["duplicate_of"] == "D_a.jpg"
+    assert first["documents"][1]["extracted_data"] == {"balance": 100}
+    assert second["documents"][0]["duplicate_of"] == "D_a.jpg"
+    # A page of the same layout is another document, not a copy of one
+    assert second["documents"][1]["duplicate_of"] is None
+    assert second["documents"][1]["id"] == "D_next-page.jpg"
+    # The exact copy shares the original's blob
+    assert first["documents"][1]["blob_id"] == first["documents"][0]["blob_id"]
+    
+    # Once the original is deleted, the same file is read again instead of pointing at it
+    await documents.delete_document("D_a.jpg")
+    third = await ocr.process_batch(
+        files=[upload("again.jpg", scan)],
+        auto_classify=True,
+        case_id="case-1"
+    )
+    assert processed.count("again.jpg") == 1
+    assert third["documents"][0]["duplicate_of"] is None
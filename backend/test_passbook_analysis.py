@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""通帳取引の分析（高額出金・贈与パターン検出）のテスト"""
+
+from datetime import date, timedelta
+
+from services.ledger import AccountLedger
+from services.passbook_analysis import PassbookScanner, analyze_ledgers
+
+
+def ledger_with(rows):
+    ledger = AccountLedger("acct")
+    ledger.add("T_1", [
+        {"取引日": day, "出金額": withdrawal, "入金額": deposit, "残高": None, "取引内容": description}
+        for day, withdrawal, deposit, description in rows
+    ])
+    return ledger
+
+
+def types(findings):
+    return sorted(finding.type for finding in findings)
+
+
+def test_large_transactions_and_round_amounts():
+    ledger = ledger_with([
+        ("2024-01-05", 3_000_000, 0, "ATM"),
+        ("2024-02-05", 0, 800_000, "振込"),
+        ("2024-03-05", 200_000, 0, "ATM"),
+        ("2024-04-05", 12_345, 0, "電気料"),
+    ])
+
+    findings = PassbookScanner().scan(ledger)
+
+    assert types(findings) == ["large_deposit", "large_withdrawal", "round_withdrawal"]
+
+
+def test_window_sums_report_non_overlapping_windows():
+    start = date(2024, 1, 1)
+    rows = [((start + timedelta(days=day)).isoformat(), 300_000, 0, "ATM") for day in range(0, 12, 3)]
+    rows += [((start + timedelta(days=day)).isoformat(), 350_000, 0, "ATM") for day in range(200, 206, 2)]
+    ledger = ledger_with(rows)
+
+    windows = [finding for finding in PassbookScanner().scan(ledger) if finding.type == "window_withdrawals"]
+
+    assert sorted(finding.amount for finding in windows) == [1_050_000, 1_200_000]
+    assert sorted(len(finding.positions) for finding in windows) == [3, 4]
+
+
+def test_recurring_gifts_and_watched_counterparty():
+    rows = [(f"{year}-12-20", 1_100_000, 0, "振込 ヤマダ ハナコ") for year in range(2018, 2023)]
+    rows.append(("2023-06-01", 50_000, 0, "振込 ﾔﾏﾀﾞ ｲﾁﾛｳ"))
+    ledger = ledger_with(rows)
+
+    findings = PassbookScanner(watch=["ヤマダ"]).scan(ledger)
+    recurring = [finding for finding in findings if finding.type == "recurring_withdrawal"]
+
+    assert len(recurring) == 1
+    assert recurring[0].detail == {"unit_amount": 1_100_000, "median_interval_days": 365}
+    watched = [finding for finding in findings if finding.type == "watched_counterparty"]
+    assert sorted(len(finding.positions) for finding in watched) == [1, 5]
+
+
+def test_analysis_is_limited_to_lookback_period_and_ranked():
+    ledger = ledger_with([
+        ("2010-01-05", 9_000_000, 0, "ATM"),
+        ("2020-01-05", 600_000, 0, "ATM"),
+        ("2023-01-05", 5_000_000, 0, "ATM"),
+    ])
+
+    result = analyze_ledgers([ledger], date_of_death=date(2024, 1, 1))
+
+    assert [finding["amount"] for finding in result["findings"]] == [5_000_000, 600_000]
+    assert result["findings"][0]["sources"] == [{"書類ID": "T_1", "行": 3, "取引日": "2023-01-05"}]
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""通帳取引の列形式格納のテスト"""
+
+import gc
+import json
+import random
+import tracemalloc
+
+from fastapi.encoders import jsonable_encoder
+
+from models.document import DocumentCategory, ProcessedDocument
+from models.passbook import PassbookColumns
+
+
+def passbook_json(count: int) -> str:
+    rng = random.Random(0)
+    rows = [
+        {
+            "取引日": f"20{10 + i // 5000:02d}-{i % 12 + 1:02d}-{i % 28 + 1:02d}",
+            "出金額": rng.randint(0, 300) * 100,
+            "入金額": 0,
+            "残高": 1_000_000 + i,
+            "取引内容": rng.choice(["カード", "ATM", "振込 ヤマダ タロウ", "電気料", "年金"]),
+        }
+        for i in range(count)
+    ]
+    return json.dumps(rows, ensure_ascii=False)
+
+
+def test_round_trip_is_lossless():
+    rows = [
+        {"取引日": "2024-01-05", "出金額": 1000, "入金額": 0, "残高": 9000, "取引内容": "カード", "ページ": 2},
+        {"取引日": None, "出金額": 0, "入金額": 500, "残高": None, "取引内容": "利息"},
+        {"取引日": "R6.1.5", "出金額": "1,000", "入金額": 0, "残高": 8000, "取引内容": None, "備考": "手書き"},
+        {"取引日": "20240105", "出金額": 0, "入金額": 0, "残高": 8000, "取引内容": "利息"},
+    ]
+
+    columns = PassbookColumns.from_rows(rows)
+
+    assert len(columns) == 4
+    assert columns.to_rows() == [
+        rows[0],
+        rows[1],
+        {"取引日": "R6.1.5", "出金額": "1,000", "入金額": 0, "残高": 8000, "取引内容": None, "備考": "手書き"},
+        rows[3],  # the basic format is kept as written, not rewritten to yyyy-mm-dd
+    ]
+    assert list(columns.extras) == [2, 3]
+
+
+def test_description_table_belongs_to_the_document():
+    first = PassbookColumns.from_rows(json.loads(passbook_json(1000)))
+    second = PassbookColumns.from_rows([{"取引日": "2024-01-05", "出金額": 1, "入金額": 0, "残高": 1, "取引内容": "ATM"}])
+
+    # Only this document's descriptions, so the table goes away with the document
+    assert sorted(first.description_texts) == sorted(["カード", "ATM", "振込 ヤマダ タロウ", "電気料", "年金"])
+    assert second.description_texts == ["ATM"]
+    # The same description is still one string across documents
+    assert second.description_texts[0] is first.description_texts[first.description_texts.index("ATM")]
+
+
+def test_memory_per_row_drops_by_an_order_of_magnitude():
+    text = passbook_json(20_000)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        baseline = tracemalloc.get_traced_memory()[0]
+        rows = json.loads(text)
+        as_dicts = tracemalloc.get_traced_memory()[0] - baseline
+
+        columns = PassbookColumns.from_rows(rows)
+        del rows
+        gc.collect()
+        as_columns = tracemalloc.get_traced_memory()[0] - baseline
+    finally:
+        tracemalloc.stop()
+
+    assert columns.nbytes == 20_000 * (4 + 8 * 3 + 4)
+    assert as_dicts / as_columns >= 10
+
+
+def test_stored_document_serializes_to_json_shape():
+    rows = json.loads(passbook_json(3))
+    document = ProcessedDocument(
+        id="T_1",
+        original_filename="通帳.jpg",
+        category=DocumentCategory.PASSBOOK,
+        extracted_data={"transactions": PassbookColumns.from_rows(rows)}
+    )
+
+    assert jsonable_encoder(document)["extracted_data"]["transactions"] == rows
+    assert json.loads(document.json())["extracted_data"]["transactions"] == rows
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""通帳の複数ページまとめ処理のテスト"""
+
+import io
+import json
+from types import SimpleNamespace
+
+import pytest
+from PIL import Image
+
+from services.gemini_ocr import GeminiOCRService
+
+
+def page(width=700, height=1000) -> bytes:
+    output = io.BytesIO()
+    Image.new("RGB", (width, height), "white").save(output, format="JPEG")
+    return output.getvalue()
+
+
+class PackModel:
+    """プロンプト中の「ページN」見出しの数に応じて応答する"""
+
+    def __init__(self, max_pages_before_truncation=None):
+        self.calls = []
+        self.max_pages = max_pages_before_truncation
+        self.balance = 10000
+
+    def rows_for(self, pages):
+        """ページごとに1取引、呼び出しをまたいで残高が連続する応答行"""
+        rows = []
+        for number in pages:
+            self.balance -= 100
+            rows.append({"ページ": number, "取引日": "2024-01-01", "出金額": 100, "入金額": 0, "残高": self.balance, "取引内容": "カード"})
+        return rows
+
+    def generate_content(self, contents, generation_config=None):
+        labels = [part for part in contents[1:] if isinstance(part, str)]
+        self.calls.append(len(labels) or 1)
+        if self.max_pages and len(labels) > self.max_pages:
+            return SimpleNamespace(text='[{"ページ": 1, "取引日": "2024-')
+        rows = self.rows_for(range(1, len(labels) + 1) if labels else [1])
+        return SimpleNamespace(text=json.dumps(rows, ensure_ascii=False))
+
+
+def service_with(model):
+    service = GeminiOCRService()
+    service.router.get_model = lambda name: model
+    return service
+
+
+def test_plan_respects_output_token_budget():
+    service = GeminiOCRService()
+
+    packs = service._plan_page_packs([page() for _ in range(14)])
+
+    # 25 rows x 60 tokens per page against 80% of 8192 output tokens -> 4 pages per request
+    assert packs == [(0, 4), (4, 4), (8, 4), (12, 2)]
+
+
+def test_tall_pages_are_packed_fewer_per_request():
+    service = GeminiOCRService()
+
+    packs = service._plan_page_packs([page(500, 3000) for _ in range(4)])
+
+    assert all(count <= 2 for _, count in packs)
+    assert sum(count for _, count in packs) == 4
+
+
+@pytest.mark.asyncio
+async def test_pages_are_tagged_with_global_page_numbers():
+    model = PackModel()
+    service = service_with(model)
+
+    transactions = await service.process_passbook_pages([page() for _ in range(7)])
+
+    assert model.calls == [4, 3]
+    assert [row["ページ"] for row in transactions] == [1, 2, 3, 4, 5, 6, 7]
+
+
+@pytest.mark.asyncio
+async def test_truncated_pack_is_split():
+    model = PackModel(max_pages_before_truncation=2)
+    service = service_with(model)
+
+    transactions = await service.process_passbook_pages([page() for _ in range(4)])
+
+    assert [row["ページ"] for row in transactions] == [1, 2, 3, 4]
+    assert model.calls[:2] == [4, 4]  # both tiers truncated before splitting
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""通帳OCRのストリーミング処理のテスト"""
+
+import io
+import json
+from types import SimpleNamespace
+
+import pytest
+from starlette.datastructures import UploadFile
+
+from api import ocr
+from services.gemini_ocr import GeminiOCRService
+from services.json_stream import JSONArrayStream
+
+ROWS = [
+    {"取引日": "2024-01-05", "出金額": 1000, "入金額": 0, "残高": 9000, "取引内容": "カード [A]"},
+    {"取引日": "2024-01-06", "出金額": 0, "入金額": 0, "残高": 9000, "取引内容": "繰越"},
+    {"取引日": "2024-01-07", "出金額": 0, "入金額": 500, "残高": 9500, "取引内容": "振込 \"ヤマダ\"}"},
+]
+
+
+def chunks(text: str, size: int):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+class StreamModel:
+    def __init__(self, text: str, chunk_size: int = 7):
+        self.text = text
+        self.chunk_size = chunk_size
+        self.calls = []
+
+    def generate_content(self, contents, generation_config=None, stream=False):
+        self.calls.append("stream" if stream else "full")
+        if stream:
+            return [SimpleNamespace(text=part) for part in chunks(self.text, self.chunk_size)]
+        return SimpleNamespace(text=json.dumps(ROWS, ensure_ascii=False))
+
+
+def service_with(models):
+    service = GeminiOCRService()
+    service.router.get_model = lambda name: models[name]
+    return service
+
+
+@pytest.mark.parametrize("size", [1, 5, 1000])
+def test_array_stream_emits_objects_across_chunk_boundaries(size):
+    text = "```json\n" + json.dumps(ROWS, ensure_ascii=False) + "\n```"
+    parser = JSONArrayStream()
+
+    items = [item for part in chunks(text, size) for item in parser.feed(part)]
+
+    assert items == ROWS
+    assert parser.closed
+
+
+def test_array_stream_keeps_incomplete_object_pending():
+    parser = JSONArrayStream()
+
+    assert parser.feed('[{"a": 1}, {"b": "}') == [{"a": 1}]
+    assert parser.feed('"}') == [{"b": "}"}]
+    assert not parser.closed
+
+
+@pytest.mark.asyncio
+async def test_stream_passbook_yields_rows_then_done():
+    cheap = StreamModel(json.dumps(ROWS, ensure_ascii=False))
+    service = service_with({name: cheap for name in ["gemini-2.0-flash-lite", "gemini-2.5-flash"]})
+
+    events = [event async for event in service.stream_passbook(b"jpeg")]
+
+    assert [event["type"] for event in events] == ["transaction", "transaction", "done"]
+    assert events[-1]["verified"] is True
+    assert cheap.calls == ["stream"]
+
+
+@pytest.mark.asyncio
+async def test_truncated_stream_is_reset_and_escalated():
+    truncated = StreamModel(json.dumps(ROWS, ensure_ascii=False)[:150])
+    upper = StreamModel("")
+    service = service_with({"gemini-2.0-flash-lite": truncated, "gemini-2.5-flash": upper})
+
+    events = [event async for event in service.stream_passbook(b"jpeg")]
+    types = [event["type"] for event in events]
+
+    assert types[types.index("reset"):] == ["reset", "transaction", "transaction", "done"]
+    assert events[-1]["model"] == "gemini-2.5-flash"
+    assert upper.calls == ["full"]
+
+
+@pytest.mark.asyncio
+async def test_stream_endpoint_returns_ndjson(monkeypatch):
+    model = StreamModel(json.dumps(ROWS, ensure_ascii=False))
+    monkeypatch.setattr(ocr.ocr_service.router, "get_model", lambda name: model)
+
+    response = await ocr.process_passbook_stream(file=UploadFile(io.BytesIO(b"jpeg"), filename="p.jpg"), include_handwriting=False)
+    lines = [json.loads(line) async for line in response.body_iterator for line in line.splitlines()]
+
+    assert response.media_type == "application/x-ndjson"
+    assert [line["type"] for line in lines] == ["transaction", "transaction", "done"]
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""縦長の通帳画像の帯分割処理のテスト"""
+
+import base64
+import io
+import json
+from types import SimpleNamespace
+
+import pytest
+from PIL import Image
+
+from services import gemini_ocr
+from services.gemini_ocr import GeminiOCRService
+from services.passbook_strips import stitch_strips, strip_boxes
+
+
+def row(day, withdrawal, balance, description="カード"):
+    return {"取引日": f"2024-01-{day:02d}", "出金額": withdrawal, "入金額": 0, "残高": balance, "取引内容": description}
+
+
+ROWS = [row(day, 100, 10000 - 100 * day) for day in range(1, 13)]
+
+
+@pytest.mark.parametrize("height", [1000, 1400, 3000, 5123])
+def test_strips_cover_image_with_overlap(height):
+    boxes = strip_boxes(1000, height, 1400, 200)
+
+    assert boxes[0][1] == 0
+    assert boxes[-1][3] == height
+    assert all(box[3] - box[1] <= 1400 for box in boxes)
+    for upper, lower in zip(boxes, boxes[1:]):
+        assert upper[3] - lower[1] >= 200
+
+
+def test_rows_read_twice_in_overlap_are_kept_once():
+    strips = [ROWS[:5], ROWS[3:9], ROWS[7:]]
+
+    assert stitch_strips(strips) == ROWS
+
+
+def test_rows_cut_at_strip_edges_use_the_other_strip():
+    garbled_bottom = dict(ROWS[5], 出金額=10, 残高=None)
+    garbled_top = dict(ROWS[3], 取引日=None)
+    strips = [ROWS[:5] + [garbled_bottom], [garbled_top] + ROWS[4:]]
+
+    # The description differs between strips but rows still match on date and amounts
+    strips[1][1] = dict(ROWS[4], 取引内容="カ一ド")
+
+    assert stitch_strips(strips) == ROWS
+
+
+def test_strips_without_common_rows_are_concatenated():
+    assert stitch_strips([ROWS[:4], [], ROWS[4:]]) == ROWS
+
+
+@pytest.mark.asyncio
+async def test_tall_image_is_processed_as_strips(monkeypatch):
+    # Three strips for a 1:3 image with the default strip settings
+    output = io.BytesIO()
+    Image.new("RGB", (100, 300), "white").save(output, format="JPEG")
+    strips_text = {
+        b"strip-0": json.dumps(ROWS[:5], ensure_ascii=False),
+        b"strip-1": json.dumps(ROWS[4:9], ensure_ascii=False),
+        b"strip-2": json.dumps(ROWS[8:], ensure_ascii=False),
+    }
+    requested_boxes = []
+
+    async def fake_strips(content, boxes, filename=""):
+        requested_boxes.extend(boxes)
+        return [f"strip-{index}".encode() for index in range(len(boxes))]
+
+    class Model:
+        def generate_content(self, contents, generation_config=None):
+            assert "帯" in contents[0]
+            return SimpleNamespace(text=strips_text[contents[1]["data"]])
+
+    monkeypatch.setattr(gemini_ocr.render_pool, "image_strips", fake_strips)
+    service = GeminiOCRService()
+    service.router.get_model = lambda name: Model()
+
+    transactions = await service.process_passbook(base64.b64encode(output.getvalue()).decode(), tile=True)
+
+    assert len(requested_boxes) == 3
+    assert transactions == ROWS
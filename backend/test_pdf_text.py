@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""テキストレイヤー高速パスのテスト"""
+
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from services.pdf_text import extract_text_layer, has_usable_text_layer
+from services.gemini_ocr import GeminiOCRService
+
+STATEMENT = "\n".join([
+    "Balance Certificate",
+    "Bank: Example Bank  Branch: Head Office",
+    "Account: 1234567  Balance: 1,234,567 JPY",
+])
+
+
+def test_extracts_text_per_page(make_pdf):
+    pages = extract_text_layer(make_pdf([STATEMENT, STATEMENT]))
+
+    assert len(pages) == 2
+    assert "1,234,567" in pages[0]
+    assert has_usable_text_layer(pages)
+
+
+def test_scanned_page_is_not_usable(make_pdf):
+    pages = extract_text_layer(make_pdf([STATEMENT, None]))
+
+    assert not has_usable_text_layer(pages)
+
+
+def test_garbled_text_is_not_usable():
+    garbled = "\x00\x01" * 20
+
+    assert not has_usable_text_layer([garbled])
+
+
+def test_broken_pdf_returns_no_pages():
+    assert extract_text_layer(b"not a pdf") == []
+
+
+@pytest.mark.asyncio
+async def test_text_layer_pdf_skips_upload(make_pdf, monkeypatch):
+    sent = []
+
+    class Model:
+        def generate_content(self, contents, generation_config=None):
+            sent.append(contents)
+            return SimpleNamespace(text=json.dumps({"document_type": "残高証明書", "key_information": {}}))
+
+    def fail_upload(*args, **kwargs):
+        raise AssertionError("vision upload should be skipped")
+
+    service = GeminiOCRService()
+    service.router.get_model = lambda name: Model()
+    monkeypatch.setattr("services.gemini_ocr.genai.upload_file", fail_upload, raising=False)
+
+    result = await service.extract_text_from_pdf(make_pdf([STATEMENT]))
+
+    assert result["success"] is True
+    assert result["source"] == "text_layer"
+    assert result["document_type"] == "残高証明書"
+    assert "1,234,567" in result["extracted_text"]
+    assert len(sent) == 1 and len(sent[0]) == 1  # text-only prompt
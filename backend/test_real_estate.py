@@ -0,0 +1,123 @@
+"""登記簿と名寄帳等の土地・建物データの突き合わせのテスト"""
+
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from api.documents import _build_csv_rows
+from models.document import DocumentCategory, ProcessedDocument
+from services.real_estate import (
+    REGISTRY, TAX_LEDGER, kanji_to_int, merge_real_estate, normalize_city,
+    normalize_district, normalize_number, parcel_key
+)
+
+BASE_TIME = datetime(2024, 4, 1)
+
+
+def land(doc_id, minutes=0, **data):
+    return ProcessedDocument(
+        id=doc_id,
+        original_filename=f"{doc_id}.pdf",
+        category=DocumentCategory.LAND_BUILDING,
+        extracted_data=data,
+        processed_at=BASE_TIME + timedelta(minutes=minutes)
+    )
+
+
+@pytest.mark.parametrize("text, expected", [("十", 10), ("百二十三", 123), ("一〇二", 102), ("千五", 1005), ("三", 3)])
+def test_kanji_to_int(text, expected):
+    assert kanji_to_int(text) == expected
+
+
+def test_location_variants_share_a_key():
+    assert normalize_number("１２３番４") == normalize_number("123-4") == normalize_number("百二十三番の四") == "123-4"
+    assert normalize_city("奈良県北葛城郡王寺町") == normalize_city("王寺町")
+    assert normalize_city("大和郡山市") == "大和郡山市"
+    assert normalize_district("大字九段北一丁目") == normalize_district("九段北１丁目") == "九段北1丁目"
+    assert normalize_district("横浜市中区山下町1-1", "横浜市中区", "1-1") == "山下町"
+    assert normalize_district("本町3") == normalize_district("本町3", number="5") == "本町3"
+    assert parcel_key({"city": "千代田区", "address": "九段北一丁目"}) is None
+    assert parcel_key({"city": "千代田区", "address": "九段北1丁目", "lot_number": "2番", "house_number": "2番の1"})[0] == "家屋"
+
+
+def test_registry_and_tax_ledger_merge_into_one_parcel():
+    docs = [
+        land("registry", document_type="登記簿謄本", city="千代田区", address="九段北一丁目", lot_number="十二番三",
+             registered_land_category="宅地", area=100.5, ownership_ratio="2分の1", owner_names=["山田 太郎"]),
+        land("notice", 5, document_type="固定資産税通知書", city="東京都千代田区", address="九段北１丁目", lot_number="12-3",
+             taxed_land_category="宅地", area="99.0", fixed_asset_tax_value=30_000_000, owner_names=["山田太郎", "山田 花子"]),
+        land("other", 1, city="千代田区", address="九段北1丁目", lot_number="12-4", registered_land_category="宅地"),
+    ]
+
+    parcels = merge_real_estate(docs)
+
+    assert len(parcels) == 2
+    merged = next(parcel for parcel in parcels if len(parcel.documents) == 2)
+    assert merged.source_types == [REGISTRY, TAX_LEDGER]
+    assert merged.data["area"] == 100.5 and merged.sources["area"] == "registry"
+    assert merged.data["fixed_asset_tax_value"] == 30_000_000 and merged.sources["fixed_asset_tax_value"] == "notice"
+    assert merged.data["owner_names"] == ["山田 太郎", "山田 花子"]
+    assert merged.conflicts == {"area": [100.5, "99.0"]}
+    assert merged.to_dict()["照合"] == "登記簿+名寄帳等"
+
+
+def test_tax_ledger_without_city_joins_a_unique_location():
+    docs = [
+        land("registry", city="横浜市中区", address="山下町", lot_number="1番1", registered_land_category="宅地"),
+        land("nayose", document_type="名寄帳", address="山下町1-1", lot_number="1-1", fixed_asset_tax_value=5_000_000),
+        land("ambiguous", document_type="名寄帳", address="本町", lot_number="2", fixed_asset_tax_value=1),
+        land("honcho-a", city="横浜市中区", address="本町", lot_number="2"),
+        land("honcho-b", city="横浜市西区", address="本町", lot_number="2"),
+    ]
+
+    parcels = {tuple(doc.id for doc, _ in parcel.documents): parcel for parcel in merge_real_estate(docs)}
+
+    assert ("registry", "nayose") in parcels
+    assert ("ambiguous",) in parcels  # two candidate cities: left on its own
+
+
+def test_lot_written_into_the_location_is_matched_against_the_lot_number():
+    docs = [
+        land("registry", city="横浜市中区", address="本町", lot_number="3番5", registered_land_category="宅地"),
+        land("nayose", 5, document_type="名寄帳", city="横浜市中区", address="本町3-5", lot_number="3-5",
+             fixed_asset_tax_value=8_000_000),
+        land("honcho", city="横浜市中区", address="本町", lot_number="5"),
+        land("honcho-3", 5, document_type="名寄帳", city="横浜市中区", address="本町3", lot_number="5",
+             fixed_asset_tax_value=1),
+    ]
+
+    parcels = sorted(tuple(doc.id for doc, _ in parcel.documents) for parcel in merge_real_estate(docs))
+
+    # A trailing number that is not the document's own lot belongs to the district
+    assert parcels == [("honcho",), ("honcho-3",), ("registry", "nayose")]
+
+
+def test_csv_export_has_one_row_per_parcel():
+    docs = [
+        land("registry", document_type="登記簿", city="千代田区", address="九段北1丁目", lot_number="12番3", area=100),
+        land("notice", 1, document_type="名寄帳", city="千代田区", address="九段北一丁目", lot_number="12-3", area=120,
+             fixed_asset_tax_value=1000),
+    ]
+
+    rows = _build_csv_rows(docs)
+
+    assert len(rows) == 1
+    assert rows[0]["固定資産税評価額"] == 1000
+    assert rows[0]["不一致項目"] == "地積"
+    assert rows[0]["元ファイル"] == "registry.pdf / notice.pdf"
+
+
+def test_merge_scales_linearly():
+    docs = []
+    for number in range(3000):
+        docs.append(land(f"r{number}", city="千代田区", address="九段北一丁目", lot_number=f"{number}番1", area=10))
+        docs.append(land(f"t{number}", 1, document_type="名寄帳", city="千代田区", address="九段北1丁目",
+                         lot_number=f"{number}-1", fixed_asset_tax_value=number))
+
+    started = time.perf_counter()
+    parcels = merge_real_estate(docs)
+
+    assert len(parcels) == 3000
+    assert all(len(parcel.documents) == 2 for parcel in parcels)
+    assert time.perf_counter() - started < 5
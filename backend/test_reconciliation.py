@@ -0,0 +1,166 @@
+"""残高証明書と通帳の残高の突き合わせのテスト"""
+
+import time
+from datetime import date
+
+import pytest
+
+from api import documents, ledger as ledger_api
+from models.case import Case
+from models.document import DocumentCategory, ProcessedDocument
+from services.ledger import AccountLedger, ledger_store
+from services.reconciliation import (
+    AMBIGUOUS, MATCHED, MISMATCHED, NO_BALANCE, NO_CERTIFICATE_BALANCE, NO_DATE, NO_PASSBOOK,
+    ledger_identity, normalize_account_number, normalize_branch, normalize_institution, reconcile
+)
+from services.document_store import DocumentStore
+
+
+def row(day, balance, withdrawal=0, deposit=0):
+    return {"取引日": day, "出金額": withdrawal, "入金額": deposit, "残高": balance, "取引内容": "カード"}
+
+
+def certificate(doc_id, balance, certificate_date="2024-03-15", case_id="case-1", **account):
+    data = {"financial_institution": "株式会社みずほ銀行", "branch": "新宿支店", "account_number": "0123456"}
+    data.update(account)
+    return ProcessedDocument(
+        id=doc_id, original_filename=f"{doc_id}.pdf", category=DocumentCategory.DEPOSIT, case_id=case_id,
+        extracted_data=dict(data, account_type="普通預金", balance=balance, certificate_date=certificate_date)
+    )
+
+
+def ledger(account, rows):
+    result = AccountLedger(account)
+    result.add(f"book-{account}", rows)
+    return result
+
+
+@pytest.fixture(autouse=True)
+def clean_store(monkeypatch):
+    monkeypatch.setattr(documents, "documents_storage", DocumentStore())
+    monkeypatch.setattr(ledger_api, "documents_storage", documents.documents_storage)
+    ledger_store.clear()
+    yield
+    ledger_store.clear()
+
+
+def test_normalization():
+    assert normalize_institution("株式会社　みずほ銀行") == normalize_institution("みずほ銀行")
+    assert normalize_branch("新宿支店") == normalize_branch("新宿") == "新宿"
+    assert normalize_account_number("０１２３４５６") == normalize_account_number("123-456") == "123456"
+    assert ledger_identity("みずほ銀行/新宿支店/0123456")[0] == ("みずほ銀行", "新宿", "123456")
+    assert ledger_identity("みずほ銀行_新宿_通帳1_0123456")[0] == ("", "", "123456")
+
+
+def test_balance_as_of_the_certificate_date():
+    book = ledger("みずほ銀行/新宿/123456", [
+        row("2024-03-01", 500_000),
+        row("2024-03-15", 480_000, withdrawal=20_000),
+        row("2024-03-15", None, withdrawal=1_000),  # no balance printed on this line
+        row("2024-03-20", 100_000, withdrawal=380_000),  # after the certificate date
+    ])
+
+    result = reconcile([certificate("cert", 480_000)], [book])
+
+    assert result["summary"] == {MATCHED: 1}
+    match = result["results"][0]
+    assert match["passbook_balance"] == 480_000
+    assert match["passbook_date"] == date(2024, 3, 15)
+    assert match["source"] == {"書類ID": "book-みずほ銀行/新宿/123456", "行": 2}
+
+
+def test_statuses():
+    books = [
+        ledger("みずほ銀行/新宿/123456", [row("2024-03-01", 500_000)]),
+        ledger("みずほ銀行_新宿_7777777", [row("2024-04-01", 1_000)]),  # account taken from the file name
+        ledger("三井住友銀行/新宿/5555", [row("2024-01-01", 1)]),
+        ledger("りそな銀行/新宿/5555", [row("2024-01-01", 1)]),
+    ]
+    documents = [
+        certificate("mismatch", 400_000),
+        certificate("missing", 1, account_number="999999"),
+        certificate("too-early", 1, account_number="7777777"),
+        certificate("ambiguous", 1, financial_institution="", branch="", account_number="5555"),
+        certificate("undated", 500_000, certificate_date=None),
+        certificate("unread", None),
+    ]
+
+    results = {item["document_id"]: item for item in reconcile(documents, books)["results"]}
+
+    assert results["mismatch"]["status"] == MISMATCHED
+    assert results["mismatch"]["difference"] == -100_000
+    assert results["missing"]["status"] == NO_PASSBOOK
+    assert results["too-early"]["status"] == NO_BALANCE
+    assert results["ambiguous"]["status"] == AMBIGUOUS
+    assert results["undated"]["status"] == NO_DATE
+    assert results["unread"]["status"] == NO_CERTIFICATE_BALANCE
+    assert results["unread"]["difference"] is None
+    # The date of death is used when the certificate has no date
+    dated = reconcile([certificate("undated", 500_000, certificate_date=None)], books, date(2024, 3, 31))
+    assert dated["results"][0]["status"] == MATCHED
+
+
+def test_batch_certificate_reads_key_information():
+    book = ledger("みずほ銀行/新宿/123456", [row("2024-03-01", 480_000)])
+    batch = ProcessedDocument(
+        id="batch", original_filename="batch.pdf", category=DocumentCategory.DEPOSIT, case_id="case-1",
+        extracted_data={
+            "document_type": "残高証明書",
+            "extracted_text": "残高証明書 ...",
+            "key_information": {"金融機関名": "みずほ銀行", "支店名": "新宿支店", "口座番号": "0123456",
+                                "残高": "480,000円", "証明日": "2024年3月15日"},
+        }
+    )
+
+    result = reconcile([batch], [book])["results"][0]
+
+    assert result["status"] == MATCHED
+    assert result["financial_institution"] == "みずほ銀行" and result["as_of"] == date(2024, 3, 15)
+    assert result["certificate_balance"] == 480_000
+
+
+@pytest.mark.asyncio
+async def test_reconciliation_endpoint():
+    documents.save_document(ProcessedDocument(
+        id="book", original_filename="みずほ銀行_新宿_0123456.pdf", category=DocumentCategory.PASSBOOK, case_id="case-1",
+        extracted_data={"transactions": [row("2024-03-10", 480_000)]}
+    ))
+    documents.save_document(certificate("cert", 480_000))
+    documents.save_document(certificate("other-case", 480_000, case_id="case-2"))
+
+    result = await ledger_api.reconcile_balances(case_id="case-1", date_of_death=None)
+
+    assert result["summary"] == {MATCHED: 1}
+    assert result["results"][0]["account"] == "みずほ銀行_新宿_0123456"  # taken from the file name
+
+
+@pytest.mark.asyncio
+async def test_reconciliation_endpoint_uses_the_case_date_of_death():
+    documents.documents_storage.create_case(Case(id="case-1", name="山田太郎", date_of_death=date(2024, 3, 31)))
+    documents.save_document(ProcessedDocument(
+        id="book", original_filename="book.pdf", category=DocumentCategory.PASSBOOK, case_id="case-1",
+        extracted_data={"account": "みずほ銀行/新宿/0123456", "transactions": [row("2024-03-10", 480_000)]}
+    ))
+    documents.save_document(certificate("cert", 480_000, certificate_date=None))
+
+    result = await ledger_api.reconcile_balances(case_id="case-1", date_of_death=None)
+    assert result["summary"] == {MATCHED: 1}
+    assert result["results"][0]["as_of"] == date(2024, 3, 31)
+
+    # An explicit date still wins
+    result = await ledger_api.reconcile_balances(case_id="case-1", date_of_death=date(2024, 3, 1))
+    assert result["summary"] == {NO_BALANCE: 1}
+
+
+def test_many_accounts():
+    books = [ledger(f"銀行{i % 20}/支店{i % 7}/{1000000 + i}", [row("2024-03-01", i)]) for i in range(2000)]
+    certificates = [
+        certificate(f"c{i}", i, financial_institution=f"銀行{i % 20}", branch=f"支店{i % 7}", account_number=str(1000000 + i))
+        for i in range(2000)
+    ]
+
+    started = time.perf_counter()
+    result = reconcile(certificates, books)
+
+    assert result["summary"] == {MATCHED: 2000}
+    assert time.perf_counter() - started < 2
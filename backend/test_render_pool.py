@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""描画プロセスプールのテスト"""
+
+import io
+
+import pytest
+from PIL import Image
+
+from core.metrics import metrics
+from services.render_pool import RenderPool, available_cpus
+from services.thumbnails import thumbnail_cache, thumbnail_key
+
+
+@pytest.fixture(scope="module")
+def pool():
+    pool = RenderPool(workers=1)
+    yield pool
+    pool.shutdown()
+
+
+@pytest.fixture(autouse=True)
+def reset_metrics():
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+def make_png(width: int, height: int, seed: int = 0) -> bytes:
+    image = Image.new("RGB", (width, height), "white")
+    for x in range(0, width, 7):
+        image.putpixel((x, (x * (seed + 3)) % height), (0, 0, 0))
+    output = io.BytesIO()
+    image.save(output, format="PNG")
+    return output.getvalue()
+
+
+def test_available_cpus_is_positive():
+    assert available_cpus() >= 1
+
+
+@pytest.mark.asyncio
+async def test_png_is_rendered_to_jpeg_in_worker(pool):
+    pages = await pool.page_jpegs(make_png(300, 400), "scan.png")
+
+    assert len(pages) == 1
+    assert Image.open(io.BytesIO(pages[0])).format == "JPEG"
+    snapshot = metrics.snapshot()
+    assert snapshot["counters"]["render.pages"] == 1
+    assert "render.queue_wait_seconds" in snapshot["summaries"]
+    assert "render.pages_per_second" in snapshot["summaries"]
+
+
+@pytest.mark.asyncio
+async def test_jpeg_is_returned_without_rendering(pool):
+    output = io.BytesIO()
+    Image.new("RGB", (10, 10)).save(output, format="JPEG")
+
+    assert await pool.page_jpegs(output.getvalue(), "scan.jpg") == [output.getvalue()]
+    assert "render.pages" not in metrics.snapshot()["counters"]
+
+
+@pytest.mark.asyncio
+async def test_large_image_is_downscaled_to_jpeg_thumbnail(pool):
+    images = await pool.classification_images(make_png(3000, 4200, seed=5), "scan.png")
+
+    assert len(images) == 1
+    data, mime_type = images[0]
+    assert mime_type == "image/jpeg"
+    assert max(Image.open(io.BytesIO(data)).size) <= 1024
+
+
+@pytest.mark.asyncio
+async def test_thumbnails_are_cached_by_content(pool, monkeypatch):
+    content = make_png(800, 600, seed=6)
+    first = await pool.classification_images(content, "a.png")
+
+    async def fail(*args, **kwargs):
+        raise AssertionError("should be served from cache")
+
+    monkeypatch.setattr(pool, "_render", fail)
+    assert await pool.classification_images(content, "renamed.png") is first
+
+
+@pytest.mark.asyncio
+async def test_thumbnail_falls_back_to_original_content(pool):
+    assert await pool.classification_images(b"not an image", "scan.png") == [(b"not an image", "image/png")]
+    assert thumbnail_cache.get(thumbnail_key(b"not an image")) is None
+
+
+@pytest.mark.asyncio
+async def test_image_strips_are_cropped_in_worker(pool):
+    strips = await pool.image_strips(make_png(100, 300), [(0, 0, 100, 140), (0, 119, 100, 259), (0, 238, 100, 300)], "scan.png")
+
+    assert [Image.open(io.BytesIO(strip)).size for strip in strips] == [(100, 140), (100, 140), (100, 62)]
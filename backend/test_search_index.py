@@ -0,0 +1,107 @@
+"""全文検索の索引のテスト"""
+
+import time
+
+import pytest
+
+from api import documents, search
+from models.document import DocumentCategory, ProcessedDocument
+from services.search_index import SearchIndex, bigrams
+from services.document_store import DocumentStore
+
+
+def passbook(doc_id, descriptions, case_id="case-1"):
+    return ProcessedDocument(
+        id=doc_id,
+        original_filename=f"{doc_id}.pdf",
+        category=DocumentCategory.PASSBOOK,
+        case_id=case_id,
+        extracted_data={
+            "account_number": "1234-567",
+            "transactions": [
+                {"取引日": "2024-01-05", "出金額": 1000, "入金額": 0, "残高": 9000, "取引内容": text}
+                for text in descriptions
+            ],
+        },
+    )
+
+
+def test_bigrams():
+    assert bigrams("相続税") == "相続 続税 税"
+    assert bigrams("a") == "a"
+
+
+def test_finds_japanese_terms_across_fields_and_rows():
+    index = SearchIndex()
+    index.add_document(ProcessedDocument(
+        id="doc", original_filename="遺産分割協議書.pdf", category=DocumentCategory.PROCEDURE_DOC, case_id="case-1",
+        extracted_data={"extracted_text": "被相続人　山田 太郎の相続について、以下のとおり協議した。", "key_information": {"相続人": "山田花子"}},
+    ))
+    index.add_document(passbook("book", ["振込 ヤマダハナコ", "カード", "ＡＴＭ出金"]))
+
+    assert [hit["field"] for hit in index.search("相続")] == ["extracted_text"]
+    assert [hit["field"] for hit in index.search("花子")] == ["key_information.相続人"]
+    text_hit = next(hit for hit in index.search("山田太郎"))  # the space in the document is ignored
+    assert "【山田 太郎】" in text_hit["snippet"]
+
+    rows = index.search("atm")
+    assert [(hit["document_id"], hit["field"], hit["row"]) for hit in rows] == [("book", "取引内容", 3)]
+    assert index.search("1234567")[0]["snippet"] == "【1234-567】"
+    assert index.search("協議 花子") == []  # terms in different fields
+
+
+def test_single_character_and_case_filter():
+    index = SearchIndex()
+    index.add_document(passbook("a", ["家賃"], case_id="case-1"))
+    index.add_document(passbook("b", ["家賃"], case_id="case-2"))
+
+    assert {hit["document_id"] for hit in index.search("賃")} == {"a", "b"}  # last character of the text
+    assert [hit["document_id"] for hit in index.search("家賃", case_id="case-2")] == ["b"]
+    assert index.search("   ") == []
+
+
+def test_updates_replace_the_documents_entries():
+    index = SearchIndex()
+    index.add_document(passbook("a", ["電気料金"]))
+    index.add_document(passbook("a", ["ガス料金"]))
+    assert index.search("電気") == []
+    assert len(index.search("ガス")) == 1
+
+    index.remove_document("a")
+    assert index.search("料金") == []
+
+
+@pytest.mark.asyncio
+async def test_store_edit_and_delete_keep_the_index_current(monkeypatch):
+    monkeypatch.setattr(documents, "documents_storage", DocumentStore())
+    monkeypatch.setattr(search, "documents_storage", documents.documents_storage)
+    monkeypatch.setattr(documents, "search_index", SearchIndex())
+    monkeypatch.setattr(search, "search_index", documents.search_index)
+
+    doc = ProcessedDocument(
+        id="dep", original_filename="残高証明書.pdf", category=DocumentCategory.DEPOSIT,
+        extracted_data={"financial_institution": "みずほ銀行", "branch": "新宿支店"}
+    )
+    await documents.store_document(doc)
+    result = await search.search(q="みずほ", case_id=None, limit=10)
+    assert result["hits"][0]["filename"] == "残高証明書.pdf"
+
+    await documents.update_document("dep", {"financial_institution": "三井住友銀行"})
+    assert (await search.search(q="みずほ", case_id=None, limit=10))["count"] == 0
+    assert (await search.search(q="三井住友", case_id=None, limit=10))["count"] == 1
+
+    await documents.delete_document("dep")
+    assert (await search.search(q="三井住友", case_id=None, limit=10))["count"] == 0
+
+
+def test_search_is_fast_on_a_large_case():
+    index = SearchIndex()
+    for number in range(50):
+        index.add_document(passbook(f"book{number}", [f"振込 取引先{i} 様" for i in range(400)] + ["相続税 納付"]))
+
+    started = time.perf_counter()
+    hits = index.search("相続税", limit=20)
+    elapsed = time.perf_counter() - started
+
+    assert len(hits) == 20
+    assert elapsed < 0.5
@@ -0,0 +1,20 @@
+#!/usr/bin/env python3
+"""アップロード内容のMIMEタイプ判定のテスト"""
+
+import io
+
+from PIL import Image
+
+from services.thumbnails import detect_mime_type
+
+
+def make_png(width: int, height: int) -> bytes:
+    output = io.BytesIO()
+    Image.new("RGB", (width, height), "white").save(output, format="PNG")
+    return output.getvalue()
+
+
+def test_detect_mime_type_from_magic_bytes(make_pdf):
+    assert detect_mime_type(make_pdf(["x"]), "scan.jpg") == "application/pdf"
+    assert detect_mime_type(make_png(1, 1), "photo.jpg") == "image/png"
+    assert detect_mime_type(b"", "photo.HEIC") == "image/heic"
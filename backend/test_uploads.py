@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""アップロードのサイズ上限とメモリ上限のテスト"""
+
+import asyncio
+import io
+
+import pytest
+from fastapi import HTTPException
+from starlette.datastructures import UploadFile
+
+from api import ocr
+from core import uploads
+from core.uploads import MultipartPartCounter, UploadBudget, UploadSizeLimitMiddleware, check_upload_size, read_upload
+
+
+async def call_middleware(headers, chunks, max_size=10, max_part_size=None):
+    """ミドルウェアを通してリクエストを送り、(アプリが受信した本文, 送信されたメッセージ) を返す"""
+    received = []
+    sent = []
+
+    async def app(scope, receive, send):
+        while True:
+            message = await receive()
+            received.append(message.get("body", b""))
+            if not message.get("more_body"):
+                break
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+
+    messages = [{"type": "http.request", "body": chunk, "more_body": i < len(chunks) - 1} for i, chunk in enumerate(chunks)]
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "POST", "path": "/", "headers": [(k.encode(), v.encode()) for k, v in headers]}
+    await UploadSizeLimitMiddleware(app, max_size, max_part_size)(scope, receive, send)
+    return received, sent
+
+
+@pytest.mark.asyncio
+async def test_content_length_over_limit_is_rejected_without_reading_body():
+    received, sent = await call_middleware([("content-length", "11")], [b"x" * 11])
+
+    assert received == []
+    assert sent[0]["status"] == 413
+
+
+@pytest.mark.asyncio
+async def test_body_without_length_is_cut_off_at_limit():
+    with pytest.raises(HTTPException) as error:
+        await call_middleware([], [b"x" * 6, b"x" * 6, b"x" * 6])
+
+    assert error.value.status_code == 413
+
+
+@pytest.mark.asyncio
+async def test_body_within_limit_passes_through():
+    received, sent = await call_middleware([("content-length", "10")], [b"x" * 4, b"x" * 6])
+
+    assert b"".join(received) == b"x" * 10
+    assert sent[0]["status"] == 200
+
+
+def multipart_chunks(files, chunk_size):
+    """multipart本文をchunk_sizeごとに分けたもの（区切りがチャンクの境目にまたがる）"""
+    body = b"".join(
+        b"--xyz\r\nContent-Disposition: form-data; name=\"files\"; filename=\"%d.pdf\"\r\n\r\n" % number + data + b"\r\n"
+        for number, data in enumerate(files)
+    ) + b"--xyz--\r\n"
+    return [body[start:start + chunk_size] for start in range(0, len(body), chunk_size)]
+
+
+def test_part_counter_follows_boundaries_across_chunks():
+    counter = MultipartPartCounter(b"xyz")
+    sizes = [counter.feed(chunk) for chunk in multipart_chunks([b"a" * 20, b"b" * 30], chunk_size=3)]
+
+    # Each part restarts the count: CRLF + headers (66 bytes here) + data + CRLF,
+    # plus the start of a delimiter still being received
+    assert 2 + 66 + 30 + 2 <= max(sizes) < 2 + 66 + 30 + 2 + len(b"--xyz")
+    assert sizes[-1] == 4  # after the closing delimiter: "--\r\n"
+
+
+@pytest.mark.asyncio
+async def test_multipart_file_over_limit_is_cut_off_while_receiving():
+    headers = [("content-type", "multipart/form-data; boundary=xyz")]
+
+    received, sent = await call_middleware(
+        headers, multipart_chunks([b"a" * 50_000] * 6, 4096), max_size=10**6, max_part_size=10_000
+    )
+    assert len(b"".join(received)) > 300_000  # many files, each within the limit
+    assert sent[0]["status"] == 200
+
+    with pytest.raises(HTTPException) as error:
+        await call_middleware(
+            headers, multipart_chunks([b"a" * 1000, b"b" * 200_000, b"c" * 1000], 7), max_size=10**6, max_part_size=10_000
+        )
+    assert error.value.status_code == 413
+
+
+@pytest.mark.asyncio
+async def test_file_over_limit_is_rejected_before_reading(monkeypatch):
+    monkeypatch.setattr(uploads.settings, "MAX_UPLOAD_SIZE", 4)
+    small = UploadFile(io.BytesIO(b"abcd"), filename="a.pdf")
+    large = UploadFile(io.BytesIO(b"abcde"), filename="b.pdf")
+
+    assert check_upload_size(small) == 4
+    with pytest.raises(HTTPException) as error:
+        await ocr.process_batch(files=[small, large], auto_classify=True, case_id=None)
+    assert error.value.status_code == 413
+    assert "b.pdf" in error.value.detail
+
+
+@pytest.mark.asyncio
+async def test_read_upload_can_be_repeated():
+    file = UploadFile(io.BytesIO(b"abcd"), filename="a.pdf")
+
+    assert await read_upload(file) == b"abcd"
+    assert await read_upload(file) == b"abcd"
+
+
+@pytest.mark.asyncio
+async def test_budget_holds_back_requests_until_bytes_are_released():
+    budget = UploadBudget(100)
+    order = []
+
+    async def upload(name, size, hold):
+        async with budget.reserve(size):
+            order.append(f"{name} start")
+            assert budget.in_flight <= 100
+            await asyncio.sleep(hold)
+            order.append(f"{name} end")
+
+    await asyncio.gather(upload("a", 60, 0.02), upload("b", 60, 0), upload("c", 30, 0))
+
+    # b must wait for a; c would fit beside a but does not overtake b
+    assert order[:4] == ["a start", "a end", "b start", "c start"]
+    assert budget.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_budget_lets_an_oversized_upload_run_alone():
+    budget = UploadBudget(100)
+
+    async with budget.reserve(500):
+        assert budget.in_flight == 100
+    assert budget.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_does_not_block_the_queue():
+    budget = UploadBudget(100)
+
+    async with budget.reserve(100):
+        waiter = asyncio.create_task(budget.reserve(50).__aenter__())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+    async with budget.reserve(100):
+        assert budget.in_flight == 100
@@ -4,6 +4,8 @@ const API_BASE_URL = typeof config !== 'undefined' ? config.API_BASE_URL : 'http
 
 let selectedFiles = [];
 let processedDocuments = [];
+// Same key for every send of the current selection, so double clicks and retries are processed once
+let batchIdempotencyKey = null;
 
 // DOM Elements
 const dropZone = document.getElementById('dropZone');
@@ -46,6 +48,7 @@ fileInput.addEventListener('change', (e) => {
 
 function handleFiles(files) {
     selectedFiles = Array.from(files);
+    batchIdempotencyKey = null;
     displayFileList();
     processButton.disabled = selectedFiles.length === 0;
 }
@@ -69,6 +72,7 @@ function displayFileList() {
 
 function removeFile(index) {
     selectedFiles.splice(index, 1);
+    batchIdempotencyKey = null;
     displayFileList();
     processButton.disabled = selectedFiles.length === 0;
 }
@@ -87,8 +91,10 @@ processButton.addEventListener('click', async () => {
         });
         formData.append('auto_classify', 'true');
 
+        batchIdempotencyKey = batchIdempotencyKey || crypto.randomUUID();
         const response = await fetch(`${API_BASE_URL}/ocr/process-batch`, {
             method: 'POST',
+            headers: { 'Idempotency-Key': batchIdempotencyKey },
             body: formData
         });
 